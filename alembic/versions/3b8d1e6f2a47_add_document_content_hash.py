@@ -0,0 +1,28 @@
+"""Add document content hash
+
+Revision ID: 3b8d1e6f2a47
+Revises: fc674a7b7326
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8d1e6f2a47'
+down_revision: Union[str, None] = 'fc674a7b7326'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('document', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index('ix_document_knowledge_base_id_content_hash', 'document', ['knowledge_base_id', 'content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_document_knowledge_base_id_content_hash', table_name='document')
+    op.drop_column('document', 'content_hash')
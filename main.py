@@ -39,6 +39,7 @@ ingest_router.include_router(private_gpt.ingest.routers.ingestfile.ingest_file_r
 ingest_router.include_router(private_gpt.ingest.routers.listingesteddocs.list_docs_router)
 ingest_router.include_router(private_gpt.ingest.routers.deleteingesteddocs.delete_docs_router)
 ingest_router.include_router(private_gpt.ingest.routers.embedded.mark_embedded_router)
+ingest_router.include_router(private_gpt.ingest.routers.ingestjobs.ingest_jobs_router)
 root_router.include_router(ingest_router)
 root_router.include_router(private_gpt.knowledgebase.knowledge_base_router, tags=["knowledgebase"])
 root_router.include_router(private_gpt.set_openai_url.openai_base_url_router, tags=["set-openai-url"])
@@ -49,6 +50,7 @@ blocks_router.include_router(private_gpt.blocks.document_summary.doc_summary_rou
 blocks_router.include_router(private_gpt.blocks.sentiment_analysis.sentiment_analysis_router)
 blocks_router.include_router(private_gpt.blocks.document_personalization.personalize_document_router)
 blocks_router.include_router(private_gpt.blocks.entity_extraction.entity_extraction_router)
+blocks_router.include_router(private_gpt.blocks.llm_client.llm_stats_router)
 root_router.include_router(blocks_router)
 
 app.include_router(root_router)
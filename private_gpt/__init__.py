@@ -12,10 +12,12 @@ from .chat.chat_completion_router import chat_completion_router
 from .chunks.chunks_router import context_chunk_retrieval_router
 from .ingest.routers.deleteingesteddocs import delete_docs_router
 from .ingest.routers.embedded import mark_embedded_router
+from .ingest.routers.ingestjobs import ingest_jobs_router
 from .blocks.document_summary import doc_summary_router
 from .blocks.sentiment_analysis import sentiment_analysis_router
 from .blocks.document_personalization import personalize_document_router
 from .blocks.entity_extraction import entity_extraction_router
+from .blocks.llm_client import llm_stats_router
 
 __all__ = [
     "ingest_file_router",
@@ -26,7 +28,9 @@ __all__ = [
     "context_chunk_retrieval_router",
     "delete_docs_router",
     "mark_embedded_router",
+    "ingest_jobs_router",
     "doc_summary_router",
     "sentiment_analysis_router",
     "personalize_document_router",
-    "entity_extraction_router"]
\ No newline at end of file
+    "entity_extraction_router",
+    "llm_stats_router"]
\ No newline at end of file
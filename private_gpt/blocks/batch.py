@@ -0,0 +1,58 @@
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Awaitable, Callable, List
+import asyncio
+import orjson
+import os
+
+# Constants
+BLOCKS_BATCH_CONCURRENCY = "BLOCKS_BATCH_CONCURRENCY"
+
+
+async def run_batch(items: List[Any], handler: Callable[[Any], Awaitable[Any]], concurrency: int) -> AsyncIterator[dict]:
+    """
+    Run handler over the items with at most concurrency calls in flight.
+
+    Yields:
+        dict: {"index", "result", "error"} for each item, in completion order. A failing item
+        yields its error message and does not stop the batch.
+    """
+    queue = asyncio.Queue()
+    pending = iter(enumerate(items))
+
+    async def worker():
+        # Workers share the iterator, each takes the next item once it is done with the last
+        for index, item in pending:
+            try:
+                line = {"index": index, "result": await handler(item), "error": None}
+            except Exception as e:
+                line = {"index": index, "result": None, "error": str(e)}
+            await queue.put(line)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(items)))]
+    try:
+        for _ in range(len(items)):
+            yield await queue.get()
+    finally:
+        # The client went away or the batch is done, stop whatever is still running
+        for task in workers:
+            task.cancel()
+
+
+def ndjson_batch_response(items: List[Any], handler: Callable[[Any], Awaitable[Any]]) -> StreamingResponse:
+    """
+    Stream the results of a blocks batch as newline delimited JSON.
+
+    Args:
+        items (List[Any]): The single-item requests of the batch.
+        handler (Callable[[Any], Awaitable[Any]]): The coroutine function handling one request.
+
+    Returns:
+        StreamingResponse: One JSON line per item, in completion order.
+    """
+    concurrency = int(os.getenv(BLOCKS_BATCH_CONCURRENCY, "8"))
+
+    async def generate():
+        async for line in run_batch(items, handler, concurrency):
+            yield orjson.dumps(line) + b"\n"
+
+    return StreamingResponse(content=generate(), media_type="application/x-ndjson")
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
-from private_gpt import openai_client
+from private_gpt.blocks.llm_client import llm_client
+from private_gpt.blocks.batch import ndjson_batch_response
 
 personalize_document_router = APIRouter()
 
@@ -34,6 +35,62 @@ class PersonalizeRequest(BaseModel):
     model: Optional[str] = "gpt-3.5-turbo"
 
 
+class PersonalizeBatchRequest(BaseModel):
+    """
+    Request model for batch document personalization.
+
+    Attributes:
+        documents (List[str]): The documents to be personalized.
+        target_audience (str): The target audience to whom the documents are personalized.
+        examples (Optional[List[Example]]): Optional examples of document personalization, shared by all documents.
+        model (Optional[str]): The model to be used for personalization. Defaults to "gpt-3.5-turbo".
+    """
+    documents: List[str]
+    target_audience: str
+    examples: Optional[List[Example]] = None
+    model: Optional[str] = "gpt-3.5-turbo"
+
+async def personalize(request: PersonalizeRequest) -> dict:
+    """
+    Personalize one document for its target audience.
+
+    Args:
+        request (PersonalizeRequest): The personalization request.
+
+    Returns:
+        dict: A dictionary containing the personalized document.
+    """
+    # Generate the examples text
+    examples_text = ""
+    if request.examples:
+        examples_text += "Here are some examples of document personalization:\n"
+        examples_text += "\n--".join([
+            f"Original Document: \"{example.document}\"\n"
+            f"Target Audience: \"{example.target_audience}\"\n"
+            f"Personalized Document: {example.personalized_document}"
+            for example in request.examples
+        ])
+    
+    # Generate the prompt
+    prompt = f"""
+        You are a document personalization tool.
+        Personalize the following document in a tone and style specific to the described target audience.
+        Target Audience: {request.target_audience}
+        {examples_text}
+        Document: \"{request.document}\"
+        """
+    
+    # Call the OpenAI API to get the personalized document
+    response = await llm_client.create(
+        model=request.model,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    personalized_document = response.choices[0].message.content.strip()
+    
+    # Return the personalized document
+    return {"personalized_document": personalized_document}
+
+
 @personalize_document_router.post("/personalize")
 async def personalize_document(request: PersonalizeRequest):
     """
@@ -50,36 +107,24 @@ async def personalize_document(request: PersonalizeRequest):
         HTTPException: If there is an error during the personalization process.
     """
     try:
-        # Generate the examples text
-        examples_text = ""
-        if request.examples:
-            examples_text += "Here are some examples of document personalization:\n"
-            examples_text += "\n--".join([
-                f"Original Document: \"{example.document}\"\n"
-                f"Target Audience: \"{example.target_audience}\"\n"
-                f"Personalized Document: {example.personalized_document}"
-                for example in request.examples
-            ])
-        
-        # Generate the prompt
-        prompt = f"""
-        You are a document personalization tool.
-        Personalize the following document in a tone and style specific to the described target audience.
-        Target Audience: {request.target_audience}
-        {examples_text}
-        Document: \"{request.document}\"
-        """
-        
-        # Call the OpenAI API to get the personalized document
-        response = openai_client.chat.completions.create(
-            model=request.model,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        personalized_document = response.choices[0].message.content.strip()
-        
-        # Return the personalized document
-        return {"personalized_document": personalized_document}
+        return await personalize(request)
     
     # If there is an error, raise an HTTPException
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@personalize_document_router.post("/personalize/batch")
+async def personalize_documents_batch(request: PersonalizeBatchRequest):
+    """
+    Personalize a list of documents with bounded concurrency.
+
+    Args:
+        request (PersonalizeBatchRequest): The documents and the personalization parameters they share.
+
+    Returns:
+        StreamingResponse: NDJSON lines {"index", "result", "error"} in completion order, where
+            index is the position of the document in the request.
+    """
+    shared = request.dict(exclude={"documents"})
+    items = [PersonalizeRequest(document=document, **shared) for document in request.documents]
+    return ndjson_batch_response(items, personalize)
@@ -1,11 +1,29 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
-from private_gpt import openai_client
+from private_gpt.blocks.llm_client import llm_client
+from private_gpt.blocks.batch import ndjson_batch_response
+from private_gpt.cache import LRUCache, SqliteCache
+from private_gpt.tokens import content_defined_groups, count_tokens, split_by_content
 from enum import Enum
+from hashlib import sha256
+import asyncio
+import os
+
+# Constants
+SUMMARY_CHUNK_TOKENS = "SUMMARY_CHUNK_TOKENS"
+SUMMARY_MAP_CONCURRENCY = "SUMMARY_MAP_CONCURRENCY"
+SUMMARY_CACHE_SIZE = "SUMMARY_CACHE_SIZE"
+SUMMARY_CACHE_TTL = "SUMMARY_CACHE_TTL"
+SUMMARY_CACHE_PATH = "SUMMARY_CACHE_PATH"
 
 doc_summary_router = APIRouter()
 
+# Partial summaries of long documents, keyed by the hash of the summarized text
+summary_cache_ttl = float(os.getenv(SUMMARY_CACHE_TTL, "0")) or None
+partial_summaries = SqliteCache(os.getenv(SUMMARY_CACHE_PATH), ttl=summary_cache_ttl, table="partial_summaries") \
+    if os.getenv(SUMMARY_CACHE_PATH) else LRUCache(maxsize=int(os.getenv(SUMMARY_CACHE_SIZE, "4096")), ttl=summary_cache_ttl)
+
 
 class LengthEnum(str, Enum):
     """
@@ -40,11 +58,153 @@ class SummaryRequest(BaseModel):
         examples (Optional[List[Example]]): Optional examples of document summarization.
         length (LengthEnum): The length of the summary. Defaults to "short".
         model (Optional[str]): The model to be used for summarization. Defaults to "gpt-3.5-turbo".
+        long_document (Optional[bool]): Whether to summarize section by section and combine the results.
+            Defaults to doing so when the document is longer than SUMMARY_CHUNK_TOKENS.
     """
     document: str
     examples: Optional[List[Example]] = None
     length: LengthEnum = LengthEnum.short  # Default to "short"
     model: Optional[str] = "gpt-3.5-turbo"
+    long_document: Optional[bool] = None
+
+class SummaryBatchRequest(BaseModel):
+    """
+    Request model for batch document summarization.
+
+    Attributes:
+        documents (List[str]): The documents to be summarized.
+        examples (Optional[List[Example]]): Optional examples of document summarization, shared by all documents.
+        length (LengthEnum): The length of the summaries. Defaults to "short".
+        model (Optional[str]): The model to be used for summarization. Defaults to "gpt-3.5-turbo".
+        long_document (Optional[bool]): Whether to summarize long documents section by section.
+    """
+    documents: List[str]
+    examples: Optional[List[Example]] = None
+    length: LengthEnum = LengthEnum.short
+    model: Optional[str] = "gpt-3.5-turbo"
+    long_document: Optional[bool] = None
+
+async def summarize_part(model: str, kind: str, prompt: str, text: str, semaphore: asyncio.Semaphore) -> str:
+    """
+    Summarize one section or group of partial summaries, reusing the cached summary of identical text.
+    """
+    key = sha256(f"{model}\x00{kind}\x00{text}".encode()).hexdigest()
+    summary = partial_summaries.get(key)
+    if summary is not None:
+        return summary
+
+    async with semaphore:
+        response = await llm_client.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    summary = response.choices[0].message.content.strip()
+    partial_summaries.set(key, summary)
+    return summary
+
+def group_summaries(summaries: List[str], max_tokens: int, model: str) -> List[List[str]]:
+    # At least two summaries per group so every round shrinks, content-defined so an edited
+    # section only changes its own group and the other combined summaries stay cached
+    return content_defined_groups(summaries, max_tokens, model, min_items=2)
+
+async def summarize_long_document(request: SummaryRequest) -> str:
+    """
+    Summarize a document longer than the model's comfortable context with map-reduce.
+
+    The document is split into token-bounded sections that are summarized concurrently. Section
+    boundaries are chosen by content, so after a small edit only the edited section and its
+    combine group miss the partial summary cache. The
+    partial summaries are then combined, in several rounds if they do not fit in one prompt,
+    and the final summary is written at the requested length.
+
+    Args:
+        request (SummaryRequest): The summarization request.
+
+    Returns:
+        str: The summary of the document.
+    """
+    max_tokens = int(os.getenv(SUMMARY_CHUNK_TOKENS, "3000"))
+    semaphore = asyncio.Semaphore(int(os.getenv(SUMMARY_MAP_CONCURRENCY, "4")))
+
+    sections = split_by_content(request.document, max_tokens, request.model)
+    summaries = await asyncio.gather(*[
+        summarize_part(request.model, "section", f"""
+        You are a document summarization tool.
+        Summarize the following section of a longer document. Keep the key facts, names, figures and conclusions.
+        Section: \"{section}\"
+        """, section, semaphore) for section in sections
+    ])
+
+    # Combine partial summaries until they fit in the final prompt
+    while len(summaries) > 1 and count_tokens("\n\n".join(summaries), request.model) > max_tokens:
+        groups = ["\n\n".join(group) for group in group_summaries(summaries, max_tokens, request.model)]
+        summaries = await asyncio.gather(*[
+            summarize_part(request.model, "combine", f"""
+        You are a document summarization tool.
+        Combine the following summaries of consecutive sections of a document into one summary. Keep the key facts, names, figures and conclusions.
+        Summaries: \"{group}\"
+        """, group, semaphore) for group in groups
+        ])
+
+    examples_text = ""
+    if request.examples:
+        examples_text += "Here are some examples of Document Summarization:"
+        examples_text += "\n".join([f"Document: \"{example.document}\"\nSummary: {example.summary}" for example in request.examples])
+
+    section_summaries = "\n\n".join(summaries)
+    prompt = f"""
+        You are a document summarization tool.
+        The following are summaries of consecutive sections of a long document.
+        Write a {request.length.value} summary of the whole document from them.
+        {examples_text}
+        Section summaries: \"{section_summaries}\"
+        """
+    response = await llm_client.create(
+        model=request.model,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    return response.choices[0].message.content.strip()
+
+async def summarize(request: SummaryRequest) -> dict:
+    """
+    Summarize one document.
+
+    Args:
+        request (SummaryRequest): The summarization request.
+
+    Returns:
+        dict: A dictionary containing the summarized document.
+    """
+    long_document = request.long_document
+    if long_document is None:
+        long_document = count_tokens(request.document, request.model) > int(os.getenv(SUMMARY_CHUNK_TOKENS, "3000"))
+    if long_document:
+        return {"summary": await summarize_long_document(request)}
+
+    # Generate the examples text
+    examples_text = ""
+    if request.examples:
+        examples_text += "Here are some examples of Document Summarization:"
+        examples_text += "\n".join([f"Document: \"{example.document}\"\nSummary: {example.summary}" for example in request.examples])
+    
+    # Generate the prompt
+    prompt = f"""
+        You are a document summarization tool.
+        Summarize the following document in a {request.length.value} summary.
+        {examples_text}
+        Document: \"{request.document}\"
+        """
+    
+    # Call the OpenAI API to get the summary
+    response = await llm_client.create(
+        model=request.model,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    summary = response.choices[0].message.content.strip()
+    
+    # Return the summary
+    return {"summary": summary}
+
 
 @doc_summary_router.post("/summarize")
 async def summarize_document(request: SummaryRequest):
@@ -61,30 +221,24 @@ async def summarize_document(request: SummaryRequest):
         HTTPException: If there is an error during the summarization process.
     """
     try:
-        # Generate the examples text
-        examples_text = ""
-        if request.examples:
-            examples_text += "Here are some examples of Document Summarization:"
-            examples_text += "\n".join([f"Document: \"{example.document}\"\nSummary: {example.summary}" for example in request.examples])
-        
-        # Generate the prompt
-        prompt = f"""
-        You are a document summarization tool.
-        Summarize the following document in a {request.length} summary.
-        {examples_text}
-        Document: \"{request.document}\"
-        """
-        
-        # Call the OpenAI API to get the summary
-        response = openai_client.chat.completions.create(
-            model=request.model,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        summary = response.choices[0].message.content.strip()
-        
-        # Return the summary
-        return {"summary": summary}
+        return await summarize(request)
     
     # If there is an error, raise an HTTPException
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@doc_summary_router.post("/summarize/batch")
+async def summarize_documents_batch(request: SummaryBatchRequest):
+    """
+    Summarize a list of documents with bounded concurrency.
+
+    Args:
+        request (SummaryBatchRequest): The documents and the summarization parameters they share.
+
+    Returns:
+        StreamingResponse: NDJSON lines {"index", "result", "error"} in completion order, where
+            index is the position of the document in the request.
+    """
+    shared = request.dict(exclude={"documents"})
+    items = [SummaryRequest(document=document, **shared) for document in request.documents]
+    return ndjson_batch_response(items, summarize)
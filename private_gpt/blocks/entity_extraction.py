@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Dict, Optional
-from private_gpt import openai_client
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from private_gpt.blocks.llm_client import llm_client
+from private_gpt.blocks.batch import ndjson_batch_response
+from private_gpt.blocks.response_cache import response_cache
 from enum import Enum
 import json
 
@@ -40,10 +42,12 @@ class EntityExtractionRequest(BaseModel):
         document (str): The document to extract entities from.
         schema (Dict[str, SchemaField]): The schema that defines the entities to extract.
         model (Optional[str]): The model to use for extraction. Defaults to "gpt-3.5-turbo".
+        no_cache (Optional[bool]): Whether to call the model even if the result is cached. Defaults to False.
     """
     document: str
     schema: Dict[str, SchemaField]
     model: Optional[str] = "gpt-3.5-turbo"
+    no_cache: Optional[bool] = False
 
 
 def transform_entities(entities):
@@ -93,65 +97,115 @@ def transform_entities(entities):
     return entities
 
 
-@entity_extraction_router.post("/extract")
-async def extract_entity(request: EntityExtractionRequest):
+class EntityExtractionBatchRequest(BaseModel):
     """
-    Extract entities from a document based on a provided schema.
+    Represents a request for entity extraction over several documents.
+
+    Attributes:
+        documents (List[str]): The documents to extract entities from.
+        entity_schema (Dict[str, SchemaField]): The schema that defines the entities to extract, shared by all documents, sent as "schema".
+        model (Optional[str]): The model to use for extraction. Defaults to "gpt-3.5-turbo".
+        no_cache (Optional[bool]): Whether to call the model even if the results are cached. Defaults to False.
+    """
+    documents: List[str]
+    # Named apart from BaseModel.schema, the request field is still "schema"
+    entity_schema: Dict[str, SchemaField] = Field(alias="schema")
+    model: Optional[str] = "gpt-3.5-turbo"
+    no_cache: Optional[bool] = False
+
+async def extract(request: EntityExtractionRequest) -> List[Dict]:
+    """
+    Extract the entities of one document.
 
     Args:
-        request (EntityExtractionRequest): The request object containing the document and schema.
+        request (EntityExtractionRequest): The entity extraction request.
 
     Returns:
         List[Dict[str, Union[str, bool, float]]]: The extracted entities with their values transformed to their respective types.
-
-    Raises:
-        HTTPException: If an error occurs during the extraction process.
     """
-    try:
-        # Generate a prompt for the chatbot to extract entities
-        schema_fields = ", ".join([f"{name}: {field.type} (required: {field.required})" for name, field in request.schema.items()])
-        prompt = f"""
+    # Generate a prompt for the chatbot to extract entities
+    schema_fields = ", ".join([f"{name}: {field.type} (required: {field.required})" for name, field in request.schema.items()])
+    prompt = f"""
         You are an entity extraction tool.
         Extract the following entities from the document based on the provided schema.
         Fields: {schema_fields}
         Document: \"{request.document}\"
         """
-        
-        # Call the chatbot with the prompt and functions
-        response = openai_client.chat.completions.create(
-            model=request.model,
-            messages=[{"role": "user", "content": prompt}],
-            functions=[
-                {
-                    "name": "extract_entities",
-                    "description": "Extracts specified entities from a document",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "entities": {
-                                "type": "array",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "type": {"type": "string"},
-                                        "entity": {"type": "string"},
-                                        "value": {"type": "string"}
-                                    },
-                                    "required": ["type", "entity", "value"]
-                                }
+    
+    # Call the chatbot with the prompt and functions, identical calls are answered from the response cache
+    params = dict(
+        model=request.model,
+        messages=[{"role": "user", "content": prompt}],
+        functions=[
+            {
+                "name": "extract_entities",
+                "description": "Extracts specified entities from a document",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "entities": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "type": {"type": "string"},
+                                    "entity": {"type": "string"},
+                                    "value": {"type": "string"}
+                                },
+                                "required": ["type", "entity", "value"]
                             }
-                        },
-                        "required": ["entities"]
-                    }
+                        }
+                    },
+                    "required": ["entities"]
                 }
-            ],
-            function_call="auto"
-        )
+            }
+        ],
+        function_call="auto"
+    )
+
+    async def call():
+        response = await llm_client.create(**params)
 
         # Extract the entities from the response and transform their values to their respective types
         entities = response.choices[0].message.function_call.arguments
         entities_list = json.loads(entities)["entities"]
         return transform_entities(entities_list)
+
+    return await response_cache.get_or_call(params, call, bypass=request.no_cache)
+
+
+@entity_extraction_router.post("/extract")
+async def extract_entity(request: EntityExtractionRequest):
+    """
+    Extract entities from a document based on a provided schema.
+
+    Args:
+        request (EntityExtractionRequest): The request object containing the document and schema.
+
+    Returns:
+        List[Dict[str, Union[str, bool, float]]]: The extracted entities with their values transformed to their respective types.
+
+    Raises:
+        HTTPException: If an error occurs during the extraction process.
+    """
+    try:
+        return await extract(request)
     except Exception as e:
         # Raise an HTTPException with the error details if an error occurs
         raise HTTPException(status_code=500, detail=str(e))
+
+@entity_extraction_router.post("/extract/batch")
+async def extract_entity_batch(request: EntityExtractionBatchRequest):
+    """
+    Extract entities from a list of documents with bounded concurrency.
+
+    Args:
+        request (EntityExtractionBatchRequest): The documents and the schema they share.
+
+    Returns:
+        StreamingResponse: NDJSON lines {"index", "result", "error"} in completion order, where
+            index is the position of the document in the request.
+    """
+    shared = request.dict(exclude={"documents"}, by_alias=True)
+    items = [EntityExtractionRequest(document=document, **shared) for document in request.documents]
+    return ndjson_batch_response(items, extract)
@@ -0,0 +1,187 @@
+from fastapi import APIRouter
+from openai import AsyncOpenAI
+from private_gpt.blocks.response_cache import response_cache
+from typing import Any, Dict, Optional
+import asyncio
+import os
+import time
+
+# Constants
+LLM_MAX_CONCURRENCY = "LLM_MAX_CONCURRENCY"
+LLM_MODEL_CONCURRENCY = "LLM_MODEL_CONCURRENCY"
+LLM_MODEL_LIMITS = "LLM_MODEL_LIMITS"
+LLM_TIMEOUT = "LLM_TIMEOUT"
+LLM_QUEUE_TIMEOUT = "LLM_QUEUE_TIMEOUT"
+
+llm_stats_router = APIRouter()
+
+
+def parse_model_limits(value: Optional[str], variable: str = LLM_MODEL_LIMITS) -> Dict[str, int]:
+    """
+    Parse per-model limits written as "gpt-4=2,gpt-3.5-turbo=16", read from the variable environment variable.
+    """
+    limits = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        model, _, limit = item.rpartition("=")
+        if not model or not limit.strip().isdigit():
+            raise ValueError(f"{variable} environment variable should look like 'model=limit,model=limit'")
+        limits[model.strip()] = int(limit)
+    return limits
+
+
+class LLMClient:
+    """
+    Shared async OpenAI client for the blocks endpoints.
+
+    Calls wait for a slot in a global semaphore and in a per-model semaphore, so a burst of
+    requests queues up instead of overloading the provider, and one slow model cannot take all
+    the slots. Waiting for a slot and the call itself are both bounded by timeouts.
+
+    Attributes:
+        max_concurrency (int): The maximum number of calls in flight over all models.
+        model_concurrency (int): The default maximum number of calls in flight per model.
+        model_limits (Dict[str, int]): Per-model overrides of model_concurrency.
+        timeout (float): The seconds a call may take once it has a slot.
+        queue_timeout (Optional[float]): The seconds a call may wait for a slot, None to wait forever.
+    """
+
+    def __init__(self, max_concurrency: int = 16, model_concurrency: int = 8, model_limits: Optional[Dict[str, int]] = None,
+                 timeout: float = 120.0, queue_timeout: Optional[float] = 30.0):
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = model_concurrency
+        self.model_limits = model_limits or {}
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._client = None
+        self._global = None
+        self._models: Dict[str, asyncio.Semaphore] = {}
+        self._metrics: Dict[str, Dict[str, float]] = {}
+        self.waiting = 0
+        self.max_waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        # Built on first use, after the environment has been loaded
+        if self._client is None:
+            self._client = AsyncOpenAI()
+        return self._client
+
+    def _semaphores(self, model: str):
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_concurrency)
+        if model not in self._models:
+            self._models[model] = asyncio.Semaphore(self.model_limits.get(model, self.model_concurrency))
+            self._metrics[model] = {"waiting": 0, "in_flight": 0, "completed": 0, "failed": 0, "latency_total": 0.0}
+        return self._global, self._models[model]
+
+    async def _acquire(self, semaphore: asyncio.Semaphore, deadline: Optional[float]) -> None:
+        if deadline is None:
+            await semaphore.acquire()
+            return
+        try:
+            await asyncio.wait_for(semaphore.acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise TimeoutError(f"No LLM slot became free within {self.queue_timeout} seconds")
+
+    async def create(self, **kwargs: Any) -> Any:
+        """
+        Create a chat completion with the given chat.completions.create arguments.
+
+        Raises:
+            TimeoutError: If no slot became free within queue_timeout or the call took longer than timeout.
+        """
+        model = kwargs.get("model") or ""
+        global_semaphore, model_semaphore = self._semaphores(model)
+        metrics = self._metrics[model]
+        deadline = time.monotonic() + self.queue_timeout if self.queue_timeout is not None else None
+
+        self.waiting += 1
+        metrics["waiting"] += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            # Take the model slot first, calls queued on a saturated model do not hold global slots
+            await self._acquire(model_semaphore, deadline)
+            try:
+                await self._acquire(global_semaphore, deadline)
+            except BaseException:
+                model_semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+            metrics["waiting"] -= 1
+
+        self.in_flight += 1
+        metrics["in_flight"] += 1
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(self.client.chat.completions.create(**kwargs), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.failed += 1
+            metrics["failed"] += 1
+            raise TimeoutError(f"The LLM call did not finish within {self.timeout} seconds")
+        except BaseException:
+            self.failed += 1
+            metrics["failed"] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            metrics["in_flight"] -= 1
+            global_semaphore.release()
+            model_semaphore.release()
+
+        self.completed += 1
+        metrics["completed"] += 1
+        metrics["latency_total"] += time.monotonic() - started
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "models": {
+                model: {
+                    "limit": self.model_limits.get(model, self.model_concurrency),
+                    "waiting": metrics["waiting"],
+                    "in_flight": metrics["in_flight"],
+                    "completed": metrics["completed"],
+                    "failed": metrics["failed"],
+                    "mean_latency": metrics["latency_total"] / metrics["completed"] if metrics["completed"] else 0.0,
+                } for model, metrics in self._metrics.items()
+            },
+        }
+
+
+llm_client = LLMClient(
+    max_concurrency=int(os.getenv(LLM_MAX_CONCURRENCY, "16")),
+    model_concurrency=int(os.getenv(LLM_MODEL_CONCURRENCY, "8")),
+    model_limits=parse_model_limits(os.getenv(LLM_MODEL_LIMITS)),
+    timeout=float(os.getenv(LLM_TIMEOUT, "120")),
+    queue_timeout=float(os.getenv(LLM_QUEUE_TIMEOUT, "30")) or None,
+)
+
+
+@llm_stats_router.get("/llm/stats")
+async def llm_stats():
+    """
+    Endpoint for inspecting the blocks LLM client.
+
+    Returns:
+        dict: The concurrency limits, queue depth and call counters of the client, and the
+            counters of the blocks response cache.
+    """
+    return {**llm_client.stats(), "response_cache": response_cache.stats()}
@@ -0,0 +1,87 @@
+from hashlib import sha256
+from typing import Any, Awaitable, Callable, Dict, Optional
+from private_gpt.cache import LRUCache, SqliteCache
+import orjson
+import os
+
+# Constants
+BLOCKS_CACHE_BACKEND = "BLOCKS_CACHE_BACKEND"
+BLOCKS_CACHE_SIZE = "BLOCKS_CACHE_SIZE"
+BLOCKS_CACHE_TTL = "BLOCKS_CACHE_TTL"
+BLOCKS_CACHE_PATH = "BLOCKS_CACHE_PATH"
+
+
+class ResponseCache:
+    """
+    A content-addressed cache of blocks results.
+
+    Entries are keyed by a hash of the complete LLM call parameters, i.e. the model, the rendered
+    prompt, the function schema and the sampling parameters, so any change to the request or to
+    a prompt template is a different entry. It is meant for the blocks whose output is
+    deterministic for a given call, such as sentiment analysis and entity extraction.
+
+    Attributes:
+        backend (Any): The LRUCache or SqliteCache holding the results, None when caching is disabled.
+        bypassed (int): The number of calls that skipped the cache on request.
+    """
+
+    def __init__(self, backend: Optional[Any]):
+        self.backend = backend
+        self.bypassed = 0
+
+    def key(self, params: Dict) -> str:
+        return sha256(orjson.dumps(params, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    async def get_or_call(self, params: Dict, call: Callable[[], Awaitable[Any]], bypass: bool = False) -> Any:
+        """
+        Return the cached result of the LLM call described by params, computing it with call on a miss.
+
+        Args:
+            params (Dict): The chat.completions.create arguments of the call.
+            call (Callable[[], Awaitable[Any]]): Coroutine function computing the JSON serializable result.
+            bypass (bool): Whether to skip the lookup. The fresh result still refreshes the cache.
+        """
+        if self.backend is None:
+            return await call()
+
+        key = self.key(params)
+        if bypass:
+            self.bypassed += 1
+        else:
+            result = self.backend.get(key)
+            if result is not None:
+                return result
+
+        result = await call()
+        self.backend.set(key, result)
+        return result
+
+    def stats(self) -> dict:
+        if self.backend is None:
+            return {"backend": None}
+        return {
+            "backend": "sqlite" if isinstance(self.backend, SqliteCache) else "memory",
+            **self.backend.stats(),
+            "bypassed": self.bypassed,
+        }
+
+
+def response_cache_from_env() -> ResponseCache:
+    """
+    Build the blocks cache selected by BLOCKS_CACHE_BACKEND: "memory" (default), "sqlite" or "none".
+
+    BLOCKS_CACHE_SIZE bounds the memory backend, BLOCKS_CACHE_PATH locates the sqlite file and
+    BLOCKS_CACHE_TTL (seconds, 0 for no expiry) applies to both.
+    """
+    backend = os.getenv(BLOCKS_CACHE_BACKEND, "memory")
+    ttl = float(os.getenv(BLOCKS_CACHE_TTL, "86400")) or None
+    if backend == "memory":
+        return ResponseCache(LRUCache(maxsize=int(os.getenv(BLOCKS_CACHE_SIZE, "4096")), ttl=ttl))
+    if backend == "sqlite":
+        return ResponseCache(SqliteCache(os.getenv(BLOCKS_CACHE_PATH, "blocks_cache.sqlite"), ttl=ttl, table="blocks"))
+    if backend == "none":
+        return ResponseCache(None)
+    raise ValueError(f"Invalid {BLOCKS_CACHE_BACKEND}: {backend}. Expected 'memory', 'sqlite' or 'none'.")
+
+
+response_cache = response_cache_from_env()
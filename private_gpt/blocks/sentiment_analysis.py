@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
-from private_gpt import openai_client
+from private_gpt.blocks.llm_client import llm_client
+from private_gpt.blocks.batch import ndjson_batch_response
+from private_gpt.blocks.response_cache import response_cache
 
 
 sentiment_analysis_router = APIRouter()
@@ -26,10 +28,72 @@ class TextRequest(BaseModel):
         document (str): The original document to be analyzed.
         examples (Optional[List[Example]]): Optional examples of sentiment analysis.
         model (Optional[str]): The model to be used for analysis. Defaults to "gpt-3.5-turbo".
+        no_cache (Optional[bool]): Whether to call the model even if the result is cached. Defaults to False.
     """
     document: str
     examples: Optional[List[Example]] = None
     model: Optional[str] = "gpt-3.5-turbo"
+    no_cache: Optional[bool] = False
+
+class TextBatchRequest(BaseModel):
+    """
+    Request model for batch sentiment analysis.
+
+    Attributes:
+        documents (List[str]): The documents to be analyzed.
+        examples (Optional[List[Example]]): Optional examples of sentiment analysis, shared by all documents.
+        model (Optional[str]): The model to be used for analysis. Defaults to "gpt-3.5-turbo".
+        no_cache (Optional[bool]): Whether to call the model even if the results are cached. Defaults to False.
+    """
+    documents: List[str]
+    examples: Optional[List[Example]] = None
+    model: Optional[str] = "gpt-3.5-turbo"
+    no_cache: Optional[bool] = False
+
+async def get_sentiment(request: TextRequest) -> dict:
+    """
+    Analyze the sentiment of one document.
+
+    Args:
+        request (TextRequest): The sentiment analysis request.
+
+    Returns:
+        dict: A dictionary containing the sentiment of the document.
+    """
+    # Generate examples text
+    examples_text = ""
+    if request.examples:
+        examples_text += "Here are some examples of sentiment analysis:"
+        examples_text += "\n".join([
+            f"Document: \"{example.document}\"\nSentiment: {example.sentiment}"
+            for example in request.examples
+        ])
+    
+    # Generate prompt
+    prompt = f"""
+        You are a sentiment analysis tool.
+        Analyze the sentiment of the following text and classify it as positive, negative, or neutral. Return it as a single word answer.
+        {examples_text}
+        Document: \"{request.document}\"
+        """
+    
+    # Call OpenAI API to get sentiment, identical calls are answered from the response cache
+    params = dict(
+        model=request.model,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=1,
+        temperature=0 
+    )
+
+    async def call():
+        response = await llm_client.create(**params)
+        return response.choices[0].message.content.strip()
+
+    sentiment = await response_cache.get_or_call(params, call, bypass=request.no_cache)
+    
+    # Return sentiment
+    return {"sentiment": sentiment}
+
 
 @sentiment_analysis_router.post("/analyze-sentiment")
 async def analyze_sentiment(request: TextRequest):
@@ -48,35 +112,24 @@ async def analyze_sentiment(request: TextRequest):
             process.
     """
     try:
-        # Generate examples text
-        examples_text = ""
-        if request.examples:
-            examples_text += "Here are some examples of sentiment analysis:"
-            examples_text += "\n".join([
-                f"Document: \"{example.document}\"\nSentiment: {example.sentiment}"
-                for example in request.examples
-            ])
-        
-        # Generate prompt
-        prompt = f"""
-        You are a sentiment analysis tool.
-        Analyze the sentiment of the following text and classify it as positive, negative, or neutral. Return it as a single word answer.
-        {examples_text}
-        Document: \"{request.document}\"
-        """
-        
-        # Call OpenAI API to get sentiment
-        response = openai_client.chat.completions.create(
-            model=request.model,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=1,
-            temperature=0 
-        )
-        sentiment = response.choices[0].message.content.strip()
-        
-        # Return sentiment
-        return {"sentiment": sentiment}
+        return await get_sentiment(request)
     
     # If there is an error, raise an HTTPException
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@sentiment_analysis_router.post("/analyze-sentiment/batch")
+async def analyze_sentiment_batch(request: TextBatchRequest):
+    """
+    Analyze the sentiment of a list of documents with bounded concurrency.
+
+    Args:
+        request (TextBatchRequest): The documents and the analysis parameters they share.
+
+    Returns:
+        StreamingResponse: NDJSON lines {"index", "result", "error"} in completion order, where
+            index is the position of the document in the request.
+    """
+    shared = request.dict(exclude={"documents"})
+    items = [TextRequest(document=document, **shared) for document in request.documents]
+    return ndjson_batch_response(items, get_sentiment)
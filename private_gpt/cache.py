@@ -0,0 +1,211 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded LRU cache with an optional time-to-live.
+
+    Attributes:
+        maxsize (int): The maximum number of entries kept in the cache.
+        ttl (Optional[float]): The number of seconds an entry stays valid. None disables expiry.
+        hits (int): The number of lookups served from the cache.
+        misses (int): The number of lookups that were not in the cache.
+        evictions (int): The number of entries dropped because of size or age.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.monotonic() - stored_at > self.ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, stored_at = entry
+            if self._expired(stored_at):
+                del self._data[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """
+        Return the cached values of several keys, missing keys are left out.
+        """
+        sentinel = object()
+        values = {}
+        with self._lock:
+            for key in keys:
+                value = self.get(key, sentinel)
+                if value is not sentinel:
+                    values[key] = value
+        return values
+
+    def set_many(self, items: Dict[Hashable, Any]) -> None:
+        with self._lock:
+            for key, value in items.items():
+                self.set(key, value)
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for key, building and storing it with factory on a miss.
+
+        The factory runs outside the lock so a slow build does not stall other keys.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+        value = factory()
+        self.set(key, value)
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def delete_many(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SqliteCache:
+    """
+    A persistent key/value cache stored in a local sqlite file.
+
+    Values are stored as JSON, so anything json.dumps accepts can be cached.
+
+    Attributes:
+        path (str): The path of the sqlite database file.
+        ttl (Optional[float]): The number of seconds an entry stays valid. None disables expiry.
+        hits (int): The number of lookups served from disk.
+        misses (int): The number of lookups that were not on disk.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None, table: str = "cache"):
+        self.path = path
+        self.ttl = ttl
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+                self.misses += 1
+                return default
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, payload, time.time())
+            )
+            self._conn.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Return the stored values of several keys, missing and expired keys are left out.
+        """
+        keys = list(keys)
+        rows = []
+        with self._lock:
+            # Older sqlite builds accept at most 999 parameters per statement
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows += self._conn.execute(
+                    f"SELECT key, value, stored_at FROM {self.table} WHERE key IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+        now = time.time()
+        values = {key: json.loads(value) for key, value, stored_at in rows if self.ttl is None or now - stored_at <= self.ttl}
+        self.hits += len(values)
+        self.misses += len(keys) - len(values)
+        return values
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        """
+        Store several values in one transaction.
+        """
+        now = time.time()
+        rows = [(key, json.dumps(value), now) for key, value in items.items()]
+        with self._lock:
+            self._conn.executemany(f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in keys])
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
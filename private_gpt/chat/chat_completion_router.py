@@ -1,12 +1,15 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
+from private_gpt.responses import json_response
 from private_gpt.chat.schemas import RequestModel
 from private_gpt.chat.chat_completion_service import (
     chat_and_augment,
     generate_messages,
-    chat_and_augment_stream
+    chat_and_augment_stream,
+    chat_and_augment_events
 )
 import json
+import orjson
 from datetime import datetime
 
 chat_completion_router = APIRouter()
@@ -34,14 +37,16 @@ async def process_request(request: RequestModel):
     try:
         if input_data.get('stream', False):
             # Return the streaming response if streaming is enabled
+            stream_format = input_data.get('stream_format') or 'legacy'
+            if stream_format == 'sse':
+                return await sse_streaming_response(messages, input_data)
+            if stream_format != 'legacy':
+                raise ValueError(f"Invalid stream_format: {stream_format}. Expected 'legacy' or 'sse'.")
             return await streaming_response(messages, input_data)
         else:
             # Process the chat and augment the messages
             chat_response, search_response = await chat_and_augment(messages, input_data)
             
-            # Parse the search response from JSON
-            search_response = json.loads(search_response)
-            
             # Prepare the response dictionary
             response_dict = {
                 "id": str(chat_response.run[0].run_id),  # Set the run ID
@@ -55,13 +60,13 @@ async def process_request(request: RequestModel):
                             "role": "assistant",  # Set the role to assistant
                             "content": chat_response.generations[0][0].text  # Set the message content
                         },
-                        "sources": search_response['data']  # Set the sources
+                        "sources": [chunk.to_dict() for chunk in search_response.chunks]  # Set the sources
                     }
                 ]
             }
             
             # Return the response dictionary
-            return response_dict
+            return json_response(response_dict)
     except Exception as e:
         # Raise an HTTPException if an error occurs
         raise HTTPException(status_code=400, detail=str(e))
@@ -82,14 +87,17 @@ async def streaming_response(messages, input_data):
         Generate the streaming response asynchronously.
 
         Yields:
-            str: The JSON-encoded response dictionary for each chunk of the chat completion.
+            bytes: The JSON-encoded response dictionary for each chunk of the chat completion.
         """
+        # Legacy frames keep the json.dumps format (", " separators, ASCII escapes) clients parse
+        sources = None
         async for chunk, search_response in chat_and_augment_stream(messages, input_data):
             # Get the message content from the chunk
             chunk_text = chunk.message
             
-            # Parse the search response from JSON
-            search_response = json.loads(search_response)
+            # Encode the sources once, the retrieval result is the same for every chunk
+            if sources is None:
+                sources = json.dumps([source.to_dict() for source in search_response.chunks])
             
             # Prepare the response dictionary
             response_dict = {
@@ -104,13 +112,47 @@ async def streaming_response(messages, input_data):
                             "role": "assistant",  # Set the role to 'assistant'
                             "content": chunk_text.content  # Set the message content
                         },
-                        "sources": search_response['data']  # Set the sources
+                        "sources": None  # Set to the encoded sources below
                     }
                 ]
             }
             
-            # Yield the JSON-encoded response dictionary for each chunk
-            yield json.dumps(response_dict) + '\n\n'
+            # Yield the JSON-encoded response dictionary for each chunk, "sources" is its last value
+            frame = json.dumps(response_dict)
+            yield (frame[:-len('null}]}')] + sources + '}]}\n\n').encode()
             
     # Return the streaming response
     return StreamingResponse(content=generate(), media_type="text/event-stream")
+
+
+def sse_event(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+async def sse_streaming_response(messages, input_data):
+    """
+    Generate a server-sent events response for the chat completion API endpoint.
+
+    The stream carries one "sources" event with the retrieved chunks, one compact "delta" event
+    per token and a final "done" event with the finish reason and the token usage.
+
+    Args:
+        messages (List[Message]): The list of messages in the chat conversation.
+        input_data (dict): The input data for the chat completion.
+
+    Returns:
+        StreamingResponse: The event stream of the chat completion.
+    """
+    async def generate():
+        created = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+        async for event, payload in chat_and_augment_events(messages, input_data):
+            if event == "sources":
+                yield sse_event("sources", {
+                    "created": created,
+                    "sources": [chunk.to_dict() for chunk in payload.chunks]
+                })
+            elif event == "delta":
+                yield sse_event("delta", {"content": payload})
+            else:
+                yield sse_event("done", payload)
+
+    return StreamingResponse(content=generate(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
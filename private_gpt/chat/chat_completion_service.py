@@ -1,6 +1,5 @@
 # chat_completions_service.py
 import os
-import json
 from langchain_community.chat_models import ChatOpenAI
 from langchain.schema import (
     SystemMessage,
@@ -8,37 +7,55 @@ from langchain.schema import (
     AIMessage
 )
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
-from private_gpt.chunks.chunks_service import search_documents
+from private_gpt.chunks.chunks_service import asearch
+from private_gpt.chunks.results import RetrievalResult
+from private_gpt.chat.context import context_budget, pack_context
+from private_gpt.cache import LRUCache
 from private_gpt.chat.schemas import Message
-from typing import List, Dict
+from private_gpt.tokens import count_tokens
+from typing import List, Dict, Optional
+
+# Constants
+CHAT_MODEL_CACHE_SIZE = "CHAT_MODEL_CACHE_SIZE"
+CHAT_ECHO_STDOUT = "CHAT_ECHO_STDOUT"
 
 openai_api_key = os.getenv("OPENAI_API_KEY")
-def create_chat_model(request):
-    temperature = request.get('temperature', 0)  # Default to 0 if no temperature provided
-    streaming = request.get('stream', True) # Default to 0 if no temperature provided
+
+# One client per (base URL, model, streaming), each keeps its HTTP connection pool alive
+chat_models = LRUCache(maxsize=int(os.getenv(CHAT_MODEL_CACHE_SIZE, "32")))
+
+def get_chat_model(request) -> ChatOpenAI:
+    """
+    Return the shared chat client for the request's base URL, model and streaming flag.
+
+    Per-request parameters are not part of the client, pass get_call_params(request) to the
+    generate or stream call instead. Echoing tokens to stdout is enabled with CHAT_ECHO_STDOUT.
+    """
     model = request.get('model', 'gpt-3.5-turbo')  # Default to 'gpt-3.5-turbo' if no model provided
     streaming = request.get('streaming', True)
-    max_tokens = request.get('max_tokens', 100)  # Default to True if no streaming provided
+    base_url = os.environ.get("SCALEGEN_BASE_URL")
 
-    if os.environ.get("SCALEGEN_BASE_URL"):
-        chat_model = ChatOpenAI(streaming=streaming,
-            callbacks=[StreamingStdOutCallbackHandler()],
-            openai_api_key=openai_api_key,
-            openai_api_base=os.environ.get("SCALEGEN_BASE_URL"),
-            temperature=temperature,
-            model=model,
-            max_tokens= max_tokens
-        )
-    else:
-        chat_model = ChatOpenAI(streaming=streaming,
-            callbacks=[StreamingStdOutCallbackHandler()],
+    def build():
+        callbacks = [StreamingStdOutCallbackHandler()] if os.getenv(CHAT_ECHO_STDOUT, "false").lower() in ("1", "true", "yes") else None
+        base_url_params = {"openai_api_base": base_url} if base_url else {}
+        return ChatOpenAI(streaming=streaming,
+            callbacks=callbacks,
             openai_api_key=openai_api_key,
-            temperature=temperature,
             model=model,
-            max_tokens= max_tokens
+            temperature=0,
+            max_tokens=100,
+            **base_url_params
         )
 
-    return chat_model
+    return chat_models.get_or_create((base_url, model, streaming), build)
+
+def get_call_params(request) -> Dict:
+    # Unset values fall back to the client defaults, temperature 0 and 100 max tokens
+    params = {
+        "temperature": request.get('temperature'),
+        "max_tokens": request.get('max_tokens'),
+    }
+    return {key: value for key, value in params.items() if value is not None}
 
 def generate_messages(messages_data: List[Dict[str, str]]) -> List[Message]:
     # Map role to message class
@@ -64,9 +81,9 @@ def generate_messages(messages_data: List[Dict[str, str]]) -> List[Message]:
         messages.append(MessageClass(content=content))
 
     return messages
-def augment_prompt(query: str, response: str) -> str:
-    data = json.loads(response)
-    source_knowledge = "\n".join([item['text'] for item in data['data']])
+def augment_prompt(query: str, search_result: RetrievalResult, budget: Optional[int] = None, model: Optional[str] = None) -> str:
+    # Neighbor windows are merged into spans and packed best first into the token budget
+    source_knowledge = pack_context(search_result, budget, model)
     augmented_prompt = f"""Using the contexts below, answer the query.
 
     Contexts:
@@ -75,39 +92,73 @@ def augment_prompt(query: str, response: str) -> str:
     Query: {query}"""
     return augmented_prompt
 
-async def chat_and_augment(messages: List[Message], request):
+async def retrieve_and_augment(messages: List[Message], request):
     if "HumanMessage" not in str(type(messages[-1])):
         raise ValueError("Last message should be user message")
     last_user_message = messages[-1].content
     request['text'] = request['messages'][-1]['content']
-    retrieval_input_str = json.dumps(request)
-    search_response = search_documents(retrieval_input_str) 
+    search_response = await asearch(request)
     augmented_prompt = last_user_message
     if request['use_context']:
-        augmented_prompt = augment_prompt(augmented_prompt, search_response)
+        model = request.get('model', 'gpt-3.5-turbo')
+        # The query is sent twice, in the conversation and in the augmented prompt
+        budget = context_budget(messages, request.get('max_tokens'), model) - count_tokens(last_user_message, model)
+        augmented_prompt = augment_prompt(augmented_prompt, search_response, max(budget, 0), model)
 
     messages.append(HumanMessage(content=augmented_prompt))
-    chat_model = create_chat_model(request)
-    chat_response = await chat_model.agenerate([messages])
+    return search_response
+
+async def chat_and_augment(messages: List[Message], request):
+    search_response = await retrieve_and_augment(messages, request)
+    chat_model = get_chat_model(request)
+    chat_response = await chat_model.agenerate([messages], **get_call_params(request))
     
     return chat_response,search_response
 
-# Remember to define or import `search_documents` function.
-
 async def chat_and_augment_stream(messages: List[Message], request):
-    if "HumanMessage" not in str(type(messages[-1])):
-        raise ValueError("Last message should be user message")
-
-    last_user_message = messages[-1].content
-    request['text'] = request['messages'][-1]['content']
-    retrieval_input_str = json.dumps(request)
-    search_response = search_documents(retrieval_input_str)
-    augmented_prompt = last_user_message
-    if request['use_context']:
-        augmented_prompt = augment_prompt(augmented_prompt, search_response)
-
-    messages.append(HumanMessage(content=augmented_prompt))
-    chat_model = create_chat_model(request)
-
-    async for chunk in chat_model._astream(messages):  # Use async for loop here
-        yield chunk, search_response
\ No newline at end of file
+    search_response = await retrieve_and_augment(messages, request)
+    chat_model = get_chat_model(request)
+
+    async for chunk in chat_model._astream(messages, **get_call_params(request)):  # Use async for loop here
+        yield chunk, search_response
+
+def count_prompt_tokens(chat_model, messages: List[Message], model: Optional[str] = None) -> int:
+    try:
+        return chat_model.get_num_tokens_from_messages(messages)
+    except Exception:
+        # The exact count needs tiktoken and a model it knows, count the message contents instead
+        return sum(count_tokens(message.content, model) for message in messages)
+
+async def chat_and_augment_events(messages: List[Message], request):
+    """
+    Stream a chat completion as protocol events.
+
+    Yields:
+        Tuple[str, Any]: ("sources", RetrievalResult) once, then ("delta", str) per generated
+        token and finally ("done", dict) with the finish_reason and the token usage.
+    """
+    search_response = await retrieve_and_augment(messages, request)
+    yield "sources", search_response
+
+    chat_model = get_chat_model(request)
+    finish_reason = None
+    completion = []
+    async for chunk in chat_model._astream(messages, **get_call_params(request)):
+        if chunk.generation_info:
+            finish_reason = chunk.generation_info.get("finish_reason", finish_reason)
+        if chunk.text:
+            completion.append(chunk.text)
+            yield "delta", chunk.text
+
+    model = request.get('model', 'gpt-3.5-turbo')
+    prompt_tokens = count_prompt_tokens(chat_model, messages, model)
+    # Chunks are not tokens for every backend, count the completion text itself
+    completion_tokens = count_tokens("".join(completion), model)
+    yield "done", {
+        "finish_reason": finish_reason,
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
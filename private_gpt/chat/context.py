@@ -0,0 +1,164 @@
+from typing import Dict, List, Optional, Tuple
+from private_gpt.blocks.llm_client import parse_model_limits
+from private_gpt.chunks.results import ChunkResult, RetrievalResult
+from private_gpt.tokens import count_tokens
+import os
+
+# Constants
+CHAT_CONTEXT_WINDOW = "CHAT_CONTEXT_WINDOW"
+CHAT_MODEL_CONTEXT_WINDOWS = "CHAT_MODEL_CONTEXT_WINDOWS"
+
+# Context windows by model name prefix, the longest matching prefix wins
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-0613": 4096,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4o": 128000,
+}
+# Models missing from the table, such as those served behind SCALEGEN_BASE_URL
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# Tokens taken by the prompt template and the chat message framing
+PROMPT_OVERHEAD_TOKENS = 64
+
+
+def priority(chunk: ChunkResult) -> Tuple:
+    # Highest fused score first, retriever rank when there is no score
+    return (-chunk.score if chunk.score is not None else 0.0, chunk.rank)
+
+
+def build_spans(search_result: RetrievalResult) -> List[Dict]:
+    """
+    Merge every hit and its neighbors into contiguous spans of chunks per document.
+
+    Overlapping or adjacent windows of the same document become one span, so a chunk appears
+    only once. Chunks without a position are kept as spans of their own, and chunks whose text
+    is already part of another span are dropped.
+
+    Returns:
+        List[Dict]: {"doc_id", "priority", "texts", "hits"} spans, best first. texts lists the
+        span's chunks in document order and hits the positions in texts of retrieved chunks.
+    """
+    windows: Dict[str, Dict[int, str]] = {}
+    hit_priorities: Dict[str, Dict[int, Tuple]] = {}
+    loose = []
+    for chunk in search_result.chunks:
+        if chunk.chunk_num is None:
+            loose.append({"doc_id": chunk.doc_id, "priority": priority(chunk), "texts": [chunk.text], "hit_texts": {chunk.text}})
+            continue
+        chunk_num = int(chunk.chunk_num)
+        window = windows.setdefault(chunk.doc_id, {})
+        window.update(zip(chunk.previous_chunk_nums, chunk.previous_texts))
+        window.update(zip(chunk.next_chunk_nums, chunk.next_texts))
+        window[chunk_num] = chunk.text
+        hits = hit_priorities.setdefault(chunk.doc_id, {})
+        hits[chunk_num] = min(hits.get(chunk_num, priority(chunk)), priority(chunk))
+
+    spans = []
+    for doc_id, window in windows.items():
+        span_nums = []
+        for chunk_num in sorted(window):
+            if span_nums and chunk_num != span_nums[-1] + 1:
+                spans.append(_span(doc_id, span_nums, window, hit_priorities[doc_id]))
+                span_nums = []
+            span_nums.append(chunk_num)
+        spans.append(_span(doc_id, span_nums, window, hit_priorities[doc_id]))
+    spans = [span for span in spans if span["hit_texts"]] + loose
+    spans.sort(key=lambda span: span["priority"])
+
+    # The same text ingested in several documents is only sent once
+    seen = set()
+    unique_spans = []
+    for span in spans:
+        texts = [text for text in span["texts"] if text not in seen]
+        if not texts:
+            continue
+        seen.update(texts)
+        unique_spans.append({
+            "doc_id": span["doc_id"],
+            "priority": span["priority"],
+            "texts": texts,
+            "hits": [i for i, text in enumerate(texts) if text in span["hit_texts"]],
+        })
+    return unique_spans
+
+
+def _span(doc_id: str, span_nums: List[int], window: Dict[int, str], hits: Dict[int, Tuple]) -> Dict:
+    hit_nums = [chunk_num for chunk_num in span_nums if chunk_num in hits]
+    return {
+        "doc_id": doc_id,
+        "priority": min(hits[chunk_num] for chunk_num in hit_nums) if hit_nums else (0.0, float("inf")),
+        "texts": [window[chunk_num] for chunk_num in span_nums],
+        "hit_texts": {window[chunk_num] for chunk_num in hit_nums},
+    }
+
+
+def pack_context(search_result: RetrievalResult, budget: Optional[int] = None, model: Optional[str] = None) -> str:
+    """
+    Assemble the retrieved chunks into a prompt context of at most budget tokens.
+
+    Spans are added best first. A span that does not fit is reduced to its retrieved chunks
+    without their neighbors, and packing stops at the first span that does not fit even then.
+    A span left with neighbors only, its hits having been sent with other spans, is skipped
+    when it does not fit.
+
+    Args:
+        search_result (RetrievalResult): The retrieval result to pack.
+        budget (Optional[int]): The maximum number of context tokens, None for no limit.
+        model (Optional[str]): The model whose tokenizer counts the tokens.
+
+    Returns:
+        str: The spans, one per paragraph.
+    """
+    parts = []
+    used = 0
+    for span in build_spans(search_result):
+        hit_texts = [span["texts"][i] for i in span["hits"]]
+        for texts in (span["texts"], hit_texts):
+            # A span whose hits were all sent with other spans has nothing left to reduce to
+            if not texts:
+                continue
+            text = "\n".join(texts)
+            tokens = count_tokens(text, model)
+            if budget is None or used + tokens <= budget:
+                break
+        else:
+            if not hit_texts:
+                continue
+            break
+        parts.append(text)
+        used += tokens
+    return "\n\n".join(parts)
+
+
+def context_window(model: Optional[str] = None) -> int:
+    """
+    Return the context window of a model.
+
+    CHAT_CONTEXT_WINDOW overrides it for every model and CHAT_MODEL_CONTEXT_WINDOWS
+    ("model=window,model=window") for single models. Otherwise it comes from
+    MODEL_CONTEXT_WINDOWS, or DEFAULT_CONTEXT_WINDOW for unknown models.
+    """
+    if os.getenv(CHAT_CONTEXT_WINDOW):
+        return int(os.getenv(CHAT_CONTEXT_WINDOW))
+    model = model or ""
+    overrides = parse_model_limits(os.getenv(CHAT_MODEL_CONTEXT_WINDOWS), CHAT_MODEL_CONTEXT_WINDOWS)
+    if model in overrides:
+        return overrides[model]
+    prefixes = [prefix for prefix in MODEL_CONTEXT_WINDOWS if model.startswith(prefix)]
+    return MODEL_CONTEXT_WINDOWS[max(prefixes, key=len)] if prefixes else DEFAULT_CONTEXT_WINDOW
+
+
+def context_budget(messages: List, max_tokens: Optional[int], model: Optional[str] = None) -> int:
+    """
+    Return the tokens left for context in the model's window (see context_window) once the
+    conversation, the prompt template and the completion are accounted for.
+    """
+    window = context_window(model)
+    conversation = sum(count_tokens(message.content, model) for message in messages)
+    return max(window - conversation - (max_tokens or 100) - PROMPT_OVERHEAD_TOKENS, 0)
@@ -18,6 +18,8 @@ class RequestModel(BaseModel):
     max_tokens: Optional[int]
     temperature: Optional[float]
     limit: Optional[float]
+    # "legacy": one full JSON frame per token, "sse": sources once, then delta and done events
+    stream_format: Optional[str] = Field("legacy")
 
 class DocumentMetadata(BaseModel):
     class Config:
@@ -0,0 +1,251 @@
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Tuple
+import asyncio
+import os
+import time
+
+# Constants
+RETRIEVAL_HEDGING = "RETRIEVAL_HEDGING"
+RETRIEVAL_HEDGE_DELAY = "RETRIEVAL_HEDGE_DELAY"
+RETRIEVAL_HEDGE_MIN_DELAY = "RETRIEVAL_HEDGE_MIN_DELAY"
+RETRIEVAL_BREAKER_FAILURES = "RETRIEVAL_BREAKER_FAILURES"
+RETRIEVAL_BREAKER_RESET = "RETRIEVAL_BREAKER_RESET"
+
+
+class LatencyTracker:
+    """
+    Rolling latency and outcome statistics for one backend.
+
+    Calls cancelled as hedge losers are kept as censored samples: the time they ran is a lower
+    bound of their latency. Leaving them out would keep only the fast calls, and the p95 hedge
+    delay would shrink with every hedge.
+
+    Attributes:
+        samples (deque): The latencies, in seconds, of the most recent successful or cancelled calls.
+        successes (int): The number of successful calls.
+        failures (int): The number of failed calls.
+        cancelled (int): The number of calls cancelled before they finished.
+    """
+
+    def __init__(self, window: int = 500):
+        self.samples = deque(maxlen=window)
+        self.successes = 0
+        self.failures = 0
+        self.cancelled = 0
+
+    def record(self, latency: float, ok: bool) -> None:
+        if ok:
+            self.samples.append(latency)
+            self.successes += 1
+        else:
+            self.failures += 1
+
+    def record_censored(self, elapsed: float) -> None:
+        self.samples.append(elapsed)
+        self.cancelled += 1
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self) -> dict:
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "cancelled": self.cancelled,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class CircuitBreaker:
+    """
+    Skip a backend after repeated consecutive failures.
+
+    After failure_threshold consecutive failures the breaker opens and the backend is skipped.
+    Once reset_timeout seconds have passed a single trial call is let through (half-open); its
+    outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+
+    def available(self) -> bool:
+        """
+        Whether allow() could let a call through, without using up the half-open trial.
+        """
+        return self.state == "closed" or (self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout)
+
+    def allow(self) -> bool:
+        """
+        Whether a call may be made now. Only call it right before making the call, as it takes the half-open trial.
+        """
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures}
+
+
+class BackendSelector:
+    """
+    Choose between retrieval backends using latency tracking, circuit breakers and hedging.
+
+    Backends are tried in priority order, skipping any whose breaker is open. With hedging
+    enabled the next backend is fired when the preferred one has not answered within its p95
+    latency, and whichever answers first wins; the other call is cancelled.
+
+    Attributes:
+        order (List[str]): The backend names in priority order.
+        hedging (bool): Whether hedged requests are enabled.
+        hedge_delay (float): The hedge delay used until a backend has enough latency samples.
+        hedge_min_delay (float): The lower bound of the p95 based hedge delay.
+    """
+
+    def __init__(self, order: List[str], hedging: bool = False, hedge_delay: float = 0.5, hedge_min_delay: float = 0.05,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, min_samples: int = 20):
+        self.order = order
+        self.hedging = hedging
+        self.hedge_delay = hedge_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.min_samples = min_samples
+        self.latency = {name: LatencyTracker() for name in order}
+        self.breakers = {name: CircuitBreaker(failure_threshold, reset_timeout) for name in order}
+        self.served = {name: 0 for name in order}
+
+    def delay_for(self, name: str) -> float:
+        tracker = self.latency[name]
+        if len(tracker.samples) < self.min_samples:
+            return self.hedge_delay
+        return max(self.hedge_min_delay, tracker.percentile(0.95))
+
+    async def _timed(self, name: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.perf_counter()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            # A cancelled hedge loser says nothing about health, but it was at least this slow
+            # and it must not leave a trial pending
+            self.latency[name].record_censored(time.perf_counter() - started)
+            if self.breakers[name].state == "half_open":
+                self.breakers[name].state = "open"
+                self.breakers[name].opened_at = time.monotonic()
+            raise
+        except Exception as e:
+            self.latency[name].record(time.perf_counter() - started, ok=False)
+            self.breakers[name].record_failure()
+            print(f"Retrieval backend {name} failed: {e!r}")
+            raise
+        self.latency[name].record(time.perf_counter() - started, ok=True)
+        self.breakers[name].record_success()
+        return result
+
+    def _admitted(self, calls: Dict[str, Callable[[], Awaitable[Any]]]) -> Iterator[str]:
+        # Lazy, so a breaker only hands out its half-open trial to a backend that is then called
+        names = [name for name in self.order if name in calls]
+        if not any(self.breakers[name].available() for name in names):
+            # With every breaker open, trying anyway beats failing without a single attempt
+            yield from names
+            return
+        for name in names:
+            if self.breakers[name].allow():
+                yield name
+
+    async def call(self, calls: Dict[str, Callable[[], Awaitable[Any]]]) -> Tuple[Any, str]:
+        """
+        Run the request against the best available backend.
+
+        Args:
+            calls (Dict[str, Callable]): A coroutine factory per backend name.
+
+        Returns:
+            Tuple[Any, str]: The result and the name of the backend that served it.
+
+        Raises:
+            Exception: The last backend error when no backend could serve the request.
+        """
+        admitted = self._admitted(calls)
+        last_error = RuntimeError("No retrieval backend available")
+        if not self.hedging:
+            for name in admitted:
+                try:
+                    result = await self._timed(name, calls[name])
+                except Exception as e:
+                    last_error = e
+                    continue
+                self.served[name] += 1
+                return result, name
+            raise last_error
+
+        primary = next(admitted, None)
+        if primary is None:
+            raise last_error
+        tasks = {asyncio.ensure_future(self._timed(primary, calls[primary])): primary}
+        done, pending = await asyncio.wait(tasks, timeout=self.delay_for(primary))
+        for task in done:
+            if task.exception() is None:
+                self.served[primary] += 1
+                return task.result(), primary
+            last_error = task.exception()
+
+        # The primary is slow or already failed, fire the fallback and take the first answer
+        fallback = next(admitted, None)
+        if fallback is not None:
+            fallback_task = asyncio.ensure_future(self._timed(fallback, calls[fallback]))
+            tasks[fallback_task] = fallback
+            pending = set(pending) | {fallback_task}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    self.served[tasks[task]] += 1
+                    return task.result(), tasks[task]
+                last_error = task.exception()
+        raise last_error
+
+    def stats(self) -> dict:
+        return {
+            "hedging": self.hedging,
+            "backends": {
+                name: {
+                    "served": self.served[name],
+                    "hedge_delay": self.delay_for(name),
+                    "latency": self.latency[name].stats(),
+                    "breaker": self.breakers[name].stats(),
+                } for name in self.order
+            }
+        }
+
+
+def backend_selector_from_env(order: List[str]) -> BackendSelector:
+    return BackendSelector(
+        order,
+        hedging=os.getenv(RETRIEVAL_HEDGING, "false").lower() in ("1", "true", "yes"),
+        hedge_delay=float(os.getenv(RETRIEVAL_HEDGE_DELAY, "0.5")),
+        hedge_min_delay=float(os.getenv(RETRIEVAL_HEDGE_MIN_DELAY, "0.05")),
+        failure_threshold=int(os.getenv(RETRIEVAL_BREAKER_FAILURES, "5")),
+        reset_timeout=float(os.getenv(RETRIEVAL_BREAKER_RESET, "30")),
+    )
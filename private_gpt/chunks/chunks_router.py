@@ -1,7 +1,12 @@
 from fastapi import APIRouter, HTTPException
-from private_gpt.chunks.schemas import ContextChunksRequest, ContextChunksResponse
-from private_gpt.chunks.chunks_service import search_documents
-import json
+from private_gpt.responses import json_response
+from private_gpt.chunks.schemas import ContextChunksRequest, ContextChunksResponse, ContextChunksBatchRequest, ContextChunksBatchResponse
+from private_gpt.chunks.chunks_service import asearch, asearch_batch, backend_selector, EMBEDDINGS_MODEL, SPLADE_EMBEDDING
+from private_gpt.chunks.retriever_pool import retriever_pool
+from private_gpt.chunks.pg_vector_client import pg_vector_client
+from private_gpt.chunks.result_cache import result_cache
+from private_gpt.chunks.dedup import near_duplicate_filter
+from private_gpt.chunks.results import batch_to_dict
 
 context_chunk_retrieval_router = APIRouter()
 
@@ -20,16 +25,52 @@ async def context_chunks_retrieval(request: ContextChunksRequest):
         HTTPException: If an error occurs during the retrieval process.
     """
     try:
-        # Convert the request to JSON
-        json_input = request.json()
+        result = await asearch(request.dict())
 
-        # Call the search_documents function
-        response = search_documents(json_input)
-        
-        # Convert the response from JSON
-        response_dict = json.loads(response)
-
-        return response_dict
+        # The result is built by the service, skip re-validating it against the response model
+        return json_response(result.to_dict())
     except Exception as e:
         # Raise an HTTPException with a 500 status code and the error detail
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@context_chunk_retrieval_router.post("/chunks/batch", response_model=ContextChunksBatchResponse)
+async def context_chunks_batch_retrieval(request: ContextChunksBatchRequest):
+    """
+    Endpoint for retrieving the context chunks of several query texts in one call.
+
+    Args:
+        request (ContextChunksBatchRequest): The query texts and the parameters they share.
+
+    Returns:
+        ContextChunksBatchResponse: One ContextChunksResponse per query text, in request order.
+
+    Raises:
+        HTTPException: If an error occurs during the retrieval process.
+    """
+    try:
+        results = await asearch_batch(request.dict())
+        return json_response(batch_to_dict(results))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@context_chunk_retrieval_router.get("/chunks/stats")
+async def context_chunks_stats():
+    """
+    Endpoint for inspecting the retrieval caches.
+
+    Returns:
+        dict: The size, hit and miss counters of each retrieval cache.
+    """
+    return {
+        "retriever_pool": retriever_pool.stats(),
+        "embeddings": {
+            "dense": EMBEDDINGS_MODEL.stats(),
+            "sparse": SPLADE_EMBEDDING.stats()
+        },
+        "pg_vector": pg_vector_client.stats(),
+        "backends": backend_selector.stats(),
+        "results": result_cache.stats(),
+        "near_duplicates": near_duplicate_filter.stats()
+    }
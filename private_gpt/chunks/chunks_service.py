@@ -1,50 +1,71 @@
-from qdrant_client import QdrantClient,models
+from qdrant_client import AsyncQdrantClient, QdrantClient,models
 from qdrant_client.http.models import Filter, FieldCondition, MatchValue
-from langchain_community.embeddings import HuggingFaceHubEmbeddings
 from langchain_community.vectorstores import Qdrant
 from langchain_community.document_transformers import LongContextReorder
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from private_gpt.chunks.schemas import Document
-from langchain_community.retrievers import QdrantSparseVectorRetriever
+from private_gpt.chunks.retriever_pool import retriever_pool, retriever_key
+from private_gpt.chunks.embedding_cache import cached_embeddings
+from private_gpt.chunks.encoders import check_encoder, create_dense_encoder, create_sparse_encoder, encoder_models, get_embeddings_backend
+from private_gpt.chunks.pg_vector_client import pg_vector_client
+from private_gpt.chunks.retrievers import AsyncQdrantSparseVectorRetriever
+from private_gpt.chunks.hybrid import HybridRetriever, get_hybrid_weights, weighted_rrf, HYBRID_RRF_K
+from private_gpt.chunks.runtime import run_async, run_sync
+from private_gpt.chunks.backends import backend_selector_from_env
+from private_gpt.chunks.result_cache import result_cache
+from private_gpt.chunks.local_index import LocalDenseRetriever, LocalSparseRetriever, open_local_index, to_document
+from private_gpt.chunks.results import ChunkResult, RetrievalResult, batch_to_dict
+from private_gpt.chunks.dedup import near_duplicate_filter
+from private_gpt.cache import LRUCache
 from langchain_community.vectorstores.pgvector import PGVector
-from langchain.retrievers import  EnsembleRetriever
-import json, psycopg2, os
-from qdrant_client.http.models import Filter, FieldCondition
+import asyncio, orjson, os
 
 # Constants
-EMBEDDINGS_URL = "EMBEDDINGS_URL"
-SPLADE_EMBEDDINGS_URL = "SPLADE_EMBEDDINGS_URL"
 EXTRA_RETRIVED = "EXTRA_RETRIVED"
 
+VECTOR_BACKEND = "VECTOR_BACKEND"
+ENCODER_CHECK_TTL = "ENCODER_CHECK_TTL"
+
 # Environment Variables
 QDRANT_SERVER = os.getenv("QDRANT_SERVER")
 PG_VECTOR_SERVER = os.getenv("CONNECTION_STRING")
-if not QDRANT_SERVER:
-    raise ValueError("QDRANT_SERVER environment variable is not set")
-client = QdrantClient(url=QDRANT_SERVER,port=None)
-EMBEDDINGS_MODEL = os.getenv(EMBEDDINGS_URL)
-if not EMBEDDINGS_MODEL:
-    raise ValueError(f"{EMBEDDINGS_URL} environment variable is not set")
-
-SPLADE_EMBEDDING = os.getenv(SPLADE_EMBEDDINGS_URL)
-if not SPLADE_EMBEDDING:
-    raise ValueError(f"{SPLADE_EMBEDDINGS_URL} environment variable is not set")
-
-if not os.environ.get('EMBEDDINGS_API_KEY') or not os.environ.get('SPLADE_EMBEDDINGS_API_KEY'):
-    EMBEDDINGS_MODEL = HuggingFaceHubEmbeddings(model=os.environ['EMBEDDINGS_URL'])
-    SPLADE_EMBEDDING = HuggingFaceHubEmbeddings(model=os.environ['SPLADE_EMBEDDINGS_URL'])
+# "qdrant" (default) or "local", the embedded index of private_gpt.chunks.local_index
+PRIMARY_BACKEND = os.getenv(VECTOR_BACKEND, "qdrant")
+if PRIMARY_BACKEND not in ("qdrant", "local"):
+    raise ValueError(f"Invalid {VECTOR_BACKEND}: {PRIMARY_BACKEND}. Expected 'qdrant' or 'local'.")
+if PRIMARY_BACKEND == "qdrant":
+    if not QDRANT_SERVER:
+        raise ValueError("QDRANT_SERVER environment variable is not set")
+    client = QdrantClient(url=QDRANT_SERVER,port=None)
+    # Used only from the retrieval loop, see private_gpt.chunks.runtime
+    async_client = AsyncQdrantClient(url=QDRANT_SERVER,port=None)
 else:
-    EMBEDDINGS_MODEL = HuggingFaceHubEmbeddings(model=os.environ['EMBEDDINGS_URL'], huggingfacehub_api_token=os.environ['EMBEDDINGS_API_KEY'])
-    SPLADE_EMBEDDING = HuggingFaceHubEmbeddings(model=os.environ['SPLADE_EMBEDDINGS_URL'], huggingfacehub_api_token=os.environ['SPLADE_EMBEDDINGS_API_KEY'])
+    client = async_client = None
+# Dense and SPLADE encoders, remote inference endpoints or in-process models (EMBEDDINGS_BACKEND)
+EMBEDDINGS_MODEL, EMBEDDINGS_MODEL_ID = create_dense_encoder()
+SPLADE_EMBEDDING, SPLADE_EMBEDDING_ID = create_sparse_encoder()
+
+# Repeated queries are served from the embedding cache instead of a remote round trip
+EMBEDDINGS_MODEL = cached_embeddings(EMBEDDINGS_MODEL, EMBEDDINGS_MODEL_ID)
+SPLADE_EMBEDDING = cached_embeddings(SPLADE_EMBEDDING, SPLADE_EMBEDDING_ID)
 
 REORDER_TOOL = LongContextReorder()
 
+# The primary backend is preferred, pgvector serves when it is failing or (with hedging) slow
+backend_selector = backend_selector_from_env([PRIMARY_BACKEND, "pg_vector"])
+
 extra_retrived = os.getenv(EXTRA_RETRIVED, 0)
 if not extra_retrived.isdigit():
     raise ValueError(f"{EXTRA_RETRIVED} environment variable should be an integer")
 
 extra_retrived = int(extra_retrived)
 
+HYBRID_FUSION_WEIGHTS = get_hybrid_weights()
+HYBRID_FUSION_RRF_K = int(os.getenv(HYBRID_RRF_K, "60"))
+
+# Knowledge bases whose collections matched the query encoders, checked again after the TTL
+verified_collections = LRUCache(maxsize=10000, ttl=float(os.getenv(ENCODER_CHECK_TTL, "300")) or None)
+
 
 def get_splade_values(val: str):
     data_dict=SPLADE_EMBEDDING.embed_documents([val])
@@ -55,41 +76,18 @@ def get_splade_values(val: str):
     return indexes,values
 
 
-def fetch_from_pg_vector(knowledge_base_id, doc_id, chunk_num, chunk_num_range):
-    conn = psycopg2.connect(PG_VECTOR_SERVER)
-    cur = conn.cursor()
-
-    query = f"""
-    SELECT uuid FROM langchain_pg_collection WHERE name = '{knowledge_base_id}'
-    """
-
-    cur.execute(query)
-    uuid = cur.fetchone()[0]
-
-    query = f"""
-        SELECT DISTINCT ON (cmetadata->>'chunk_num') document, cmetadata
-        FROM langchain_pg_embedding
-        WHERE collection_id = '{uuid}'
-          AND cmetadata->>'doc_id' = '{doc_id}'
-          AND (cmetadata->>'chunk_num')::int >= {chunk_num_range[0]}
-          AND (cmetadata->>'chunk_num')::int <= {chunk_num_range[1]}
-          AND (cmetadata->>'chunk_num')::int != {chunk_num}
-        ORDER BY cmetadata->>'chunk_num', (cmetadata->>'chunk_num')::int;
-    """
-    
-    cur.execute(query)
-    results = cur.fetchall()
-
-    cur.close()
-    conn.close()
-
-    return results
+async def aget_splade_values(val: str):
+    data_dict=await SPLADE_EMBEDDING.aembed_documents([val])
+    embedding_arr=data_dict[0]
+    indexes=[i['index'] for i in embedding_arr]
+    values=[i['value'] for i in embedding_arr]
 
+    return indexes,values
 
 
-def get_retrivers(doc_ids, limit, knowledge_base_id, min_score, retriever_type):
+def get_qdrant_filter(doc_ids):
     # Create filter condition for the document IDs
-    qdrant_filter = Filter(
+    return Filter(
         should=[
             FieldCondition(
                 key="metadata.doc_id",  # Field name where document ID is stored
@@ -99,45 +97,96 @@ def get_retrivers(doc_ids, limit, knowledge_base_id, min_score, retriever_type):
             ) for doc_id in doc_ids
         ]
     ) if doc_ids else None
-    pg_vector_filter = {"doc_id":{"in":doc_ids}}
-    sparse_retriever = QdrantSparseVectorRetriever(
-        client=client,
-        collection_name=knowledge_base_id+'_sparse',
-        sparse_vector_name='sparse_vector',
-        sparse_encoder=get_splade_values,
-        k=limit+extra_retrived,
-        filter=qdrant_filter,
-        search_options={'score_threshold':min_score}
-    )
-    Qdrant_Vector_Store = Qdrant(
+
+
+def get_qdrant_vector_store(knowledge_base_id):
+    return retriever_pool.store(("qdrant", knowledge_base_id), lambda: Qdrant(
         client=client,
+        async_client=async_client,
         collection_name=knowledge_base_id,
         embeddings=EMBEDDINGS_MODEL,
-    )
-    Pg_Vector_Store = PGVector(
+    ))
+
+
+def get_pg_vector_store(knowledge_base_id):
+    return retriever_pool.store(("pg_vector", knowledge_base_id), lambda: PGVector(
         connection_string=PG_VECTOR_SERVER,
         embedding_function=EMBEDDINGS_MODEL,
         collection_name=knowledge_base_id
-        )
-    pg_vector_dense_retriever = Pg_Vector_Store.as_retriever(search_kwargs={"filter": pg_vector_filter, "k":10+extra_retrived,"score_threshold":min_score})
-    qdrant_dense_retriever = Qdrant_Vector_Store.as_retriever(k=10+extra_retrived,search_kwargs={"filter": qdrant_filter,"score_threshold":min_score})
+    ))
 
-    qdrant_ensemble_retriever = EnsembleRetriever(
-        retrievers=[sparse_retriever, qdrant_dense_retriever], weights=[0.5, 0.5],k=limit+extra_retrived
-    )
-    pg_vector_ensemble_retriever = EnsembleRetriever(
-        retrievers=[sparse_retriever, pg_vector_dense_retriever], weights=[0.5, 0.5],k=limit+extra_retrived
-    )
 
+def get_local_index(knowledge_base_id):
+    return retriever_pool.store(("local", knowledge_base_id), lambda: open_local_index(knowledge_base_id))
+
+
+def get_sparse_retriever(doc_ids, limit, knowledge_base_id, min_score):
+    key = retriever_key(PRIMARY_BACKEND, knowledge_base_id, "sparse", doc_ids, limit, min_score)
+    if PRIMARY_BACKEND == "local":
+        return retriever_pool.retriever(key, lambda: LocalSparseRetriever(
+            index=get_local_index(knowledge_base_id),
+            sparse_encoder=get_splade_values,
+            async_sparse_encoder=aget_splade_values,
+            k=limit+extra_retrived,
+            doc_ids=doc_ids,
+            score_threshold=min_score
+        ))
+    return retriever_pool.retriever(key, lambda: AsyncQdrantSparseVectorRetriever(
+        client=client,
+        async_client=async_client,
+        collection_name=knowledge_base_id+'_sparse',
+        sparse_vector_name='sparse_vector',
+        sparse_encoder=get_splade_values,
+        async_sparse_encoder=aget_splade_values,
+        k=limit+extra_retrived,
+        filter=get_qdrant_filter(doc_ids),
+        search_options={'score_threshold':min_score}
+    ))
+
+
+def get_dense_retriever(db, doc_ids, limit, knowledge_base_id, min_score):
+    key = retriever_key(db, knowledge_base_id, "dense", doc_ids, limit, min_score)
+    if db == "local":
+        return retriever_pool.retriever(key, lambda: LocalDenseRetriever(
+            index=get_local_index(knowledge_base_id),
+            embeddings=EMBEDDINGS_MODEL,
+            k=10+extra_retrived,
+            doc_ids=doc_ids,
+            score_threshold=min_score
+        ))
+    if db == "qdrant":
+        return retriever_pool.retriever(key, lambda: get_qdrant_vector_store(knowledge_base_id).as_retriever(
+            k=10+extra_retrived, search_kwargs={"filter": get_qdrant_filter(doc_ids), "score_threshold":min_score}
+        ))
+    pg_vector_filter = {"doc_id":{"in":doc_ids}}
+    return retriever_pool.retriever(key, lambda: get_pg_vector_store(knowledge_base_id).as_retriever(
+        search_kwargs={"filter": pg_vector_filter, "k":10+extra_retrived, "score_threshold":min_score}
+    ))
+
+
+def get_retriever(db, doc_ids, limit, knowledge_base_id, min_score, retriever_type):
+    """
+    Return the pooled retriever for a backend ("qdrant", "local" or "pg_vector") and request shape.
+
+    Only the objects the retriever type needs are built, and each one is built once per
+    pool entry instead of once per request.
+    """
     if retriever_type == 'dense':
-        return qdrant_dense_retriever, pg_vector_dense_retriever
+        return get_dense_retriever(db, doc_ids, limit, knowledge_base_id, min_score)
     elif retriever_type == 'sparse':
-        return sparse_retriever, "_"
+        if db == "pg_vector":
+            raise ValueError("Sparse retrieval is not available on pg_vector")
+        return get_sparse_retriever(doc_ids, limit, knowledge_base_id, min_score)
     elif retriever_type == 'ensemble':
-        return qdrant_ensemble_retriever, pg_vector_ensemble_retriever
+        key = retriever_key(db, knowledge_base_id, "ensemble", doc_ids, limit, min_score)
+        return retriever_pool.retriever(key, lambda: HybridRetriever(
+            sparse_retriever=get_sparse_retriever(doc_ids, limit, knowledge_base_id, min_score),
+            dense_retriever=get_dense_retriever(db, doc_ids, limit, knowledge_base_id, min_score),
+            weights=HYBRID_FUSION_WEIGHTS, k=limit+extra_retrived, c=HYBRID_FUSION_RRF_K
+        ))
     else:
         raise ValueError(f"Invalid retriever type: {retriever_type}. Expected 'dense', 'sparse', or 'ensemble'.")
-    
+
 
 
 def get_surrounding_chunks_json(chunks: Dict, target_chunk_number: int, number_of_chunks: int) -> Dict:
@@ -167,105 +216,427 @@ def get_surrounding_chunks_json(chunks: Dict, target_chunk_number: int, number_o
     return result
 
 
-def extract_relevant_chunks(prev_next_chunks_list: List, chunk_num: int, prev_next_chunks: int) -> Dict:  
-    if prev_next_chunks_list:
-        relevant_chunks = [record for record in prev_next_chunks_list if chunk_num - int(prev_next_chunks) <= record['metadata']['chunk_num'] <= chunk_num + int(prev_next_chunks)]
-        # Extract page_content from these chunks
-        extracted_contents = {record['metadata']['chunk_num']: record['page_content'] for record in relevant_chunks}
+def get_neighbor_windows(documents: List[Document], prev_next_chunks: int) -> List:
+    # Collect one (doc_id, first_chunk_num, last_chunk_num) window per distinct hit
+    windows = []
+    for document in documents:
+        chunk_num = document.metadata['chunk_num']
+        window = (document.metadata['doc_id'], chunk_num - int(prev_next_chunks), chunk_num + int(prev_next_chunks))
+        if window not in windows:
+            windows.append(window)
+    return windows
+
+
+async def fetch_neighbor_chunks(windows: List, knowledge_base_id: str, db: str) -> Dict:
+    """
+    Fetch every chunk inside the given windows with a single backend round trip.
+
+    Returns:
+        Dict: The page content of each fetched chunk, keyed by doc_id and then chunk_num.
+    """
+    chunks_by_doc = {}
+    if not windows:
+        return chunks_by_doc
+
+    if db == "local":
+        records = await asyncio.to_thread(get_local_index(knowledge_base_id).neighbors, windows)
+    elif db == "qdrant":
+        scroll_filter = models.Filter(
+            should=[
+                models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="metadata.doc_id",
+                            match=models.MatchValue(value=doc_id),
+                        ),
+                        models.FieldCondition(
+                            key="metadata.chunk_num",
+                            range=models.Range(gte=first_chunk, lte=last_chunk),
+                        ),
+                    ]
+                ) for doc_id, first_chunk, last_chunk in windows
+            ]
+        )
+        page_size = sum(last_chunk - first_chunk + 1 for _, first_chunk, last_chunk in windows)
+        records = []
+        offset = None
+        while True:
+            page, offset = await async_client.scroll(
+                collection_name=knowledge_base_id,
+                scroll_filter=scroll_filter,
+                limit=page_size,
+                offset=offset,
+                with_vectors=False,
+            )
+            records.extend(record.payload for record in page)
+            if offset is None:
+                break
     else:
-        extracted_contents = {}
-    return extracted_contents
+        rows = await pg_vector_client.fetch_chunk_windows(knowledge_base_id, windows)
+        records = [{"page_content": row[0], "metadata": row[1]} for row in rows]
 
+    for record in records:
+        doc_chunks = chunks_by_doc.setdefault(record['metadata']['doc_id'], {})
+        doc_chunks.setdefault(int(record['metadata']['chunk_num']), record['page_content'])
+    return chunks_by_doc
 
 
-def get_surrounding_chunks_content(document: Document, prev_next_chunks: int, knowledge_base_id: str, db: str) -> Dict:
-    # Sort the results by chunk_num
-    doc_id = document.metadata['doc_id']
-    chunk_num = document.metadata['chunk_num']
-    # Define the range to include previous and next chunks
-    chunk_num_range = [chunk_num - int(prev_next_chunks), chunk_num + int(prev_next_chunks)]
+async def get_surrounding_chunks_batch(documents: List[Document], prev_next_chunks: int, knowledge_base_id: str, db: str) -> List[Dict]:
+    """
+    Expand every hit with its previous and next chunks using one batched fetch for all hits.
 
-    # Retrieve adjacent chunks
-    if db == "qdrant":
-        prev_next_chunks_list = client.scroll(
-            collection_name=knowledge_base_id,
-            scroll_filter=models.Filter(
-                must=[
-                    models.FieldCondition(
-                        key="metadata.doc_id",
-                        match=models.MatchValue(value=doc_id),
-                    ),
-                    models.FieldCondition(
-                        key="metadata.chunk_num",
-                        range=models.Range(gte=chunk_num_range[0], lte=chunk_num_range[1]),
-                    ),
-                ],
-                must_not=[
-                    models.FieldCondition(
-                        key="metadata.chunk_num",
-                        match=models.MatchValue(value=chunk_num),
-                    )
-                ]
-            ),
-        )
-        prev_next_chunks_list = [i.payload for i in prev_next_chunks_list[0]]
+    Besides the texts, each entry lists the chunk numbers of the neighbors that were found.
+    """
+    if not int(prev_next_chunks):
+        return [{'previous_chunks': [], 'next_chunks': [], 'previous_chunk_nums': [], 'next_chunk_nums': []} for _ in documents]
+
+    chunks_by_doc = await fetch_neighbor_chunks(get_neighbor_windows(documents, prev_next_chunks), knowledge_base_id, db)
+    surrounding_contents = []
+    for document in documents:
+        chunks = chunks_by_doc.get(document.metadata['doc_id'], {})
+        chunk_num = int(document.metadata['chunk_num'])
+        surrounding_content = get_surrounding_chunks_json(chunks, chunk_num, int(prev_next_chunks))
+        surrounding_content['previous_chunk_nums'] = [i for i in range(chunk_num - int(prev_next_chunks), chunk_num) if i in chunks]
+        surrounding_content['next_chunk_nums'] = [i for i in range(chunk_num + 1, chunk_num + int(prev_next_chunks) + 1) if i in chunks]
+        surrounding_contents.append(surrounding_content)
+    return surrounding_contents
+
+
+def rank_and_reorder(scored_docs: List[Tuple[Document, Optional[float]]], limit) -> List[Tuple[Document, int, Optional[float]]]:
+    """
+    Attach its 1-based rank to every (document, score) pair, reorder with LongContextReorder and cut to the limit.
+
+    Near-duplicate hits are collapsed first, so the limit is filled with distinct chunks and
+    the dropped copies never reach the neighbor expansion.
+    """
+    ranks = {id(document): (rank, score) for rank, (document, score) in enumerate(scored_docs, 1)}
+    scored_docs = near_duplicate_filter.filter(scored_docs)
+    reordered_docs = REORDER_TOOL.transform_documents([document for document, _ in scored_docs])
+    return [(document, *ranks[id(document)]) for document in reordered_docs[:int(limit)]]
+
+
+async def search_backend(db, text, doc_ids, limit, knowledge_base_id, min_score, retriever_type):
+    # Building retrievers can talk to the backends (collection checks), keep it off the loop
+    retriever = await asyncio.to_thread(get_retriever, db, doc_ids, limit, knowledge_base_id, min_score, retriever_type)
+    if isinstance(retriever, HybridRetriever):
+        scored_docs = await retriever.asearch_with_scores(text)
     else:
-        res = fetch_from_pg_vector(knowledge_base_id, doc_id, chunk_num, chunk_num_range)
-        prev_next_chunks_list = []
-        for i in range(len(res)):
-            prev_next_chunks_list.append({"page_content" : res[i][0], "metadata" : res[i][1]})
-    
-    extracted_contents = extract_relevant_chunks(prev_next_chunks_list, chunk_num, prev_next_chunks)
-    surrounding_chunks_json = get_surrounding_chunks_json(extracted_contents, chunk_num, prev_next_chunks)
-    return surrounding_chunks_json
+        scored_docs = [(document, None) for document in await retriever.ainvoke(text)]
+    return rank_and_reorder(scored_docs, limit)
+
+
+def build_result(ranked_docs: List[Tuple[Document, int, Optional[float]]], surrounding_contents: List[Dict], db: str) -> RetrievalResult:
+    return RetrievalResult(
+        backend=db,
+        chunks=[
+            ChunkResult(
+                doc_id=document.metadata['doc_id'],
+                doc_metadata=document.metadata,
+                text=str(document.page_content),
+                previous_texts=surrounding_content['previous_chunks'],
+                next_texts=surrounding_content['next_chunks'],
+                rank=rank,
+                score=score,
+                chunk_num=document.metadata.get('chunk_num'),
+                previous_chunk_nums=surrounding_content['previous_chunk_nums'],
+                next_chunk_nums=surrounding_content['next_chunk_nums']
+            ) for (document, rank, score), surrounding_content in zip(ranked_docs, surrounding_contents)
+        ]
+    )
 
 
-def search_documents(json_input: str) -> str:
-    # Parse the JSON input
-    input_dict = json.loads(json_input)
+async def verify_encoders(knowledge_base_id: str) -> None:
+    """
+    Refuse to search a knowledge base whose vectors come from other models than the query encoders.
+
+    The collections are written by the embedding service, so the models are recorded in the
+    cmetadata of the pgvector collection (embedding_model, sparse_model, embedding_dimension):
+    stamped from EMBEDDINGS_MODEL_NAME and SPLADE_MODEL_NAME when the remote encoders are used,
+    and checked against the local encoders otherwise. The dimension is also read from the stored
+    vectors, the qdrant collection and the local index. Collections that are unreachable are not
+    checked, the search itself reports them.
+
+    Raises:
+        EncoderMismatch: If a recorded model or the vector dimension differs from the query encoders.
+    """
+    if not knowledge_base_id or verified_collections.get(knowledge_base_id):
+        return
+    models = encoder_models()
+    dimension = getattr(EMBEDDINGS_MODEL.embeddings, "dimension", None)
+
+    if PRIMARY_BACKEND == "local":
+        snapshot = (await asyncio.to_thread(get_local_index, knowledge_base_id)).refresh()
+        if snapshot.count:
+            check_encoder(knowledge_base_id, {**snapshot.models, "embedding_dimension": snapshot.dim}, models, dimension)
+    elif dimension:
+        try:
+            vectors = (await async_client.get_collection(knowledge_base_id)).config.params.vectors
+            check_encoder(knowledge_base_id, {"embedding_dimension": getattr(vectors, "size", None)}, models, dimension)
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"Could not read the qdrant collection {knowledge_base_id}: {e}")
 
+    try:
+        collection = await pg_vector_client.collection_embedding(knowledge_base_id)
+    except Exception as e:
+        print(f"Could not read the embedding models of {knowledge_base_id}: {e}")
+        return
+    if collection is None:
+        return
+    metadata, stored_dimension = collection
+    check_encoder(knowledge_base_id, {**metadata, "embedding_dimension": stored_dimension or metadata.get("embedding_dimension")}, models, dimension)
+
+    recorded = {"embedding_dimension": stored_dimension}
+    if get_embeddings_backend() == "remote":
+        recorded.update(models)
+    missing = {key: value for key, value in recorded.items() if value and not metadata.get(key)}
+    if missing:
+        try:
+            await pg_vector_client.update_collection_metadata(knowledge_base_id, missing)
+        except Exception as e:
+            print(f"Could not record the embedding models of {knowledge_base_id}: {e}")
+    verified_collections.set(knowledge_base_id, True)
+
+
+async def retrieve(input_dict: Dict) -> RetrievalResult:
+    """
+    Run a retrieval request on the retrieval loop.
+    """
     # Extract the parameters from the input
     text = input_dict['text']
     knowledge_base_id = input_dict.get('knowledge_base_id')
-    doc_ids = input_dict.get('context_filter', {}).get('doc_ids')
+    doc_ids = (input_dict.get('context_filter') or {}).get('doc_ids')
     limit = input_dict.get('limit', 10)
     prev_next_chunks = input_dict.get('prev_next_chunks', 2)
     min_score = input_dict.get('min_score', 0.0)
     retriever_type = input_dict.get('retriever_type', 'ensemble')
-    
-    main_retriever, fall_back_retriever = get_retrivers(doc_ids,limit,knowledge_base_id,min_score,retriever_type)
-    try:
-        retrived_docs = main_retriever.get_relevant_documents(text)
-        reordered_docs = REORDER_TOOL.transform_documents(retrived_docs)
-        reordered_docs = reordered_docs[:int(limit)]
-        db = "qdrant"
-    except:
-        retrived_docs = fall_back_retriever.get_relevant_documents(text)
-        reordered_docs = REORDER_TOOL.transform_documents(retrived_docs)
-        reordered_docs = reordered_docs[:int(limit)]
-        db = "pg_vector"
-
-    data = []
-    for result in reordered_docs:
-        surrounding_content = get_surrounding_chunks_content(result,prev_next_chunks,knowledge_base_id,db)
-        data.append({
-                "object": {},
-                "document": {
-                    "object": {},
-                    "doc_id": result.metadata['doc_id'],
-                    "doc_metadata": result.metadata
-                },
-                "text": str(result.page_content),
-                "previous_texts": surrounding_content['previous_chunks'],
-                "next_texts": surrounding_content['next_chunks']
-            })
-
-    # Create the JSON response
-    response_dict = {
-        "object": {},
-        "model": {},
-        "data": data
-    }
-    # Convert the response to a JSON string
-    json_response = json.dumps(response_dict)
-    return json_response
+
+    # Identical requests against an unchanged knowledge base are served from the result cache
+    cache_key = result_cache.key(input_dict)
+    cached_response = result_cache.get(cache_key)
+    if cached_response is not None:
+        return cached_response
+
+    await verify_encoders(knowledge_base_id)
+    calls = {PRIMARY_BACKEND: lambda: search_backend(PRIMARY_BACKEND, text, doc_ids, limit, knowledge_base_id, min_score, retriever_type)}
+    if retriever_type != 'sparse':
+        calls["pg_vector"] = lambda: search_backend("pg_vector", text, doc_ids, limit, knowledge_base_id, min_score, retriever_type)
+    ranked_docs, db = await backend_selector.call(calls)
+
+    surrounding_contents = await get_surrounding_chunks_batch([document for document, _, _ in ranked_docs],prev_next_chunks,knowledge_base_id,db)
+
+    result = build_result(ranked_docs, surrounding_contents, db)
+    result_cache.set(cache_key, result)
+    return result
+
+
+async def embed_queries(texts: List[str], retriever_type: str):
+    """
+    Encode every query of a batch with one call per encoder the retriever type needs.
+
+    Returns:
+        Tuple: The dense vectors and the SPLADE (indices, values) pairs, None when not needed.
+    """
+    async def no_vectors():
+        return None
+
+    dense_vectors, splade_vectors = await asyncio.gather(
+        EMBEDDINGS_MODEL.aembed_queries(texts) if retriever_type != 'sparse' else no_vectors(),
+        SPLADE_EMBEDDING.aembed_documents(texts) if retriever_type != 'dense' else no_vectors(),
+    )
+    if splade_vectors is not None:
+        splade_vectors = [
+            ([i['index'] for i in embedding_arr], [i['value'] for i in embedding_arr])
+            for embedding_arr in splade_vectors
+        ]
+    return dense_vectors, splade_vectors
+
+
+async def dense_search_batch(db, vectors, doc_ids, limit, knowledge_base_id, min_score) -> List[List[Document]]:
+    # The search parameters come from the pooled retriever, so batched and single searches agree
+    retriever = await asyncio.to_thread(get_dense_retriever, db, doc_ids, limit, knowledge_base_id, min_score)
+    if db == "local":
+        hits = await asyncio.to_thread(lambda: [
+            retriever.index.dense_search(vector, retriever.k, retriever.doc_ids, retriever.score_threshold)
+            for vector in vectors
+        ])
+        return [[to_document(payload) for payload, _ in query_hits] for query_hits in hits]
+
+    search_kwargs = retriever.search_kwargs
+    if db == "qdrant":
+        store = retriever.vectorstore
+        results = await async_client.search_batch(knowledge_base_id, requests=[
+            models.SearchRequest(
+                vector=models.NamedVector(name=store.vector_name, vector=vector) if store.vector_name else vector,
+                filter=search_kwargs.get("filter"),
+                limit=search_kwargs.get("k", 4),
+                score_threshold=search_kwargs.get("score_threshold"),
+                with_payload=True,
+            ) for vector in vectors
+        ])
+        return [
+            [Qdrant._document_from_scored_point(point, knowledge_base_id, store.content_payload_key, store.metadata_payload_key) for point in points]
+            for points in results
+        ]
+
+    rows = await pg_vector_client.dense_search_batch(knowledge_base_id, vectors, search_kwargs.get("k", 4), doc_ids)
+    return [
+        [to_document({"page_content": document, "metadata": cmetadata}) for document, cmetadata, _ in query_rows]
+        for query_rows in rows
+    ]
+
+
+async def sparse_search_batch(splade_vectors, doc_ids, limit, knowledge_base_id, min_score) -> List[List[Document]]:
+    retriever = await asyncio.to_thread(get_sparse_retriever, doc_ids, limit, knowledge_base_id, min_score)
+    if PRIMARY_BACKEND == "local":
+        hits = await asyncio.to_thread(lambda: [
+            retriever.index.sparse_search(indices, values, retriever.k, retriever.doc_ids, retriever.score_threshold)
+            for indices, values in splade_vectors
+        ])
+        return [[to_document(payload) for payload, _ in query_hits] for query_hits in hits]
+
+    results = await async_client.search_batch(retriever.collection_name, requests=[
+        models.SearchRequest(
+            vector=models.NamedSparseVector(
+                name=retriever.sparse_vector_name,
+                vector=models.SparseVector(indices=indices, values=values),
+            ),
+            filter=retriever.filter,
+            limit=retriever.k,
+            with_payload=True,
+            **retriever.search_options,
+        ) for indices, values in splade_vectors
+    ])
+    return [
+        [Qdrant._document_from_scored_point(point, retriever.collection_name, retriever.content_payload_key, retriever.metadata_payload_key) for point in points]
+        for points in results
+    ]
+
+
+async def search_backend_batch(db, dense_vectors, splade_vectors, doc_ids, limit, knowledge_base_id, min_score, retriever_type) -> List[List[Tuple]]:
+    """
+    Search a backend for every query of a batch, one search_batch call per collection.
+
+    Like get_retriever, sparse results always come from the primary backend and ensemble
+    results are fused with weighted RRF.
+    """
+    if retriever_type not in ('dense', 'sparse', 'ensemble'):
+        raise ValueError(f"Invalid retriever type: {retriever_type}. Expected 'dense', 'sparse', or 'ensemble'.")
+    if retriever_type == 'sparse' and db == "pg_vector":
+        raise ValueError("Sparse retrieval is not available on pg_vector")
+
+    if retriever_type == 'dense':
+        doc_lists = await dense_search_batch(db, dense_vectors, doc_ids, limit, knowledge_base_id, min_score)
+        scored_lists = [[(document, None) for document in docs] for docs in doc_lists]
+    elif retriever_type == 'sparse':
+        doc_lists = await sparse_search_batch(splade_vectors, doc_ids, limit, knowledge_base_id, min_score)
+        scored_lists = [[(document, None) for document in docs] for docs in doc_lists]
+    else:
+        sparse_lists, dense_lists = await asyncio.gather(
+            sparse_search_batch(splade_vectors, doc_ids, limit, knowledge_base_id, min_score),
+            dense_search_batch(db, dense_vectors, doc_ids, limit, knowledge_base_id, min_score),
+        )
+        scored_lists = [
+            weighted_rrf([sparse_docs, dense_docs], HYBRID_FUSION_WEIGHTS, limit+extra_retrived, HYBRID_FUSION_RRF_K)
+            for sparse_docs, dense_docs in zip(sparse_lists, dense_lists)
+        ]
+    return [rank_and_reorder(scored_docs, limit) for scored_docs in scored_lists]
+
+
+async def retrieve_batch(input_dict: Dict) -> List[RetrievalResult]:
+    """
+    Run a batch of retrieval requests sharing every parameter but the query text.
+
+    The queries missing from the result cache are embedded with one call per encoder, searched
+    with one batched call per collection and expanded with one neighbor fetch for all hits.
+
+    Returns:
+        List[RetrievalResult]: One result per query text, in request order.
+    """
+    texts = input_dict['texts']
+    knowledge_base_id = input_dict.get('knowledge_base_id')
+    doc_ids = (input_dict.get('context_filter') or {}).get('doc_ids')
+    limit = input_dict.get('limit', 10)
+    prev_next_chunks = input_dict.get('prev_next_chunks', 2)
+    min_score = input_dict.get('min_score', 0.0)
+    retriever_type = input_dict.get('retriever_type', 'ensemble')
+
+    shared = {key: value for key, value in input_dict.items() if key != 'texts'}
+    cache_keys = [result_cache.key({**shared, 'text': text}) for text in texts]
+    responses = [result_cache.get(cache_key) for cache_key in cache_keys]
+    # Duplicated texts are only searched once
+    missing = list(dict.fromkeys(text for text, response in zip(texts, responses) if response is None))
+
+    if missing:
+        await verify_encoders(knowledge_base_id)
+        dense_vectors, splade_vectors = await embed_queries(missing, retriever_type)
+
+        calls = {PRIMARY_BACKEND: lambda: search_backend_batch(PRIMARY_BACKEND, dense_vectors, splade_vectors, doc_ids, limit, knowledge_base_id, min_score, retriever_type)}
+        if retriever_type != 'sparse':
+            calls["pg_vector"] = lambda: search_backend_batch("pg_vector", dense_vectors, splade_vectors, doc_ids, limit, knowledge_base_id, min_score, retriever_type)
+        ranked_lists, db = await backend_selector.call(calls)
+
+        all_docs = [document for ranked_docs in ranked_lists for document, _, _ in ranked_docs]
+        all_surrounding = await get_surrounding_chunks_batch(all_docs, prev_next_chunks, knowledge_base_id, db)
+
+        computed = {}
+        offset = 0
+        for text, ranked_docs in zip(missing, ranked_lists):
+            computed[text] = build_result(ranked_docs, all_surrounding[offset:offset + len(ranked_docs)], db)
+            offset += len(ranked_docs)
+        for i, text in enumerate(texts):
+            if responses[i] is None:
+                responses[i] = computed[text]
+                result_cache.set(cache_keys[i], responses[i])
+
+    return responses
+
+
+async def asearch(request: Dict) -> RetrievalResult:
+    """
+    Retrieve the context chunks of a request from async code.
+
+    The retrieval runs on the retrieval loop, the caller's loop stays free meanwhile.
+
+    Args:
+        request (Dict): The ContextChunksRequest fields.
+
+    Returns:
+        RetrievalResult: The retrieved chunks, possibly shared with the result cache.
+    """
+    return await run_async(retrieve(request))
+
+
+def search(request: Dict) -> RetrievalResult:
+    """
+    Retrieve the context chunks of a request from synchronous code.
+    """
+    return run_sync(retrieve(request))
+
+
+async def asearch_batch(request: Dict) -> List[RetrievalResult]:
+    return await run_async(retrieve_batch(request))
+
+
+def search_batch(request: Dict) -> List[RetrievalResult]:
+    return run_sync(retrieve_batch(request))
+
+
+# JSON string wrappers, for callers outside the process boundary
+async def asearch_documents(json_input: str) -> str:
+    result = await asearch(orjson.loads(json_input))
+    return orjson.dumps(result.to_dict()).decode()
+
+
+def search_documents(json_input: str) -> str:
+    return orjson.dumps(search(orjson.loads(json_input)).to_dict()).decode()
+
+
+async def asearch_documents_batch(json_input: str) -> str:
+    results = await asearch_batch(orjson.loads(json_input))
+    return orjson.dumps(batch_to_dict(results)).decode()
+
+
+def search_documents_batch(json_input: str) -> str:
+    return orjson.dumps(batch_to_dict(search_batch(orjson.loads(json_input)))).decode()
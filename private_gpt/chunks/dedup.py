@@ -0,0 +1,104 @@
+from hashlib import blake2b
+from typing import Any, List, Optional, Tuple
+from langchain_core.documents import Document
+from private_gpt.cache import LRUCache
+import os
+import re
+
+# Constants
+CHUNK_DEDUP_DISTANCE = "CHUNK_DEDUP_DISTANCE"
+CHUNK_DEDUP_CACHE_SIZE = "CHUNK_DEDUP_CACHE_SIZE"
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+
+
+def simhash(text: str) -> int:
+    """
+    Compute the 64-bit SimHash of a text over its lowercased word 3-shingles.
+
+    Texts sharing most of their shingles get signatures that differ in few bits.
+    """
+    words = re.findall(r"\w+", text.lower())
+    shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))]
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        value = int.from_bytes(blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+class NearDuplicateFilter:
+    """
+    Collapse near-duplicate retrieval hits, such as a boilerplate page ingested from several
+    files or overlapping chunks, keeping the best-scoring one.
+
+    Hits are compared by the Hamming distance of their SimHash signatures. Signatures are
+    cached per chunk id (doc_id and chunk_num), so a chunk is only shingled the first time it
+    is retrieved.
+
+    Attributes:
+        max_distance (Optional[int]): The largest Hamming distance between duplicates, None to disable the filter.
+        signatures (LRUCache): The cached signatures.
+        collapsed (int): The number of hits dropped as duplicates.
+    """
+
+    def __init__(self, max_distance: Optional[int] = 6, cache_size: int = 100000):
+        self.max_distance = max_distance
+        self.signatures = LRUCache(maxsize=cache_size)
+        self.collapsed = 0
+
+    def signature(self, document: Document) -> int:
+        doc_id = document.metadata.get('doc_id')
+        chunk_num = document.metadata.get('chunk_num')
+        if doc_id is None or chunk_num is None:
+            return simhash(document.page_content)
+        return self.signatures.get_or_create((doc_id, chunk_num), lambda: simhash(document.page_content))
+
+    def filter(self, scored_docs: List[Tuple[Document, Any]]) -> List[Tuple[Document, Any]]:
+        """
+        Drop the near-duplicates of a ranked list of (document, score) pairs.
+
+        Each group of duplicates is represented by its highest scoring hit, or its best ranked
+        one when there are no scores, at the position of the group's first hit.
+        """
+        if self.max_distance is None or len(scored_docs) < 2:
+            return scored_docs
+
+        kept = []
+        kept_signatures = []
+        for document, score in scored_docs:
+            signature = self.signature(document)
+            for i, kept_signature in enumerate(kept_signatures):
+                if bin(signature ^ kept_signature).count("1") <= self.max_distance:
+                    kept_score = kept[i][1]
+                    if score is not None and (kept_score is None or score > kept_score):
+                        kept[i] = (document, score)
+                    self.collapsed += 1
+                    break
+            else:
+                kept.append((document, score))
+                kept_signatures.append(signature)
+        return kept
+
+    def stats(self) -> dict:
+        return {
+            "max_distance": self.max_distance,
+            "signatures": self.signatures.stats(),
+            "collapsed": self.collapsed,
+        }
+
+
+def near_duplicate_filter_from_env() -> NearDuplicateFilter:
+    """
+    Build the filter from CHUNK_DEDUP_DISTANCE (default 6, negative to disable) and CHUNK_DEDUP_CACHE_SIZE.
+    """
+    max_distance = int(os.getenv(CHUNK_DEDUP_DISTANCE, "6"))
+    return NearDuplicateFilter(
+        max_distance=max_distance if max_distance >= 0 else None,
+        cache_size=int(os.getenv(CHUNK_DEDUP_CACHE_SIZE, "100000")),
+    )
+
+
+near_duplicate_filter = near_duplicate_filter_from_env()
@@ -0,0 +1,147 @@
+from array import array
+from hashlib import sha256
+from typing import Any, List, Optional
+from langchain_core.embeddings import Embeddings
+from private_gpt.cache import LRUCache, SqliteCache
+import os
+import unicodedata
+
+# Constants
+EMBEDDING_CACHE_SIZE = "EMBEDDING_CACHE_SIZE"
+EMBEDDING_CACHE_TTL = "EMBEDDING_CACHE_TTL"
+EMBEDDING_CACHE_PATH = "EMBEDDING_CACHE_PATH"
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a query so trivially different spellings of the same text share a cache entry.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def _pack(value: Any) -> Any:
+    # Dense vectors are kept as float32 arrays, which is ~8x smaller than a list of python floats
+    if isinstance(value, list) and value and isinstance(value[0], float):
+        return array("f", value)
+    return value
+
+
+def _unpack(value: Any) -> Any:
+    if isinstance(value, array):
+        return value.tolist()
+    return value
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wrap an Embeddings model with a bounded in-memory LRU and an optional sqlite tier.
+
+    Entries are keyed by model id, call kind (query or documents) and normalized text, so the
+    same wrapper works for dense vectors and for the SPLADE index/value payloads.
+
+    Attributes:
+        embeddings (Embeddings): The wrapped encoder.
+        model_id (str): The identifier of the wrapped model, part of every cache key.
+        memory (LRUCache): The in-memory tier.
+        disk (Optional[SqliteCache]): The persistent tier, if configured.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_id: str, memory: LRUCache, disk: Optional[SqliteCache] = None):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.memory = memory
+        self.disk = disk
+
+    def _key(self, kind: str, text: str) -> str:
+        return sha256(f"{self.model_id}\x00{kind}\x00{normalize_text(text)}".encode()).hexdigest()
+
+    def _lookup(self, key: str) -> Any:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, _pack(value))
+        return _unpack(value)
+
+    def _store(self, key: str, value: Any) -> None:
+        self.memory.set(key, _pack(value))
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def embed_documents(self, texts: List[str]) -> List[Any]:
+        keys = [self._key("documents", text) for text in texts]
+        results = [self._lookup(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            # Encode every miss in a single call to the underlying model
+            embedded = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, value in zip(missing, embedded):
+                self._store(keys[i], value)
+                results[i] = value
+        return results
+
+    def embed_query(self, text: str) -> Any:
+        key = self._key("query", text)
+        value = self._lookup(key)
+        if value is None:
+            value = self.embeddings.embed_query(text)
+            self._store(key, value)
+        return value
+
+    async def aembed_documents(self, texts: List[str]) -> List[Any]:
+        keys = [self._key("documents", text) for text in texts]
+        results = [self._lookup(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            embedded = await self.embeddings.aembed_documents([texts[i] for i in missing])
+            for i, value in zip(missing, embedded):
+                self._store(keys[i], value)
+                results[i] = value
+        return results
+
+    async def aembed_query(self, text: str) -> Any:
+        key = self._key("query", text)
+        value = self._lookup(key)
+        if value is None:
+            value = await self.embeddings.aembed_query(text)
+            self._store(key, value)
+        return value
+
+    async def aembed_queries(self, texts: List[str]) -> List[Any]:
+        """
+        Embed several queries, sharing cache entries with aembed_query.
+
+        The misses are encoded with a single aembed_documents call. The encoders used here embed
+        queries and documents the same way, so this only saves round trips.
+        """
+        keys = [self._key("query", text) for text in texts]
+        results = [self._lookup(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            embedded = await self.embeddings.aembed_documents([texts[i] for i in missing])
+            for i, value in zip(missing, embedded):
+                self._store(keys[i], value)
+                results[i] = value
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_id,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+            "encoder": self.embeddings.stats() if hasattr(self.embeddings, "stats") else None,
+        }
+
+
+def cached_embeddings(embeddings: Embeddings, model_id: str) -> CachedEmbeddings:
+    """
+    Wrap an encoder with the cache tiers configured through the environment.
+
+    EMBEDDING_CACHE_SIZE bounds the in-memory tier per model, EMBEDDING_CACHE_TTL (seconds, 0 for
+    no expiry) applies to both tiers and EMBEDDING_CACHE_PATH enables the sqlite tier.
+    """
+    ttl = float(os.getenv(EMBEDDING_CACHE_TTL, "0")) or None
+    memory = LRUCache(maxsize=int(os.getenv(EMBEDDING_CACHE_SIZE, "2048")), ttl=ttl)
+    disk_path = os.getenv(EMBEDDING_CACHE_PATH)
+    disk = SqliteCache(disk_path, ttl=ttl, table="embeddings") if disk_path else None
+    return CachedEmbeddings(embeddings, model_id, memory, disk)
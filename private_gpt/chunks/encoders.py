@@ -0,0 +1,293 @@
+from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_community.embeddings import HuggingFaceHubEmbeddings
+from langchain_core.embeddings import Embeddings
+import asyncio
+import os
+
+# Constants
+EMBEDDINGS_BACKEND = "EMBEDDINGS_BACKEND"
+EMBEDDINGS_URL = "EMBEDDINGS_URL"
+SPLADE_EMBEDDINGS_URL = "SPLADE_EMBEDDINGS_URL"
+LOCAL_EMBEDDINGS_MODEL = "LOCAL_EMBEDDINGS_MODEL"
+LOCAL_SPLADE_MODEL = "LOCAL_SPLADE_MODEL"
+LOCAL_EMBEDDINGS_RUNTIME = "LOCAL_EMBEDDINGS_RUNTIME"
+LOCAL_EMBEDDINGS_ONNX_FILE = "LOCAL_EMBEDDINGS_ONNX_FILE"
+LOCAL_ENCODER_QUANTIZE = "LOCAL_ENCODER_QUANTIZE"
+LOCAL_ENCODER_THREADS = "LOCAL_ENCODER_THREADS"
+LOCAL_ENCODER_MAX_BATCH = "LOCAL_ENCODER_MAX_BATCH"
+LOCAL_ENCODER_MAX_WAIT_MS = "LOCAL_ENCODER_MAX_WAIT_MS"
+# The models behind the remote endpoints, recorded on the collections they embed
+EMBEDDINGS_MODEL_NAME = "EMBEDDINGS_MODEL_NAME"
+SPLADE_MODEL_NAME = "SPLADE_MODEL_NAME"
+
+DEFAULT_LOCAL_EMBEDDINGS_MODEL = "BAAI/bge-small-en-v1.5"
+DEFAULT_LOCAL_SPLADE_MODEL = "naver/splade-cocondenser-ensembledistil"
+
+
+class EncoderMismatch(ValueError):
+    """
+    Raised when the query encoders are not the models that embedded a collection.
+    """
+
+
+class BatchedEncoder(Embeddings):
+    """
+    Base class for in-process encoders, subclasses implement encode.
+
+    Synchronous calls encode in the calling thread. Async calls are queued and coalesced into
+    dynamic batches: the first query waits up to max_wait_ms for up to max_batch_size others,
+    then the whole batch is encoded in one model call on a thread pool, off the event loop.
+
+    Attributes:
+        max_batch_size (int): The largest batch handed to the model.
+        max_wait_ms (float): How long a batch stays open for more queries.
+        executor (ThreadPoolExecutor): The threads running model calls.
+    """
+
+    def __init__(self, max_batch_size: int = 32, max_wait_ms: float = 2.0, threads: int = 1):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="encoder")
+        self._queue = None
+        self._worker = None
+        self.batches = 0
+        self.batched_texts = 0
+
+    @abstractmethod
+    def encode(self, texts: List[str]) -> List[Any]:
+        """
+        Encode a batch of texts in one model call.
+        """
+
+    def embed_documents(self, texts: List[str]) -> List[Any]:
+        return self.encode(texts)
+
+    def embed_query(self, text: str) -> Any:
+        return self.encode([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[Any]:
+        return list(await asyncio.gather(*[self._submit(text) for text in texts]))
+
+    async def aembed_query(self, text: str) -> Any:
+        return await self._submit(text)
+
+    async def _submit(self, text: str) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run_batches())
+        future = loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def _run_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batches += 1
+            self.batched_texts += len(batch)
+            try:
+                vectors = await loop.run_in_executor(self.executor, self.encode, [text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "texts": self.batched_texts,
+            "mean_batch_size": self.batched_texts / self.batches if self.batches else 0.0,
+        }
+
+
+def _quantize(model):
+    # Dynamic int8 quantization of the linear layers, a cheap CPU speedup for BERT-sized encoders
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class LocalDenseEncoder(BatchedEncoder):
+    """
+    Dense encoder running a sentence-transformers model on the local CPU.
+
+    The model runs on torch (optionally int8 quantized) or on ONNX Runtime, in which case
+    onnx_file can point at a quantized export such as "onnx/model_qint8_avx512.onnx".
+    """
+
+    def __init__(self, model_name: str, runtime: str = "torch", onnx_file: str = None, quantize: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError(
+                "The local embeddings backend needs sentence-transformers. "
+                "Please install it with `pip install sentence-transformers` (and `optimum[onnxruntime]` for onnx)."
+            )
+        if runtime == "onnx":
+            model_kwargs = {"file_name": onnx_file} if onnx_file else None
+            self.model = SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+        else:
+            self.model = SentenceTransformer(model_name, device="cpu")
+            if quantize:
+                self.model = _quantize(self.model)
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True).tolist()
+
+
+class LocalSpladeEncoder(BatchedEncoder):
+    """
+    SPLADE encoder running a masked language model on the local CPU.
+
+    Term weights are max-pooled log(1 + relu(logits)) over the tokens, the same transformation
+    the SPLADE inference endpoints apply, and are returned in the same [{"index", "value"}] form.
+    """
+
+    def __init__(self, model_name: str, quantize: bool = False, max_length: int = 512, **kwargs):
+        super().__init__(**kwargs)
+        try:
+            import torch
+            from transformers import AutoModelForMaskedLM, AutoTokenizer
+        except ImportError:
+            raise ImportError(
+                "The local SPLADE backend needs transformers and torch. "
+                "Please install them with `pip install transformers torch`."
+            )
+        self.torch = torch
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForMaskedLM.from_pretrained(model_name).eval()
+        if quantize:
+            self.model = _quantize(self.model)
+
+    def encode(self, texts: List[str]) -> List[List[Dict[str, Any]]]:
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="pt")
+        with self.torch.inference_mode():
+            logits = self.model(**tokens).logits
+            weights = self.torch.log1p(self.torch.relu(logits)) * tokens["attention_mask"].unsqueeze(-1)
+            weights = weights.max(dim=1).values
+        results = []
+        for row in weights:
+            indices = row.nonzero().squeeze(1).tolist()
+            values = row[indices].tolist()
+            results.append([{"index": index, "value": value} for index, value in zip(indices, values)])
+        return results
+
+
+def _local_encoder_options() -> Dict[str, Any]:
+    return {
+        "max_batch_size": int(os.getenv(LOCAL_ENCODER_MAX_BATCH, "32")),
+        "max_wait_ms": float(os.getenv(LOCAL_ENCODER_MAX_WAIT_MS, "2")),
+        "threads": int(os.getenv(LOCAL_ENCODER_THREADS, "1")),
+    }
+
+
+def _remote_encoder(url_variable: str, api_key_variable: str) -> Tuple[Embeddings, str]:
+    url = os.getenv(url_variable)
+    if not url:
+        raise ValueError(f"{url_variable} environment variable is not set")
+    # API keys are only sent when both encoders have one configured
+    if not os.environ.get('EMBEDDINGS_API_KEY') or not os.environ.get('SPLADE_EMBEDDINGS_API_KEY'):
+        return HuggingFaceHubEmbeddings(model=url), url
+    return HuggingFaceHubEmbeddings(model=url, huggingfacehub_api_token=os.environ[api_key_variable]), url
+
+
+def get_embeddings_backend() -> str:
+    backend = os.getenv(EMBEDDINGS_BACKEND, "remote")
+    if backend not in ("remote", "local"):
+        raise ValueError(f"Invalid {EMBEDDINGS_BACKEND}: {backend}. Expected 'remote' or 'local'.")
+    return backend
+
+
+def create_dense_encoder() -> Tuple[Embeddings, str]:
+    """
+    Build the dense query encoder selected by EMBEDDINGS_BACKEND.
+
+    Returns:
+        Tuple[Embeddings, str]: The encoder and the model id used in cache keys.
+    """
+    if get_embeddings_backend() == "local":
+        model_name = os.getenv(LOCAL_EMBEDDINGS_MODEL, DEFAULT_LOCAL_EMBEDDINGS_MODEL)
+        encoder = LocalDenseEncoder(
+            model_name,
+            runtime=os.getenv(LOCAL_EMBEDDINGS_RUNTIME, "torch"),
+            onnx_file=os.getenv(LOCAL_EMBEDDINGS_ONNX_FILE),
+            quantize=os.getenv(LOCAL_ENCODER_QUANTIZE, "false").lower() in ("1", "true", "yes"),
+            **_local_encoder_options()
+        )
+        return encoder, f"local:{model_name}"
+    return _remote_encoder(EMBEDDINGS_URL, "EMBEDDINGS_API_KEY")
+
+
+def create_sparse_encoder() -> Tuple[Embeddings, str]:
+    """
+    Build the SPLADE query encoder selected by EMBEDDINGS_BACKEND.
+
+    Returns:
+        Tuple[Embeddings, str]: The encoder and the model id used in cache keys.
+    """
+    if get_embeddings_backend() == "local":
+        model_name = os.getenv(LOCAL_SPLADE_MODEL, DEFAULT_LOCAL_SPLADE_MODEL)
+        encoder = LocalSpladeEncoder(
+            model_name,
+            quantize=os.getenv(LOCAL_ENCODER_QUANTIZE, "false").lower() in ("1", "true", "yes"),
+            **_local_encoder_options()
+        )
+        return encoder, f"local:{model_name}"
+    return _remote_encoder(SPLADE_EMBEDDINGS_URL, "SPLADE_EMBEDDINGS_API_KEY")
+
+
+def encoder_models() -> Dict[str, Optional[str]]:
+    """
+    Return the names of the dense and SPLADE models the queries are encoded with, None when a
+    remote endpoint's model is not declared (EMBEDDINGS_MODEL_NAME, SPLADE_MODEL_NAME).
+    """
+    if get_embeddings_backend() == "local":
+        return {
+            "embedding_model": os.getenv(LOCAL_EMBEDDINGS_MODEL, DEFAULT_LOCAL_EMBEDDINGS_MODEL),
+            "sparse_model": os.getenv(LOCAL_SPLADE_MODEL, DEFAULT_LOCAL_SPLADE_MODEL),
+        }
+    return {"embedding_model": os.getenv(EMBEDDINGS_MODEL_NAME), "sparse_model": os.getenv(SPLADE_MODEL_NAME)}
+
+
+def check_encoder(collection: str, stored: Dict, models: Dict[str, Optional[str]], dimension: Optional[int]) -> None:
+    """
+    Compare the query encoders with the models and dimension recorded for a collection.
+
+    Args:
+        collection (str): The collection, for the error message.
+        stored (Dict): The embedding_model, sparse_model and embedding_dimension recorded for the collection.
+        models (Dict[str, Optional[str]]): The query encoder models, see encoder_models.
+        dimension (Optional[int]): The dimension of the dense query encoder, None when not known.
+
+    Raises:
+        EncoderMismatch: If a recorded model or the dimension differs, searching would compare vectors of different spaces.
+    """
+    for key in ("embedding_model", "sparse_model"):
+        if stored.get(key) and models.get(key) and stored[key] != models[key]:
+            raise EncoderMismatch(f"Collection {collection} was embedded with {stored[key]}, the queries are encoded with {models[key]}")
+    if stored.get("embedding_dimension") and dimension and int(stored["embedding_dimension"]) != dimension:
+        raise EncoderMismatch(
+            f"Collection {collection} holds {stored['embedding_dimension']} dimensional vectors, the query encoder produces {dimension}"
+        )
@@ -0,0 +1,106 @@
+from typing import Hashable, List, Tuple
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+import asyncio
+import heapq
+import numpy as np
+import os
+
+# Constants
+HYBRID_WEIGHTS = "HYBRID_WEIGHTS"
+HYBRID_RRF_K = "HYBRID_RRF_K"
+
+
+def get_hybrid_weights() -> List[float]:
+    """
+    Read the (sparse, dense) fusion weights from HYBRID_WEIGHTS, e.g. "0.3,0.7".
+    """
+    weights = [float(weight) for weight in os.getenv(HYBRID_WEIGHTS, "0.5,0.5").split(",")]
+    if len(weights) != 2:
+        raise ValueError(f"{HYBRID_WEIGHTS} environment variable should hold two comma separated weights")
+    return weights
+
+
+def document_key(document: Document) -> Hashable:
+    # The sparse and dense collections hold separate copies of a chunk, identify it by doc and position
+    metadata = document.metadata
+    if 'doc_id' in metadata and 'chunk_num' in metadata:
+        return (metadata['doc_id'], metadata['chunk_num'])
+    return document.page_content
+
+
+def weighted_rrf(ranked_lists: List[List[Document]], weights: List[float], k: int, c: int = 60) -> List[Tuple[Document, float]]:
+    """
+    Fuse ranked result lists with weighted reciprocal rank fusion.
+
+    Each document scores sum(weight / (c + rank)) over the lists it appears in. Scores are
+    accumulated with numpy and the top k are selected with a heap.
+
+    Returns:
+        List[Tuple[Document, float]]: The k best documents with their fused score, best first.
+    """
+    positions = {}
+    documents = []
+    indices = []
+    contributions = []
+    for ranked, weight in zip(ranked_lists, weights):
+        list_indices = np.empty(len(ranked), dtype=np.int64)
+        for rank, document in enumerate(ranked):
+            key = document_key(document)
+            if key not in positions:
+                positions[key] = len(documents)
+                documents.append(document)
+            list_indices[rank] = positions[key]
+        indices.append(list_indices)
+        contributions.append(weight / (c + np.arange(1, len(ranked) + 1, dtype=np.float64)))
+
+    if not documents:
+        return []
+    scores = np.zeros(len(documents), dtype=np.float64)
+    np.add.at(scores, np.concatenate(indices), np.concatenate(contributions))
+    top = heapq.nlargest(k, range(len(documents)), key=scores.__getitem__)
+    return [(documents[i], float(scores[i])) for i in top]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Hybrid sparse + dense retriever with weighted RRF fusion.
+
+    Unlike langchain's EnsembleRetriever, the async path runs both retrievers concurrently, so
+    SPLADE encoding, dense embedding and both vector searches overlap and the latency is close
+    to the slower of the two rather than their sum.
+
+    Attributes:
+        sparse_retriever (BaseRetriever): The sparse (SPLADE) retriever.
+        dense_retriever (BaseRetriever): The dense retriever.
+        weights (List[float]): The (sparse, dense) fusion weights.
+        k (int): The number of fused documents to return.
+        c (int): The RRF rank constant.
+    """
+    sparse_retriever: BaseRetriever
+    dense_retriever: BaseRetriever
+    weights: List[float]
+    k: int
+    c: int = 60
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        ranked_lists = [
+            self.sparse_retriever.invoke(query),
+            self.dense_retriever.invoke(query),
+        ]
+        return [document for document, _ in weighted_rrf(ranked_lists, self.weights, self.k, self.c)]
+
+    async def asearch_with_scores(self, query: str) -> List[Tuple[Document, float]]:
+        ranked_lists = await asyncio.gather(
+            self.sparse_retriever.ainvoke(query),
+            self.dense_retriever.ainvoke(query),
+        )
+        return weighted_rrf(ranked_lists, self.weights, self.k, self.c)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [document for document, _ in await self.asearch_with_scores(query)]
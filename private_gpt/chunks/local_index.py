@@ -0,0 +1,330 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from private_gpt.chunks.encoders import check_encoder
+import asyncio
+import json
+import numpy as np
+import os
+import threading
+
+# Constants
+LOCAL_INDEX_DIR = "LOCAL_INDEX_DIR"
+LOCAL_INDEX_DTYPE = "LOCAL_INDEX_DTYPE"
+
+
+class IndexSnapshot:
+    """
+    The arrays of a LocalVectorIndex at one point in time.
+
+    A snapshot is never modified, add() builds a new one and swaps it in with a single
+    assignment, so a search started on a snapshot sees consistent arrays until it ends.
+    """
+
+    def __init__(self, dim: int, dtype: str, count: int, vocab_size: int, dense, payloads: List[Dict],
+                 sparse_indptr, sparse_indices, sparse_values, models: Optional[Dict[str, str]] = None):
+        self.dim = dim
+        self.dtype = dtype
+        self.count = count
+        self.vocab_size = vocab_size
+        self.dense = dense
+        self.payloads = payloads
+        self.sparse_indptr = sparse_indptr
+        self.sparse_indices = sparse_indices
+        self.sparse_values = sparse_values
+        self.models = models or {}
+        self.sparse_rows = np.repeat(np.arange(len(sparse_indptr) - 1), np.diff(sparse_indptr))
+        self.doc_ids = np.array([payload["metadata"].get("doc_id") for payload in payloads], dtype=object)
+        self.chunk_nums = np.array([int(payload["metadata"].get("chunk_num", -1)) for payload in payloads], dtype=np.int64)
+
+
+class LocalVectorIndex:
+    """
+    An embedded, file-backed vector index for one knowledge base.
+
+    Dense vectors are L2-normalized and stored row-major in a memory-mapped float32 or float16
+    file, so a search is one exact inner-product pass. SPLADE vectors are stored as CSR arrays.
+    Payloads use the same {"page_content", "metadata"} layout as the qdrant collections, and
+    metadata.doc_id / metadata.chunk_num are indexed for filtering and neighbor lookups.
+
+    The index is filled by private_gpt.chunks.local_sync from the chunks stored in pgvector.
+    Every file is rewritten to a temporary file and renamed into place, meta.json last, and
+    readers only use the first count rows of each file, so a search never sees a half written
+    index. Searches reload the index when another process has changed meta.json.
+
+    Layout of the index directory:
+        meta.json            dim, dtype, count, SPLADE vocabulary size and the encoder models
+        dense.bin            count x dim vectors
+        payloads.jsonl       one payload per row
+        sparse_*.npy         CSR indptr, indices and values of the SPLADE vectors
+
+    Attributes:
+        path (str): The index directory.
+        dtype (str): "float32" or "float16", the storage type of the dense vectors.
+        snapshot (IndexSnapshot): The current arrays of the index.
+    """
+
+    def __init__(self, path: str, dtype: str = "float32"):
+        self.path = path
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        self._meta_mtime = None
+        os.makedirs(path, exist_ok=True)
+        self.snapshot = self._load()
+
+    @property
+    def count(self) -> int:
+        return self.snapshot.count
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self) -> IndexSnapshot:
+        meta = {"dim": 0, "dtype": self.dtype, "count": 0, "vocab_size": 0}
+        meta_path = self._file("meta.json")
+        if os.path.exists(meta_path):
+            self._meta_mtime = os.stat(meta_path).st_mtime_ns
+            with open(meta_path) as f:
+                meta = json.load(f)
+        dim, dtype, count = meta["dim"], meta["dtype"], meta["count"]
+        self.dtype = dtype
+
+        # The files may already hold rows of a newer add whose meta.json is not written yet
+        dense = np.memmap(self._file("dense.bin"), dtype=dtype, mode="r", shape=(count, dim)) \
+            if count and dim else np.zeros((0, dim), dtype=dtype)
+        payloads = []
+        if count:
+            with open(self._file("payloads.jsonl")) as f:
+                payloads = [json.loads(line) for line, _ in zip(f, range(count))]
+        if count and os.path.exists(self._file("sparse_indptr.npy")):
+            sparse_indptr = np.load(self._file("sparse_indptr.npy"))[:count + 1]
+            size = int(sparse_indptr[-1])
+            sparse_indices = np.load(self._file("sparse_indices.npy"), mmap_mode="r")[:size]
+            sparse_values = np.load(self._file("sparse_values.npy"), mmap_mode="r")[:size]
+        else:
+            sparse_indptr = np.zeros(count + 1, dtype=np.int64)
+            sparse_indices = np.zeros(0, dtype=np.int32)
+            sparse_values = np.zeros(0, dtype=np.float32)
+        return IndexSnapshot(dim, dtype, count, meta["vocab_size"], dense, payloads,
+                             sparse_indptr, sparse_indices, sparse_values, meta.get("models"))
+
+    def refresh(self) -> IndexSnapshot:
+        """
+        Return the current snapshot, reloading it first if meta.json changed on disk.
+        """
+        try:
+            mtime = os.stat(self._file("meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            return self.snapshot
+        if mtime != self._meta_mtime:
+            with self._lock:
+                if mtime != self._meta_mtime:
+                    self.snapshot = self._load()
+        return self.snapshot
+
+    def _replace(self, name: str, write: Callable) -> None:
+        tmp_path = self._file(f"{name}.tmp")
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, self._file(name))
+
+    def indexed_chunks(self) -> set:
+        snapshot = self.refresh()
+        return set(zip(snapshot.doc_ids.tolist(), snapshot.chunk_nums.tolist()))
+
+    def add(self, texts: List[str], metadatas: List[Dict], dense_vectors: List[List[float]],
+            sparse_vectors: Optional[List[Tuple[List[int], List[float]]]] = None,
+            models: Optional[Dict[str, str]] = None) -> int:
+        """
+        Append chunks to the index and persist them. Chunks already in the index, by doc_id and
+        chunk_num, are skipped.
+
+        Args:
+            texts (List[str]): The chunk texts.
+            metadatas (List[Dict]): The chunk metadata, with doc_id and chunk_num.
+            dense_vectors (List[List[float]]): The dense embedding of each chunk.
+            sparse_vectors (Optional[List[Tuple[List[int], List[float]]]]): The SPLADE (indices, values) of each chunk.
+            models (Optional[Dict[str, str]]): The embedding_model and sparse_model the vectors were encoded with.
+
+        Returns:
+            int: The number of chunks added.
+
+        Raises:
+            EncoderMismatch: If the index already holds vectors of other models or dimension.
+        """
+        if sparse_vectors is None:
+            sparse_vectors = [([], [])] * len(texts)
+
+        with self._lock:
+            snapshot = self._load()
+            indexed = set(zip(snapshot.doc_ids.tolist(), snapshot.chunk_nums.tolist()))
+            rows = [
+                i for i, metadata in enumerate(metadatas)
+                if (metadata.get("doc_id"), int(metadata.get("chunk_num", -1))) not in indexed
+            ]
+            if not rows:
+                self.snapshot = snapshot
+                return 0
+
+            vectors = np.asarray([dense_vectors[i] for i in rows], dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            if snapshot.count:
+                check_encoder(self.path, {**snapshot.models, "embedding_dimension": snapshot.dim}, models or {}, vectors.shape[1])
+
+            def write_dense(f):
+                f.write(np.asarray(snapshot.dense).tobytes())
+                f.write(vectors.astype(snapshot.dtype).tobytes())
+
+            def write_payloads(f):
+                for payload in snapshot.payloads:
+                    f.write((json.dumps(payload) + "\n").encode())
+                for i in rows:
+                    f.write((json.dumps({"page_content": texts[i], "metadata": metadatas[i]}) + "\n").encode())
+
+            lengths = [len(sparse_vectors[i][0]) for i in rows]
+            indptr = np.concatenate([snapshot.sparse_indptr, snapshot.sparse_indptr[-1] + np.cumsum(lengths, dtype=np.int64)])
+            indices = np.concatenate([np.asarray(snapshot.sparse_indices)] + [np.asarray(sparse_vectors[i][0], dtype=np.int32) for i in rows])
+            values = np.concatenate([np.asarray(snapshot.sparse_values)] + [np.asarray(sparse_vectors[i][1], dtype=np.float32) for i in rows])
+
+            self._replace("dense.bin", write_dense)
+            self._replace("payloads.jsonl", write_payloads)
+            self._replace("sparse_indptr.npy", lambda f: np.save(f, indptr))
+            self._replace("sparse_indices.npy", lambda f: np.save(f, indices))
+            self._replace("sparse_values.npy", lambda f: np.save(f, values))
+            meta = {
+                "dim": int(vectors.shape[1]),
+                "dtype": snapshot.dtype,
+                "count": snapshot.count + len(rows),
+                "vocab_size": int(max(snapshot.vocab_size, int(indices.max()) + 1 if len(indices) else 0)),
+                "models": {**snapshot.models, **{key: value for key, value in (models or {}).items() if value}},
+            }
+            self._replace("meta.json", lambda f: f.write(json.dumps(meta).encode()))
+            self.snapshot = self._load()
+            return len(rows)
+
+    def _top_k(self, snapshot: IndexSnapshot, scores: np.ndarray, k: int, doc_ids: Optional[List[str]],
+               score_threshold: Optional[float]) -> List[Tuple[Dict, float]]:
+        if doc_ids:
+            scores = np.where(np.isin(snapshot.doc_ids, doc_ids), scores, -np.inf)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (snapshot.payloads[i], float(scores[i])) for i in top
+            if scores[i] != -np.inf and (score_threshold is None or scores[i] >= score_threshold)
+        ]
+
+    def dense_search(self, vector: List[float], k: int, doc_ids: Optional[List[str]] = None,
+                     score_threshold: Optional[float] = None) -> List[Tuple[Dict, float]]:
+        snapshot = self.refresh()
+        if not snapshot.count:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = np.asarray(snapshot.dense @ query, dtype=np.float32)
+        return self._top_k(snapshot, scores, k, doc_ids, score_threshold)
+
+    def sparse_search(self, indices: List[int], values: List[float], k: int, doc_ids: Optional[List[str]] = None,
+                      score_threshold: Optional[float] = None) -> List[Tuple[Dict, float]]:
+        snapshot = self.refresh()
+        if not snapshot.count:
+            return []
+        query = np.zeros(snapshot.vocab_size, dtype=np.float32)
+        indices = np.asarray(indices, dtype=np.int64)
+        known = indices < snapshot.vocab_size
+        query[indices[known]] = np.asarray(values, dtype=np.float32)[known]
+        contributions = snapshot.sparse_values * query[snapshot.sparse_indices]
+        scores = np.bincount(snapshot.sparse_rows, weights=contributions, minlength=snapshot.count).astype(np.float32)
+        # Like a sparse qdrant search, only chunks sharing a term with the query are candidates
+        scores = np.where(scores > 0, scores, -np.inf)
+        return self._top_k(snapshot, scores, k, doc_ids, score_threshold)
+
+    def neighbors(self, windows: List[Tuple[str, int, int]]) -> List[Dict]:
+        """
+        Return the payloads of every chunk inside the (doc_id, first_chunk_num, last_chunk_num) windows.
+        """
+        snapshot = self.refresh()
+        records = []
+        for doc_id, first_chunk, last_chunk in windows:
+            mask = (snapshot.doc_ids == doc_id) & (snapshot.chunk_nums >= first_chunk) & (snapshot.chunk_nums <= last_chunk)
+            records.extend(snapshot.payloads[i] for i in np.flatnonzero(mask))
+        return records
+
+
+def to_document(payload: Dict) -> Document:
+    return Document(page_content=payload["page_content"], metadata=dict(payload["metadata"]))
+
+
+class LocalDenseRetriever(BaseRetriever):
+    """
+    Dense retriever over a LocalVectorIndex.
+
+    Attributes:
+        index (Any): The LocalVectorIndex to search.
+        embeddings (Any): The query encoder.
+        k (int): The number of documents to return.
+        doc_ids (Optional[List[str]]): The doc ids to restrict the search to.
+        score_threshold (Optional[float]): The minimum cosine similarity of a result.
+    """
+    index: Any
+    embeddings: Any
+    k: int
+    doc_ids: Optional[List[str]] = None
+    score_threshold: Optional[float] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        hits = self.index.dense_search(self.embeddings.embed_query(query), self.k, self.doc_ids, self.score_threshold)
+        return [to_document(payload) for payload, _ in hits]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = await self.embeddings.aembed_query(query)
+        hits = await asyncio.to_thread(self.index.dense_search, vector, self.k, self.doc_ids, self.score_threshold)
+        return [to_document(payload) for payload, _ in hits]
+
+
+class LocalSparseRetriever(BaseRetriever):
+    """
+    SPLADE retriever over a LocalVectorIndex.
+
+    Attributes:
+        index (Any): The LocalVectorIndex to search.
+        sparse_encoder (Callable): Function returning (indices, values) for a query.
+        async_sparse_encoder (Callable): Coroutine function returning (indices, values) for a query.
+        k (int): The number of documents to return.
+        doc_ids (Optional[List[str]]): The doc ids to restrict the search to.
+        score_threshold (Optional[float]): The minimum dot product of a result.
+    """
+    index: Any
+    sparse_encoder: Callable
+    async_sparse_encoder: Callable
+    k: int
+    doc_ids: Optional[List[str]] = None
+    score_threshold: Optional[float] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        indices, values = self.sparse_encoder(query)
+        hits = self.index.sparse_search(indices, values, self.k, self.doc_ids, self.score_threshold)
+        return [to_document(payload) for payload, _ in hits]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        indices, values = await self.async_sparse_encoder(query)
+        hits = await asyncio.to_thread(self.index.sparse_search, indices, values, self.k, self.doc_ids, self.score_threshold)
+        return [to_document(payload) for payload, _ in hits]
+
+
+def open_local_index(knowledge_base_id: str) -> LocalVectorIndex:
+    return LocalVectorIndex(
+        os.path.join(os.getenv(LOCAL_INDEX_DIR, "local_index"), knowledge_base_id),
+        dtype=os.getenv(LOCAL_INDEX_DTYPE, "float32"),
+    )
@@ -0,0 +1,74 @@
+from typing import List
+from private_gpt.chunks.chunks_service import EMBEDDINGS_MODEL, SPLADE_EMBEDDING, get_local_index
+from private_gpt.chunks.encoders import encoder_models
+from private_gpt.chunks.pg_vector_client import pg_vector_client
+from private_gpt.chunks.runtime import run_sync
+from private_gpt.db.crud import list_ingested_docs
+from private_gpt.db.database import SessionLocal
+import argparse
+import asyncio
+
+# Texts sent to the encoders per call
+ENCODE_BATCH_SIZE = 64
+# Documents whose chunks are fetched from pgvector per query
+FETCH_BATCH_SIZE = 100
+MAX_CHUNK_NUM = 2 ** 31 - 1
+
+
+async def index_documents(knowledge_base_id: str, doc_ids: List[str]) -> int:
+    """
+    Copy the chunks of documents from pgvector into the local index of their knowledge base.
+
+    The embedding service writes chunks to qdrant and pgvector only, so with VECTOR_BACKEND=local
+    the chunk texts are read back from pgvector and encoded with the configured query encoders,
+    which keeps the local index in the vector space the queries are encoded in. The encoder models
+    are recorded in the index, which refuses vectors of other models. Chunks already in the
+    index are skipped. Runs on the retrieval loop, like every pgvector query.
+
+    Returns:
+        int: The number of chunks added.
+    """
+    index = get_local_index(knowledge_base_id)
+    indexed = await asyncio.to_thread(index.indexed_chunks)
+    rows = await pg_vector_client.fetch_chunk_windows(knowledge_base_id, [(doc_id, 0, MAX_CHUNK_NUM) for doc_id in doc_ids])
+    rows = [(text, metadata) for text, metadata in rows if (metadata.get("doc_id"), int(metadata.get("chunk_num", -1))) not in indexed]
+
+    models = encoder_models()
+    added = 0
+    for i in range(0, len(rows), ENCODE_BATCH_SIZE):
+        texts = [text for text, _ in rows[i:i + ENCODE_BATCH_SIZE]]
+        metadatas = [metadata for _, metadata in rows[i:i + ENCODE_BATCH_SIZE]]
+        # The raw encoders, chunk texts would only crowd the query caches out
+        dense_vectors, splade_vectors = await asyncio.gather(
+            EMBEDDINGS_MODEL.embeddings.aembed_documents(texts),
+            SPLADE_EMBEDDING.embeddings.aembed_documents(texts),
+        )
+        sparse_vectors = [([term['index'] for term in embedding_arr], [term['value'] for term in embedding_arr]) for embedding_arr in splade_vectors]
+        added += await asyncio.to_thread(index.add, texts, metadatas, dense_vectors, sparse_vectors, models)
+    return added
+
+
+async def sync_knowledge_base(knowledge_base_id: str) -> int:
+    """
+    Add every embedded document of a knowledge base missing from its local index.
+
+    Returns:
+        int: The number of chunks added.
+    """
+    db = SessionLocal()
+    try:
+        doc_ids = [str(document.id) for document in list_ingested_docs(db, knowledge_base_id) if document.is_embedded]
+    finally:
+        db.close()
+    added = 0
+    for i in range(0, len(doc_ids), FETCH_BATCH_SIZE):
+        added += await index_documents(knowledge_base_id, doc_ids[i:i + FETCH_BATCH_SIZE])
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or catch up the local vector index of knowledge bases from pgvector.")
+    parser.add_argument("knowledge_base_ids", nargs="+", help="The knowledge bases to index.")
+    args = parser.parse_args()
+    for knowledge_base_id in args.knowledge_base_ids:
+        print(f"{knowledge_base_id}: {run_sync(sync_knowledge_base(knowledge_base_id))} chunks added")
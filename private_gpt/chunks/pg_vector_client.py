@@ -0,0 +1,188 @@
+from typing import Dict, List, Optional, Tuple
+from psycopg_pool import AsyncConnectionPool
+from private_gpt.cache import LRUCache
+import asyncio
+import orjson
+import os
+import re
+
+# Constants
+PG_VECTOR_POOL_MIN_SIZE = "PG_VECTOR_POOL_MIN_SIZE"
+PG_VECTOR_POOL_MAX_SIZE = "PG_VECTOR_POOL_MAX_SIZE"
+PG_VECTOR_POOL_TIMEOUT = "PG_VECTOR_POOL_TIMEOUT"
+PG_VECTOR_COLLECTION_TTL = "PG_VECTOR_COLLECTION_TTL"
+
+COLLECTION_UUID_QUERY = "SELECT uuid FROM langchain_pg_collection WHERE name = %s"
+
+COLLECTION_EMBEDDING_QUERY = """
+    SELECT c.cmetadata, (SELECT vector_dims(e.embedding) FROM langchain_pg_embedding e WHERE e.collection_id = c.uuid LIMIT 1)
+    FROM langchain_pg_collection c
+    WHERE c.name = %s
+"""
+
+UPDATE_COLLECTION_METADATA_QUERY = """
+    UPDATE langchain_pg_collection SET cmetadata = COALESCE(cmetadata::jsonb, '{}'::jsonb) || %s::jsonb WHERE name = %s
+"""
+
+CHUNK_WINDOWS_QUERY = """
+    SELECT DISTINCT ON (e.cmetadata->>'doc_id', (e.cmetadata->>'chunk_num')::int) e.document, e.cmetadata
+    FROM langchain_pg_embedding e
+    JOIN unnest(%s::text[], %s::int[], %s::int[]) AS w(doc_id, first_chunk, last_chunk)
+      ON e.cmetadata->>'doc_id' = w.doc_id
+     AND (e.cmetadata->>'chunk_num')::int BETWEEN w.first_chunk AND w.last_chunk
+    WHERE e.collection_id = %s
+    ORDER BY e.cmetadata->>'doc_id', (e.cmetadata->>'chunk_num')::int
+"""
+
+DENSE_SEARCH_BATCH_QUERY = """
+    SELECT q.ord, e.document, e.cmetadata, e.distance
+    FROM unnest(%s::text[]) WITH ORDINALITY AS q(embedding, ord)
+    CROSS JOIN LATERAL (
+        SELECT document, cmetadata, embedding <=> q.embedding::vector AS distance
+        FROM langchain_pg_embedding
+        WHERE collection_id = %s
+          AND (%s::text[] IS NULL OR cmetadata->>'doc_id' = ANY(%s::text[]))
+        ORDER BY embedding <=> q.embedding::vector
+        LIMIT %s
+    ) e
+    ORDER BY q.ord, e.distance
+"""
+
+
+def to_conninfo(connection_string: str) -> str:
+    # PGVector takes an SQLAlchemy URL, libpq does not understand the "+driver" part of the scheme
+    return re.sub(r"^postgres(ql)?\+\w+://", "postgresql://", connection_string or "")
+
+
+class PgVectorClient:
+    """
+    Pooled, parameterized, asynchronous access to the tables maintained by langchain's PGVector store.
+
+    Connections come from a psycopg AsyncConnectionPool and every statement is sent with a fixed text
+    and bound parameters, so the server can reuse prepared plans. Collection name to uuid lookups
+    are cached for collection_ttl seconds, so a collection dropped and recreated by the
+    embedding service is picked up again.
+
+    Attributes:
+        pool (AsyncConnectionPool): The connection pool, opened on first use on the retrieval loop.
+        collections (LRUCache): The cached collection name to uuid map.
+    """
+
+    def __init__(self, connection_string: str, min_size: int = 1, max_size: int = 10, timeout: float = 10.0,
+                 collection_ttl: Optional[float] = 300.0):
+        self.pool = AsyncConnectionPool(to_conninfo(connection_string), min_size=min_size, max_size=max_size, timeout=timeout, open=False)
+        self.collections = LRUCache(maxsize=10000, ttl=collection_ttl)
+        self._lock = None
+        self._opened = False
+
+    async def _open(self) -> AsyncConnectionPool:
+        if not self._opened:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if not self._opened:
+                    await self.pool.open()
+                    self._opened = True
+        return self.pool
+
+    async def collection_uuid(self, cur, name: str) -> Optional[str]:
+        uuid = self.collections.get(name)
+        if uuid is None:
+            await cur.execute(COLLECTION_UUID_QUERY, (name,), prepare=True)
+            row = await cur.fetchone()
+            if row is None:
+                return None
+            uuid = row[0]
+            self.collections.set(name, uuid)
+        return uuid
+
+    async def fetch_chunk_windows(self, knowledge_base_id: str, windows: List[Tuple[str, int, int]]) -> List[Tuple]:
+        """
+        Fetch the chunks of every (doc_id, first_chunk_num, last_chunk_num) window in one query.
+
+        Returns:
+            List[Tuple]: (document, cmetadata) rows, one per distinct doc_id and chunk_num.
+        """
+        pool = await self._open()
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                uuid = await self.collection_uuid(cur, knowledge_base_id)
+                if uuid is None:
+                    raise ValueError(f"Collection {knowledge_base_id} does not exist in pg_vector")
+                await cur.execute(CHUNK_WINDOWS_QUERY, (
+                    [window[0] for window in windows],
+                    [window[1] for window in windows],
+                    [window[2] for window in windows],
+                    uuid
+                ), prepare=True)
+                return await cur.fetchall()
+
+    async def collection_embedding(self, name: str) -> Optional[Tuple[Dict, Optional[int]]]:
+        """
+        Return the cmetadata of a collection and the dimension of its stored vectors, None for
+        an empty collection, or None if the collection does not exist.
+        """
+        pool = await self._open()
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(COLLECTION_EMBEDDING_QUERY, (name,), prepare=True)
+                row = await cur.fetchone()
+        if row is None:
+            return None
+        return dict(row[0] or {}), row[1]
+
+    async def update_collection_metadata(self, name: str, metadata: Dict) -> None:
+        """
+        Merge keys into the cmetadata of a collection.
+        """
+        pool = await self._open()
+        async with pool.connection() as conn:
+            await conn.execute(UPDATE_COLLECTION_METADATA_QUERY, (orjson.dumps(metadata).decode(), name), prepare=True)
+
+    async def dense_search_batch(self, knowledge_base_id: str, vectors: List[List[float]], k: int,
+                                 doc_ids: Optional[List[str]] = None) -> List[List[Tuple]]:
+        """
+        Run a cosine distance search for every query vector in one query.
+
+        Returns:
+            List[List[Tuple]]: For each vector, in order, its k closest (document, cmetadata, distance) rows.
+        """
+        pool = await self._open()
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                uuid = await self.collection_uuid(cur, knowledge_base_id)
+                if uuid is None:
+                    raise ValueError(f"Collection {knowledge_base_id} does not exist in pg_vector")
+                await cur.execute(DENSE_SEARCH_BATCH_QUERY, (
+                    ["[" + ",".join(map(str, vector)) + "]" for vector in vectors],
+                    uuid,
+                    doc_ids or None,
+                    doc_ids or None,
+                    k
+                ), prepare=True)
+                rows = await cur.fetchall()
+
+        results = [[] for _ in vectors]
+        for position, document, cmetadata, distance in rows:
+            results[position - 1].append((document, cmetadata, distance))
+        return results
+
+    def stats(self) -> dict:
+        stats = self.pool.get_stats() if self._opened else {}
+        in_use = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+        return {
+            "pool": stats,
+            "in_use": in_use,
+            "saturation": in_use / self.pool.max_size if self.pool.max_size else 0.0,
+            "requests_waiting": stats.get("requests_waiting", 0),
+            "cached_collections": len(self.collections),
+        }
+
+
+pg_vector_client = PgVectorClient(
+    os.getenv("CONNECTION_STRING"),
+    min_size=int(os.getenv(PG_VECTOR_POOL_MIN_SIZE, "1")),
+    max_size=int(os.getenv(PG_VECTOR_POOL_MAX_SIZE, "10")),
+    timeout=float(os.getenv(PG_VECTOR_POOL_TIMEOUT, "10")),
+    collection_ttl=float(os.getenv(PG_VECTOR_COLLECTION_TTL, "300")) or None,
+)
@@ -0,0 +1,72 @@
+from typing import Any, Dict, Optional, Tuple
+from private_gpt.cache import LRUCache
+import os
+import threading
+
+# Constants
+RESULT_CACHE_SIZE = "RESULT_CACHE_SIZE"
+RESULT_CACHE_TTL = "RESULT_CACHE_TTL"
+
+
+class ResultCache:
+    """
+    A cache of retrieval responses, invalidated per knowledge base by a generation counter.
+
+    Every cache key embeds the current generation of its knowledge base. Ingesting, embedding
+    or deleting a document bumps the generation, so entries computed before the change can no
+    longer be hit and simply age out of the LRU.
+
+    The counters live in the process: with several workers a bump is only seen by the worker
+    that handled the ingest call, so RESULT_CACHE_TTL bounds how long other workers may serve
+    results computed before the change.
+
+    Attributes:
+        cache (LRUCache): The cached responses.
+        generations (Dict[str, int]): The current generation of each knowledge base.
+        invalidations (int): The number of generation bumps.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 300):
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.generations: Dict[str, int] = {}
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def bump(self, knowledge_base_id: Any) -> None:
+        knowledge_base_id = str(knowledge_base_id)
+        with self._lock:
+            self.generations[knowledge_base_id] = self.generations.get(knowledge_base_id, 0) + 1
+            self.invalidations += 1
+
+    def key(self, input_dict: Dict) -> Tuple:
+        knowledge_base_id = str(input_dict.get('knowledge_base_id'))
+        doc_ids = (input_dict.get('context_filter') or {}).get('doc_ids')
+        return (
+            knowledge_base_id,
+            self.generations.get(knowledge_base_id, 0),
+            input_dict['text'],
+            tuple(sorted(doc_ids)) if doc_ids else None,
+            input_dict.get('limit', 10),
+            input_dict.get('prev_next_chunks', 2),
+            input_dict.get('min_score', 0.0),
+            input_dict.get('retriever_type', 'ensemble'),
+        )
+
+    def get(self, key: Tuple) -> Any:
+        return self.cache.get(key)
+
+    def set(self, key: Tuple, value: Any) -> None:
+        self.cache.set(key, value)
+
+    def stats(self) -> dict:
+        return {
+            **self.cache.stats(),
+            "knowledge_bases": len(self.generations),
+            "invalidations": self.invalidations,
+        }
+
+
+result_cache = ResultCache(
+    maxsize=int(os.getenv(RESULT_CACHE_SIZE, "1024")),
+    ttl=float(os.getenv(RESULT_CACHE_TTL, "300")) or None,
+)
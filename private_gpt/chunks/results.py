@@ -0,0 +1,78 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+@dataclass
+class ChunkResult:
+    """
+    A retrieved chunk with its neighbors.
+
+    Attributes:
+        doc_id (str): The id of the document the chunk belongs to.
+        doc_metadata (Dict): The chunk metadata as stored in the vector store.
+        text (str): The chunk text.
+        previous_texts (List[str]): The texts of the chunks before it.
+        next_texts (List[str]): The texts of the chunks after it.
+        rank (int): The 1-based position of the chunk in the retriever ranking, before reordering.
+        score (Optional[float]): The fused RRF score for ensemble retrieval, None otherwise.
+        chunk_num (Optional[int]): The position of the chunk in its document.
+        previous_chunk_nums (List[int]): The positions of the previous_texts chunks.
+        next_chunk_nums (List[int]): The positions of the next_texts chunks.
+    """
+    doc_id: str
+    doc_metadata: Dict
+    text: str
+    previous_texts: List[str] = field(default_factory=list)
+    next_texts: List[str] = field(default_factory=list)
+    rank: int = 0
+    score: Optional[float] = None
+    chunk_num: Optional[int] = None
+    previous_chunk_nums: List[int] = field(default_factory=list)
+    next_chunk_nums: List[int] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        # The wire format of private_gpt.chunks.schemas.Chunk
+        return {
+            "object": {},
+            "document": {
+                "object": {},
+                "doc_id": self.doc_id,
+                "doc_metadata": self.doc_metadata
+            },
+            "text": self.text,
+            "previous_texts": self.previous_texts,
+            "next_texts": self.next_texts
+        }
+
+
+@dataclass
+class RetrievalResult:
+    """
+    The outcome of one retrieval request.
+
+    Results may be shared through the result cache and must be treated as read-only.
+
+    Attributes:
+        backend (str): The backend that served the request.
+        chunks (List[ChunkResult]): The retrieved chunks, in response order.
+    """
+    backend: str
+    chunks: List[ChunkResult] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        # The wire format of private_gpt.chunks.schemas.ContextChunksResponse
+        return {
+            "object": {},
+            "model": {},
+            "backend": self.backend,
+            "data": [chunk.to_dict() for chunk in self.chunks]
+        }
+
+
+def batch_to_dict(results: List[RetrievalResult]) -> Dict:
+    # The wire format of private_gpt.chunks.schemas.ContextChunksBatchResponse
+    return {
+        "object": {},
+        "model": {},
+        "data": [result.to_dict() for result in results]
+    }
@@ -0,0 +1,53 @@
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+from private_gpt.cache import LRUCache
+import os
+
+RETRIEVER_POOL_SIZE = "RETRIEVER_POOL_SIZE"
+RETRIEVER_POOL_TTL = "RETRIEVER_POOL_TTL"
+
+
+def retriever_key(db: str, knowledge_base_id: str, retriever_type: str, doc_ids: Optional[List[str]], limit: int, min_score: float) -> Tuple:
+    """
+    Build the pool key for a retriever.
+
+    Everything baked into the retriever objects is part of the key: the backend, the
+    knowledge base, the retriever type and the filter shape (doc ids, k and score threshold).
+    """
+    doc_filter = tuple(sorted(doc_ids)) if doc_ids else None
+    return (db, knowledge_base_id, retriever_type, doc_filter, int(limit), float(min_score or 0.0))
+
+
+class RetrieverPool:
+    """
+    A registry of reusable retrieval objects with LRU/TTL eviction.
+
+    Vector stores are pooled per knowledge base, since their construction is the expensive part
+    (PGVector checks or creates its tables and collection row). Retrievers are pooled per
+    retriever key, since they carry the filter and k for a given request shape.
+
+    Attributes:
+        stores (LRUCache): The vector stores keyed by (backend, knowledge_base_id).
+        retrievers (LRUCache): The retrievers keyed by retriever_key().
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = 600):
+        self.stores = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.retrievers = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def store(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        return self.stores.get_or_create(key, factory)
+
+    def retriever(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        return self.retrievers.get_or_create(key, factory)
+
+    def stats(self) -> dict:
+        return {
+            "stores": self.stores.stats(),
+            "retrievers": self.retrievers.stats(),
+        }
+
+
+retriever_pool = RetrieverPool(
+    maxsize=int(os.getenv(RETRIEVER_POOL_SIZE, "256")),
+    ttl=float(os.getenv(RETRIEVER_POOL_TTL, "600")) or None,
+)
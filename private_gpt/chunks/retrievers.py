@@ -0,0 +1,50 @@
+from typing import Any, Awaitable, Callable, List, Tuple
+from langchain_community.retrievers import QdrantSparseVectorRetriever
+from langchain_community.vectorstores import Qdrant
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from qdrant_client import models
+
+
+class AsyncQdrantSparseVectorRetriever(QdrantSparseVectorRetriever):
+    """
+    QdrantSparseVectorRetriever with a native async path.
+
+    langchain's retriever only has a synchronous implementation, so its async calls fall back to
+    a thread. This one encodes the query with an async encoder and searches with the async
+    qdrant client.
+
+    Attributes:
+        async_client (Any): The AsyncQdrantClient used for async searches.
+        async_sparse_encoder (Callable): Coroutine function returning (indices, values) for a query.
+    """
+    async_client: Any
+    async_sparse_encoder: Callable[[str], Awaitable[Tuple[List[int], List[float]]]]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        query_indices, query_values = await self.async_sparse_encoder(query)
+        results = await self.async_client.search(
+            self.collection_name,
+            query_filter=self.filter,
+            query_vector=models.NamedSparseVector(
+                name=self.sparse_vector_name,
+                vector=models.SparseVector(
+                    indices=query_indices,
+                    values=query_values,
+                ),
+            ),
+            limit=self.k,
+            with_vectors=False,
+            **self.search_options,
+        )
+        return [
+            Qdrant._document_from_scored_point(
+                point,
+                self.collection_name,
+                self.content_payload_key,
+                self.metadata_payload_key,
+            )
+            for point in results
+        ]
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+from typing import Any, Coroutine
+
+_loop = None
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the retrieval event loop, starting its thread on first use.
+
+    All async retrieval clients (qdrant, pg pool, embedding HTTP sessions) are bound to the loop
+    they are first used on, so every retrieval coroutine runs on this single loop no matter
+    whether it was started from the uvicorn loop or from synchronous code.
+    """
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="retrieval-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+async def run_async(coro: Coroutine) -> Any:
+    """
+    Await a coroutine on the retrieval loop without blocking the caller's loop.
+    """
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, get_loop()))
+
+
+def run_sync(coro: Coroutine) -> Any:
+    """
+    Run a coroutine on the retrieval loop and block the calling thread until it finishes.
+    """
+    loop = get_loop()
+    if threading.current_thread().name == "retrieval-loop":
+        coro.close()
+        raise RuntimeError("run_sync cannot be called from the retrieval loop, await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Literal, Optional, List
 
 class ContextFilter(BaseModel):
     doc_ids: Optional[List[str]] = Field(None)
@@ -11,6 +11,16 @@ class ContextChunksRequest(BaseModel):
     limit: Optional[int] = Field(10)
     prev_next_chunks: Optional[int] = Field(2)
     min_score: Optional[float] = Field(0.0)
+    retriever_type: Literal["ensemble", "dense", "sparse"] = Field("ensemble")
+
+class ContextChunksBatchRequest(BaseModel):
+    texts: List[str]
+    knowledge_base_id: Optional[str] = Field(None)
+    context_filter: Optional[ContextFilter] = Field(None)
+    limit: Optional[int] = Field(10)
+    prev_next_chunks: Optional[int] = Field(2)
+    min_score: Optional[float] = Field(0.0)
+    retriever_type: Literal["ensemble", "dense", "sparse"] = Field("ensemble")
 
 class Document(BaseModel):
     object: dict = Field({})
@@ -28,4 +38,10 @@ class Chunk(BaseModel):
 class ContextChunksResponse(BaseModel):
     object: dict = Field({})
     model: dict = Field({})
+    backend: Optional[str] = Field(None)
     data: List[Chunk] = Field([])
+
+class ContextChunksBatchResponse(BaseModel):
+    object: dict = Field({})
+    model: dict = Field({})
+    data: List[ContextChunksResponse] = Field([])
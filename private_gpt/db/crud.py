@@ -3,10 +3,10 @@ from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from .models import Document, KnowledgeBase
 from datetime import datetime
 import uuid
-from typing import Optional
+from typing import Dict, List, Optional
 
 
-def create_document(db: Session, file_name: str, doc_id: str, knowledge_base_id: str, cloud_type: str):
+def create_document(db: Session, file_name: str, doc_id: str, knowledge_base_id: str, cloud_type: str, content_hash: Optional[str] = None):
     document = Document(
         id=doc_id,
         knowledge_base_id=knowledge_base_id,
@@ -14,18 +14,76 @@ def create_document(db: Session, file_name: str, doc_id: str, knowledge_base_id:
         created_at=datetime.now(),
         updated_at=datetime.now(),
         is_embedded=False,
-        metadata_=cloud_type
+        metadata_=cloud_type,
+        content_hash=content_hash
     )
     try:
         db.add(document)
         db.commit()
         db.refresh(document)
+        return document
     except IntegrityError as e:
         print("Document already exists")
         db.rollback()
+        return None
     except SQLAlchemyError as e:
         print(f"Error occurred while creating document: {e}")
         db.rollback()
+        return None
+
+
+def create_documents(db: Session, documents: List[Dict], knowledge_base_id: str, cloud_type: str):
+    # All the rows are inserted in a single transaction, either all or none of them exist afterwards
+    now = datetime.now()
+    rows = [
+        Document(
+            id=document["doc_id"],
+            knowledge_base_id=knowledge_base_id,
+            file_name=document["file_name"],
+            created_at=now,
+            updated_at=now,
+            is_embedded=False,
+            metadata_=cloud_type,
+            content_hash=document.get("content_hash")
+        ) for document in documents
+    ]
+    try:
+        db.add_all(rows)
+        db.commit()
+        return rows
+    except IntegrityError as e:
+        print(f"Documents already exist: {e}")
+        db.rollback()
+        return None
+    except SQLAlchemyError as e:
+        print(f"Error occurred while creating documents: {e}")
+        db.rollback()
+        return None
+
+
+def count_documents(db: Session, doc_ids: List[str]) -> int:
+    try:
+        return db.query(Document.id).filter(Document.id.in_(doc_ids)).count()
+    except SQLAlchemyError as e:
+        print(f"Error occurred while counting documents: {e}")
+        db.rollback()
+        return 0
+
+
+def find_documents_by_hash(db: Session, knowledge_base_id: str, content_hashes: List[str]) -> Dict[str, str]:
+    # Maps each content hash already in the knowledge base to the id of its oldest document
+    try:
+        documents = (
+            db.query(Document.id, Document.content_hash)
+            .filter(Document.knowledge_base_id == knowledge_base_id, Document.content_hash.in_(content_hashes))
+            .order_by(Document.created_at.desc())
+            .all()
+        )
+        return {content_hash: doc_id for doc_id, content_hash in documents}
+    except SQLAlchemyError as e:
+        print(f"Error occurred while looking up documents by content hash: {e}")
+        db.rollback()
+        return {}
 
 
 def embed_document(db: Session, doc_id: str):
@@ -37,6 +95,7 @@ def embed_document(db: Session, doc_id: str):
             document.is_embedded = True
             db.commit()
             db.refresh(document)
+            return document
         except SQLAlchemyError as e:
             print(f"Error occurred while embedding document: {e}")
             db.rollback()
@@ -82,6 +141,15 @@ def list_ingested_docs(db: Session, knowledge_base_id: Optional[str] = None):
         return []
 
 
+def get_document(db: Session, doc_id: str):
+    try:
+        return db.query(Document).filter(Document.id == doc_id).first()
+    except SQLAlchemyError as e:
+        print(f"Error occurred while fetching document: {e}")
+        db.rollback()
+        return None
+
+
 def delete_ingested_doc(db: Session, doc_id: str):
     try:
         document = db.query(Document).filter(Document.id == doc_id).first()
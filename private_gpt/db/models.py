@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -25,7 +25,13 @@ class Document(Base):
     embedded_at = Column(DateTime)
     is_embedded = Column(Boolean)
     metadata_ = Column(Text)
+    # SHA-256 of the file content, files already in the knowledge base are not ingested again
+    content_hash = Column(String(64))
 
     knowledge_base = relationship("KnowledgeBase", back_populates="documents")
 
+    __table_args__ = (
+        Index("ix_document_knowledge_base_id_content_hash", "knowledge_base_id", "content_hash"),
+    )
+
 KnowledgeBase.documents = relationship("Document", back_populates="knowledge_base")
\ No newline at end of file
@@ -0,0 +1,47 @@
+from typing import BinaryIO, Iterator, Tuple
+import posixpath
+import tarfile
+import zipfile
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def is_archive(file_name: str) -> bool:
+    return file_name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def safe_key(name: str) -> str:
+    """
+    Turn an archive member path into a relative object key, dropping absolute and parent parts.
+    """
+    parts = [part for part in posixpath.normpath(name.replace("\\", "/")).split("/") if part not in ("", ".", "..")]
+    return "/".join(parts)
+
+
+def iter_archive(file: BinaryIO, file_name: str) -> Iterator[Tuple[str, BinaryIO]]:
+    """
+    Iterate over the regular files of a zip or tar archive without extracting it.
+
+    Args:
+        file (BinaryIO): The archive, it must be seekable.
+        file_name (str): The name of the archive, its extension selects the format.
+
+    Yields:
+        Tuple[str, BinaryIO]: The safe key and a readable stream of each member, valid until the next one.
+    """
+    if file_name.lower().endswith(".zip"):
+        with zipfile.ZipFile(file) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not safe_key(info.filename):
+                    continue
+                with archive.open(info) as member:
+                    yield safe_key(info.filename), member
+        return
+
+    with tarfile.open(fileobj=file, mode="r:*") as archive:
+        for info in archive:
+            if not info.isfile() or not safe_key(info.name):
+                continue
+            member = archive.extractfile(info)
+            yield safe_key(info.name), member
+            member.close()
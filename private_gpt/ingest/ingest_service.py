@@ -1,14 +1,15 @@
 from .schemas import IngestedDoc
 from sqlalchemy.orm import Session
-from private_gpt.db.crud import create_document, embed_document
-import tempfile, os, boto3, uuid
+from private_gpt.db.crud import create_document, create_documents, embed_document, find_documents_by_hash
+from private_gpt.chunks.result_cache import result_cache
+from private_gpt.ingest.uploads import stream_to_cloud
+from private_gpt.ingest.storage_clients import gcs_chunk_size, get_azure_client, get_gcs_client, get_s3_client, get_s3_transfer_config, max_concurrency
+import tempfile, os, uuid
 from uuid import UUID
+from hashlib import sha256
 import requests
 import json
-from typing import BinaryIO,List
-from google.cloud import storage
-from google.oauth2 import service_account
-from azure.storage.blob import BlobServiceClient
+from typing import BinaryIO,Dict,List
 import os 
 
 
@@ -16,30 +17,30 @@ PRIVATE_GPT_BACKEND_URL=os.environ.get('PRIVATE_GPT_BACKEND_URL','')
 
 
 cloud_type = os.environ.get('CLOUD_TYPE')
+# Uploads stream to the bucket in parts unless INGEST_STREAMING_UPLOAD is false
+INGEST_STREAMING_UPLOAD = os.environ.get('INGEST_STREAMING_UPLOAD', 'true').lower() in ('1', 'true', 'yes')
 STATUS_URL = PRIVATE_GPT_BACKEND_URL + "/v1/ingest/embedded"
 
 INGEST_URL = os.environ.get('INGEST_URL','')
 EMBED_URL=INGEST_URL+'/ingest'
+HASH_BUFFER_SIZE = 1024 * 1024
+# Set EMBED_BATCH_URL once the embedding service accepts {"files": [payload, ...]}, bulk ingests
+# then send INGEST_EMBED_BATCH_SIZE files per request instead of one request per file
+EMBED_BATCH_URL=os.environ.get('EMBED_BATCH_URL')
+INGEST_EMBED_BATCH_SIZE=int(os.environ.get('INGEST_EMBED_BATCH_SIZE', '1000'))
 
 class IngestService:
 
     def ingest(self, file_name: str, raw_file_data: BinaryIO, knowledge_base_id: UUID, db: Session) -> List[IngestedDoc]:
+        # The same content is stored and embedded once per knowledge base
+        content_hash = self.hash_content(raw_file_data)
+        existing_doc_id = find_documents_by_hash(db, knowledge_base_id, [content_hash]).get(content_hash)
+        if existing_doc_id is not None:
+            return [IngestedDoc.from_document(str(existing_doc_id), str(knowledge_base_id))]
         self.upload_to_cloud(file_name, raw_file_data, cloud_type)
         doc_id = uuid.uuid4()
-        create_document(db, file_name, doc_id, knowledge_base_id, cloud_type)
-        url = EMBED_URL
-
-        payload = {
-            "cloud_type": cloud_type,
-            "file_key": file_name,
-            "collection_name": str(knowledge_base_id),
-            "file_id": str(doc_id),
-            "status_url":STATUS_URL
-        }
-        headers = {
-            "Content-Type": "application/json"
-        }
-        response = requests.post(url, data=json.dumps(payload), headers=headers)
+        self.register_document(file_name, doc_id, knowledge_base_id, db, content_hash)
+        response = self.request_embedding(file_name, knowledge_base_id, doc_id)
         print(response.json())
         # documents = response.json()
         # print(documents)
@@ -50,25 +51,101 @@ class IngestService:
 
     def proxy_ingest(self,file_name:str,file_key:str,knowledge_base_id:UUID,db:Session):
         doc_id = uuid.uuid4()
-        create_document(db, file_name, doc_id, knowledge_base_id, cloud_type)
-        url = EMBED_URL
-        payload = {
+        self.register_document(file_name, doc_id, knowledge_base_id, db)
+        response = self.request_embedding(file_key, knowledge_base_id, doc_id)
+        print(response.json())
+        return [IngestedDoc.from_document(str(doc_id), str(knowledge_base_id))]
+
+
+    def hash_content(self, file: BinaryIO) -> str:
+        """
+        Compute the SHA-256 of a file in fixed-size reads and rewind it
+        :param file: The file, it must be seekable
+        :return: The hex digest
+        """
+        digest = sha256()
+        for block in iter(lambda: file.read(HASH_BUFFER_SIZE), b""):
+            digest.update(block)
+        file.seek(0)
+        return digest.hexdigest()
+
+
+    def register_document(self, file_name: str, doc_id: UUID, knowledge_base_id: UUID, db: Session, content_hash: str = None):
+        """
+        Create the Document row of an uploaded file
+        :param file_name: The name of the file
+        :param doc_id: The id of the document
+        :param knowledge_base_id: The knowledge base of the document
+        :param db: The database session
+        :param content_hash: The SHA-256 of the file, None when it is not known
+        :return: The new Document, None if it could not be created or already exists
+        """
+        document = create_document(db, file_name, doc_id, knowledge_base_id, cloud_type, content_hash)
+        result_cache.bump(knowledge_base_id)
+        return document
+
+
+    def register_documents(self, documents: List[Dict], knowledge_base_id: UUID, db: Session):
+        """
+        Create the Document rows of a bulk ingest in one transaction
+        :param documents: The doc_id, file_name and content_hash of every document
+        :param knowledge_base_id: The knowledge base of the documents
+        :param db: The database session
+        :return: The new Documents, None if they could not be created or already exist
+        """
+        rows = create_documents(db, documents, knowledge_base_id, cloud_type)
+        result_cache.bump(knowledge_base_id)
+        return rows
+
+
+    def embedding_payload(self, file_key: str, knowledge_base_id: UUID, doc_id: UUID) -> Dict:
+        return {
             "cloud_type": cloud_type,
             "file_key": file_key,
             "collection_name": str(knowledge_base_id),
             "file_id": str(doc_id),
             "status_url":STATUS_URL
         }
+
+
+    def request_embedding_batch(self, documents: List[Dict], knowledge_base_id: UUID) -> requests.Response:
+        """
+        Ask the embedding service to chunk and embed several files in one request to EMBED_BATCH_URL
+        :param documents: The doc_id and file_key of every document, at most INGEST_EMBED_BATCH_SIZE
+        :param knowledge_base_id: The knowledge base (collection) to embed the files into
+        :return: The response of the embedding service, which reports completion to STATUS_URL per file
+        """
         headers = {
             "Content-Type": "application/json"
         }
-        response = requests.post(url, data=json.dumps(payload), headers=headers)
-        print(response.json())
-        return [IngestedDoc.from_document(str(doc_id), str(knowledge_base_id))]
-    
+        payload = {
+            "files": [
+                self.embedding_payload(document["file_key"], knowledge_base_id, document["doc_id"])
+                for document in documents
+            ]
+        }
+        return requests.post(EMBED_BATCH_URL, data=json.dumps(payload), headers=headers)
+
+
+    def request_embedding(self, file_key: str, knowledge_base_id: UUID, doc_id: UUID) -> requests.Response:
+        """
+        Ask the embedding service to chunk and embed an uploaded file
+        :param file_key: The key of the file in the bucket
+        :param knowledge_base_id: The knowledge base (collection) to embed the file into
+        :param doc_id: The id of the document
+        :return: The response of the embedding service, which reports completion to STATUS_URL
+        """
+        payload = self.embedding_payload(file_key, knowledge_base_id, doc_id)
+        headers = {
+            "Content-Type": "application/json"
+        }
+        return requests.post(EMBED_URL, data=json.dumps(payload), headers=headers)
 
 
     def upload_to_cloud(self, file_name: str, file: BinaryIO, cloud_type: str):
+        if INGEST_STREAMING_UPLOAD:
+            self.stream_file_to_cloud(file_name, file, cloud_type)
+            return
         with tempfile.TemporaryDirectory() as temp_dir:
             file_path = f"{temp_dir}/{file_name}"
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
@@ -83,6 +160,21 @@ class IngestService:
             else:
                 raise ValueError(f"Unsupported cloud type: {cloud_type}")
 
+    def stream_file_to_cloud(self, file_name: str, file: BinaryIO, cloud_type: str):
+        """
+        Upload a file to the cloud in fixed-size parts as it is read
+        :param file_name: The object name (key)
+        :param file: The file to upload
+        :param cloud_type: aws, gcp, azure or local
+        """
+        try:
+            size = stream_to_cloud(file_name, file, cloud_type)
+            print(f"File uploaded successfully ({size} bytes)")
+        except Exception as e:
+            # Unlike the temp file path, a failed upload stops the ingest instead of registering a missing file
+            print(f"Error uploading file to {cloud_type}: {e}")
+            raise
+
     def upload_file_to_s3(self, file_path, bucket_name, object_name):
         """
         Upload a file to an S3 bucket
@@ -91,9 +183,9 @@ class IngestService:
         :param object_name: S3 object name (key)
         :return: True if the file was uploaded successfully, else False
         """
-        s3_client = boto3.client('s3')
+        s3_client = get_s3_client()
         try:
-            response = s3_client.upload_file(file_path, bucket_name, object_name)
+            response = s3_client.upload_file(file_path, bucket_name, object_name, Config=get_s3_transfer_config())
             print("File uploaded successfully")
         except Exception as e:
             print(f"Error uploading file to S3: {e}")
@@ -107,10 +199,9 @@ class IngestService:
         :param object_name: Google Cloud Storage object name (key)
         :return: True if the file was uploaded successfully, else False
         """
-        credentials_dict = os.environ.get('GCP_CREDS')
-        storage_client = storage.Client(project=credentials_dict['project_id'], credentials=service_account.Credentials.from_service_account_info(credentials_dict))
+        storage_client = get_gcs_client()
         bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(object_name)
+        blob = bucket.blob(object_name, chunk_size=gcs_chunk_size())
 
         try:
             blob.upload_from_filename(file_path)
@@ -127,13 +218,12 @@ class IngestService:
         :param blob_name: Azure Blob Storage blob name (key)
         :return: True if the file was uploaded successfully, else False
         """
-        connection_string = os.environ.get('AZURE_CONNECTION_STRING')
-        blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+        blob_service_client = get_azure_client()
         blob_client = blob_service_client.get_blob_client(container_name, blob_name)
 
         try:
             with open(file_path, "rb") as data:
-                blob_client.upload_blob(data)
+                blob_client.upload_blob(data, max_concurrency=max_concurrency())
             print("File uploaded successfully to Azure Blob Storage")
         except Exception as e:
             print(f"Error uploading file to Azure Blob Storage: {e}")
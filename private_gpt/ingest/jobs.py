@@ -0,0 +1,429 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from typing import BinaryIO, Dict, List, Optional
+from private_gpt.cache import LRUCache, SqliteCache
+from private_gpt.db.crud import count_documents, find_documents_by_hash
+from private_gpt.db.database import SessionLocal
+from private_gpt.ingest.ingest_service import EMBED_BATCH_URL, INGEST_EMBED_BATCH_SIZE, IngestService, cloud_type
+import copy
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+# Constants
+INGEST_JOBS = "INGEST_JOBS"
+INGEST_WORKERS = "INGEST_WORKERS"
+INGEST_QUEUE_SIZE = "INGEST_QUEUE_SIZE"
+INGEST_JOB_ATTEMPTS = "INGEST_JOB_ATTEMPTS"
+INGEST_JOB_RETRY_DELAY = "INGEST_JOB_RETRY_DELAY"
+INGEST_JOB_TTL = "INGEST_JOB_TTL"
+INGEST_JOBS_PATH = "INGEST_JOBS_PATH"
+INGEST_JOB_DOCUMENTS = "INGEST_JOB_DOCUMENTS"
+INGEST_SPOOL_DIR = "INGEST_SPOOL_DIR"
+INGEST_BULK_UPLOAD_CONCURRENCY = "INGEST_BULK_UPLOAD_CONCURRENCY"
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class IngestQueueFull(Exception):
+    """
+    Raised when a job is submitted while INGEST_QUEUE_SIZE jobs are already waiting.
+    """
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp is not None else None
+
+
+@dataclass
+class IngestDocument:
+    """
+    A file of an ingest job.
+
+    Attributes:
+        file_name (str): The name of the file.
+        file_key (str): The key of the file in the bucket.
+        doc_id (str): The id of the document, assigned when the job is created.
+        spool_path (Optional[str]): The spooled upload, None when the file is already in the bucket.
+        content_hash (Optional[str]): The SHA-256 of the spooled upload, None when the file is already in the bucket.
+        uploaded (bool): Whether the file reached the bucket, so a retry does not upload it again.
+        embedding_requested (bool): Whether the embedding service accepted the file, so a retry does not embed it twice.
+    """
+    file_name: str
+    file_key: str
+    doc_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    spool_path: Optional[str] = None
+    content_hash: Optional[str] = None
+    uploaded: bool = False
+    embedding_requested: bool = False
+
+
+@dataclass
+class IngestJob:
+    """
+    The ingestion of one or more files, run in stages by the IngestJobQueue workers.
+
+    The stages are persist (the uploads are spooled to local disk, in the request), upload
+    (the spooled files are sent to the bucket in parallel, skipped for proxy ingests of files
+    already in the bucket), register (the Document rows are created in one transaction),
+    embed_request (the embedding service is called once per file, or once per batch of files
+    when EMBED_BATCH_URL is set)
+    and embedding (from the call until the service reported back on /ingest/embedded for
+    every file). A retried job resumes at the stage that failed.
+
+    Attributes:
+        knowledge_base_id (str): The knowledge base to ingest the files into.
+        documents (List[IngestDocument]): The files.
+        id (str): The job id.
+        status (str): queued, running, retrying, succeeded or failed.
+        attempts (int): The number of times the job was started.
+        error (Optional[str]): The error of the last failed attempt.
+        stages (Dict[str, Dict[str, float]]): The start and end time of each stage.
+    """
+    knowledge_base_id: str
+    documents: List[IngestDocument] = field(default_factory=list)
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "queued"
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    stages: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return {
+            "object": "ingest.job",
+            "id": self.id,
+            "knowledge_base_id": self.knowledge_base_id,
+            "documents": [{"doc_id": document.doc_id, "file_name": document.file_name} for document in self.documents],
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": _isoformat(self.created_at),
+            "stages": {
+                name: {
+                    "started_at": _isoformat(stage.get("started_at")),
+                    "finished_at": _isoformat(stage.get("finished_at")),
+                    "duration": stage["finished_at"] - stage["started_at"] if "finished_at" in stage else None,
+                } for name, stage in self.stages.items()
+            },
+        }
+
+
+class IngestJobQueue:
+    """
+    A pool of background threads running ingest jobs.
+
+    At most workers jobs run at once and at most queue_size wait for a worker, further jobs
+    are rejected. A failed job is retried up to max_attempts times in total, after
+    retry_delay seconds doubled on every retry, without holding a worker meanwhile. A retry
+    that finds the queue full fails the job.
+
+    Job reports are kept in store, an LRUCache by default. With a SqliteCache the reports are
+    shared by the workers of a host, so GET /ingest/jobs/{id} answers on any of them. The job
+    and embedding status of each document are kept in documents, a store of its own so that
+    the documents of a bulk job do not evict the job reports.
+
+    Attributes:
+        workers (int): The number of worker threads.
+        max_attempts (int): The maximum number of attempts of a job.
+        upload_concurrency (int): The maximum number of files of a job uploaded at once.
+        retry_delay (float): The delay before the first retry, in seconds.
+        store (Any): The LRUCache or SqliteCache of job reports.
+        documents (Any): The LRUCache or SqliteCache of the job id and embedding status of each document.
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 1000, max_attempts: int = 3, retry_delay: float = 2.0, store=None,
+                 upload_concurrency: int = 8, documents=None):
+        self.workers = workers
+        self.upload_concurrency = upload_concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.store = store if store is not None else LRUCache(maxsize=10000)
+        self.documents = documents if documents is not None else LRUCache(maxsize=1000000)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.service = IngestService()
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        # Threads start on the first job, after the worker process has been forked
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"ingest-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def persist(self, job: IngestJob, file_name: str, file: BinaryIO, file_key: Optional[str] = None) -> IngestDocument:
+        """
+        Spool an uploaded file to INGEST_SPOOL_DIR and add it to a job, so the job outlives the request.
+
+        The SHA-256 of the file is computed while it is spooled.
+        """
+        spool_dir = os.path.join(os.getenv(INGEST_SPOOL_DIR) or os.path.join(tempfile.gettempdir(), "private_gpt_ingest"), job.id)
+        os.makedirs(spool_dir, exist_ok=True)
+        document = IngestDocument(file_name=file_name, file_key=file_key or file_name)
+        document.spool_path = os.path.join(spool_dir, document.doc_id)
+        started_at = job.stages.get("persist", {}).get("started_at", time.time())
+        digest = sha256()
+        with open(document.spool_path, "wb") as f:
+            for block in iter(lambda: file.read(COPY_BUFFER_SIZE), b""):
+                digest.update(block)
+                f.write(block)
+        document.content_hash = digest.hexdigest()
+        job.documents.append(document)
+        job.stages["persist"] = {"started_at": started_at, "finished_at": time.time()}
+        return document
+
+    def deduplicate(self, job: IngestJob) -> Dict[str, str]:
+        """
+        Drop the spooled files of a job whose content is already in the knowledge base or
+        earlier in the job, they are neither uploaded nor embedded again.
+
+        Returns:
+            Dict[str, str]: The id of the document with the same content, in the knowledge base or
+            in the job, by id of dropped document.
+        """
+        hashes = list({document.content_hash for document in job.documents if document.content_hash})
+        if not hashes:
+            return {}
+        db = SessionLocal()
+        try:
+            existing = {content_hash: str(doc_id) for content_hash, doc_id in find_documents_by_hash(db, job.knowledge_base_id, hashes).items()}
+        finally:
+            db.close()
+
+        kept = []
+        duplicates = {}
+        for document in job.documents:
+            original_id = existing.get(document.content_hash) if document.content_hash else None
+            if original_id is None:
+                kept.append(document)
+                if document.content_hash:
+                    existing[document.content_hash] = document.doc_id
+                continue
+            duplicates[document.doc_id] = original_id
+            os.remove(document.spool_path)
+        job.documents = kept
+        return duplicates
+
+    def submit(self, job: IngestJob) -> IngestJob:
+        """
+        Queue a job. Its report and documents are stored first, a worker may change the job as
+        soon as it is queued.
+
+        Raises:
+            IngestQueueFull: If the queue is full, the report, documents and spooled upload are removed then.
+        """
+        self.start()
+        self.documents.set_many({
+            document.doc_id: {"job_id": job.id, "status": None, "embedded_at": None} for document in job.documents
+        })
+        self._save(job)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            self.rejected += 1
+            self.store.delete_many([job.id])
+            self.documents.delete_many([document.doc_id for document in job.documents])
+            self._remove_spool(job)
+            raise IngestQueueFull(f"The ingest queue is full ({self.queue.maxsize} jobs waiting)")
+        self.submitted += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        report = self.store.get(job_id)
+        if report is None:
+            return None
+        # The LRUCache returns the stored report itself, the embedding progress must not end up in it
+        report = copy.deepcopy(report)
+        # Embedding progress is kept per document, the callbacks may come before the job's last save
+        entries = self.documents.get_many(document["doc_id"] for document in report["documents"]).values()
+        embedded_at = [entry["embedded_at"] for entry in entries if entry.get("embedded_at") is not None]
+        report["embedded"] = len(embedded_at)
+        report["embedding_statuses"] = dict(Counter(entry["status"] for entry in entries if entry.get("embedded_at") is not None))
+        stage = report["stages"].get("embedding")
+        if stage is not None and embedded_at and len(embedded_at) >= len(report["documents"]):
+            stage["finished_at"] = _isoformat(max(embedded_at))
+            stage["duration"] = max(embedded_at) - datetime.fromisoformat(stage["started_at"]).timestamp()
+        return report
+
+    def mark_embedded(self, doc_id: str, status: str) -> None:
+        """
+        Record that the embedding service reported back for a document of a job, the embedding
+        stage closes once every document of the job has reported.
+
+        Each document has its own entry, so callbacks handled by different workers do not
+        overwrite each other and a repeated callback is only counted once.
+        """
+        entry = self.documents.get(doc_id)
+        if entry is None:
+            return
+        embedded_at = entry.get("embedded_at") or time.time()
+        self.documents.set(doc_id, {"job_id": entry["job_id"], "status": status, "embedded_at": embedded_at})
+
+    def _save(self, job: IngestJob) -> None:
+        self.store.set(job.id, job.to_dict())
+
+    def _remove_spool(self, job: IngestJob) -> None:
+        spool_dirs = {os.path.dirname(document.spool_path) for document in job.documents if document.spool_path}
+        for spool_dir in spool_dirs:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+    def _requeue(self, job: IngestJob) -> None:
+        # Runs on the retry timer thread, which must not wait for room in a full queue
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            job.status = "failed"
+            job.error = f"Could not retry, the ingest queue is full ({self.queue.maxsize} jobs waiting). Last error: {job.error}"
+            self.failed += 1
+            self._save(job)
+            self._remove_spool(job)
+
+    def _work(self) -> None:
+        while True:
+            job = self.queue.get()
+            try:
+                self.process(job)
+            except Exception as e:
+                print(f"Unexpected error in ingest worker: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _stage(self, job: IngestJob, name: str, run) -> None:
+        if "finished_at" in job.stages.get(name, {}):
+            return
+        job.stages[name] = {"started_at": time.time()}
+        self._save(job)
+        run()
+        job.stages[name]["finished_at"] = time.time()
+
+    def _upload_document(self, document: IngestDocument) -> None:
+        with open(document.spool_path, "rb") as f:
+            self.service.upload_to_cloud(document.file_key, f, cloud_type)
+        document.uploaded = True
+
+    def _upload(self, job: IngestJob) -> None:
+        pending = [document for document in job.documents if document.spool_path and not document.uploaded]
+        with ThreadPoolExecutor(max_workers=max(min(self.upload_concurrency, len(pending)), 1)) as executor:
+            # list() raises the first failure once every upload has finished
+            list(executor.map(self._upload_document, pending))
+
+    def _register(self, job: IngestJob) -> None:
+        documents = [
+            {"doc_id": document.doc_id, "file_name": document.file_name, "content_hash": document.content_hash}
+            for document in job.documents
+        ]
+        db = SessionLocal()
+        try:
+            # A retry may find the rows of an attempt that failed after the commit
+            if self.service.register_documents(documents, job.knowledge_base_id, db) is None and count_documents(db, [document["doc_id"] for document in documents]) < len(documents):
+                raise RuntimeError(f"Could not create the {len(documents)} documents of job {job.id}")
+        finally:
+            db.close()
+
+    def _request_embedding(self, job: IngestJob) -> None:
+        # Stops at the first failed request, a retry only asks for the files not yet requested
+        if "embedding" not in job.stages:
+            job.stages["embedding"] = {"started_at": time.time()}
+        pending = [document for document in job.documents if not document.embedding_requested]
+        if EMBED_BATCH_URL and len(pending) > 1:
+            for i in range(0, len(pending), INGEST_EMBED_BATCH_SIZE):
+                batch = pending[i:i + INGEST_EMBED_BATCH_SIZE]
+                documents = [{"doc_id": document.doc_id, "file_key": document.file_key} for document in batch]
+                self.service.request_embedding_batch(documents, job.knowledge_base_id).raise_for_status()
+                for document in batch:
+                    document.embedding_requested = True
+            return
+        for document in pending:
+            self.service.request_embedding(document.file_key, job.knowledge_base_id, document.doc_id).raise_for_status()
+            document.embedding_requested = True
+
+    def process(self, job: IngestJob) -> None:
+        """
+        Run the remaining stages of a job, scheduling a retry if one fails.
+        """
+        job.status = "running"
+        job.attempts += 1
+        job.error = None
+        try:
+            if any(document.spool_path for document in job.documents):
+                self._stage(job, "upload", lambda: self._upload(job))
+            self._stage(job, "register", lambda: self._register(job))
+            self._stage(job, "embed_request", lambda: self._request_embedding(job))
+        except Exception as e:
+            print(f"Ingest job {job.id} failed (attempt {job.attempts}): {e}")
+            job.error = str(e)
+            # The embedding stage runs on for the files the embedding service already accepted
+            embedding = any(document.embedding_requested for document in job.documents)
+            job.stages = {name: stage for name, stage in job.stages.items() if "finished_at" in stage or (name == "embedding" and embedding)}
+            if job.attempts < self.max_attempts:
+                job.status = "retrying"
+                self.retried += 1
+                self._save(job)
+                timer = threading.Timer(self.retry_delay * 2 ** (job.attempts - 1), self._requeue, (job,))
+                timer.daemon = True
+                timer.start()
+                return
+            job.status = "failed"
+            self.failed += 1
+            self._save(job)
+            self._remove_spool(job)
+            return
+
+        job.status = "succeeded"
+        self.succeeded += 1
+        self._save(job)
+        self._remove_spool(job)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self.queue.qsize(),
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rejected": self.rejected,
+        }
+
+
+def ingest_jobs_enabled() -> bool:
+    return os.getenv(INGEST_JOBS, "true").lower() in ("1", "true", "yes")
+
+
+def ingest_job_queue_from_env() -> IngestJobQueue:
+    """
+    Build the job queue from INGEST_WORKERS (4), INGEST_QUEUE_SIZE (1000), INGEST_JOB_ATTEMPTS (3),
+    INGEST_JOB_RETRY_DELAY (2 seconds), INGEST_JOB_TTL (86400 seconds), INGEST_JOBS_PATH (a sqlite
+    file for the job reports, in memory when unset), INGEST_JOB_DOCUMENTS (the number of documents
+    whose job and embedding status are kept in memory, 1000000) and INGEST_BULK_UPLOAD_CONCURRENCY (8).
+    """
+    ttl = float(os.getenv(INGEST_JOB_TTL, "86400")) or None
+    path = os.getenv(INGEST_JOBS_PATH)
+    return IngestJobQueue(
+        workers=int(os.getenv(INGEST_WORKERS, "4")),
+        queue_size=int(os.getenv(INGEST_QUEUE_SIZE, "1000")),
+        max_attempts=int(os.getenv(INGEST_JOB_ATTEMPTS, "3")),
+        retry_delay=float(os.getenv(INGEST_JOB_RETRY_DELAY, "2")),
+        store=SqliteCache(path, ttl=ttl, table="ingest_jobs") if path else LRUCache(maxsize=10000, ttl=ttl),
+        upload_concurrency=int(os.getenv(INGEST_BULK_UPLOAD_CONCURRENCY, "8")),
+        documents=SqliteCache(path, ttl=ttl, table="ingest_job_documents") if path else LRUCache(maxsize=int(os.getenv(INGEST_JOB_DOCUMENTS, "1000000")), ttl=ttl),
+    )
+
+
+ingest_jobs = ingest_job_queue_from_env()
@@ -2,7 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from private_gpt.db.database import get_db
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from private_gpt.db.crud import delete_ingested_doc
+from private_gpt.db.crud import delete_ingested_doc, get_document
+from private_gpt.chunks.result_cache import result_cache
 
 delete_docs_router = APIRouter()
 
@@ -21,7 +22,9 @@ async def delete_ingested_document(doc_id: str, db: Session = Depends(get_db)):
         HTTPException: If an error occurs while deleting the document.
     """
     try:
-        delete_ingested_doc(db, doc_id)
+        document = get_document(db, doc_id)
+        if delete_ingested_doc(db, doc_id) and document is not None:
+            result_cache.bump(document.knowledge_base_id)
         return {"success":"Document deleted successfully"}
     except SQLAlchemyError as e:
         # If an SQLAlchemyError occurs, rollback the database session and raise an HTTPException
@@ -1,6 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends, Body
 from private_gpt.db.database import get_db
 from private_gpt.db.crud import embed_document
+from private_gpt.chunks.result_cache import result_cache
+from private_gpt.chunks.chunks_service import PRIMARY_BACKEND
+from private_gpt.chunks.local_sync import index_documents
+from private_gpt.chunks.runtime import run_async
+from private_gpt.ingest.jobs import ingest_jobs
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from typing import List
@@ -46,7 +51,18 @@ async def list_ingested_documents(
         HTTPException: If an error occurs while embedding the document.
     """
     try:
-        embed_document(db, request.id)
+        document = embed_document(db, request.id)
+        if document is not None and PRIMARY_BACKEND == "local":
+            # The embedding service only writes to qdrant and pgvector, copy the chunks into the local index
+            try:
+                await run_async(index_documents(str(document.knowledge_base_id), [request.id]))
+            except Exception as e:
+                print(f"Could not add document {request.id} to the local index: {e}")
+        if document is not None:
+            # The new chunks are searchable now, stop serving cached results for the knowledge base
+            result_cache.bump(document.knowledge_base_id)
+        # Record when the embedding finished on the ingest job of the document, if any
+        ingest_jobs.mark_embedded(request.id, request.status)
         response = {
             "id": request.id, 
             "status": request.status, 
@@ -1,15 +1,47 @@
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from private_gpt.ingest.schemas import IngestFileResponse
+from private_gpt.ingest.schemas import IngestFileResponse, IngestedDoc, BulkProxyIngestRequest
+from private_gpt.ingest.archives import is_archive, iter_archive
 from private_gpt.ingest.ingest_service import IngestService
+from private_gpt.ingest.jobs import IngestDocument, IngestJob, IngestQueueFull, ingest_jobs, ingest_jobs_enabled
 from private_gpt.db.database import get_db
 from uuid import UUID
 
 
 ingest_file_router = APIRouter()
 
+
+def job_documents(job: IngestJob, documents: Optional[List[IngestDocument]] = None, duplicates: Optional[Dict[str, str]] = None) -> List[IngestedDoc]:
+    # Duplicates of documents already in the knowledge base get the existing id and no job
+    kept_ids = {document.doc_id for document in job.documents}
+    ingested_documents = []
+    for document in documents or job.documents:
+        doc_id = (duplicates or {}).get(document.doc_id, document.doc_id)
+        ingested_documents.append(IngestedDoc.from_document(doc_id, job.knowledge_base_id, job.id if doc_id in kept_ids else None))
+    return ingested_documents
+
+
+async def submit_uploads(job: IngestJob) -> List[IngestedDoc]:
+    # Files whose content is already in the knowledge base are not uploaded nor embedded again
+    documents = list(job.documents)
+    duplicates = await run_in_threadpool(ingest_jobs.deduplicate, job)
+    if job.documents:
+        ingest_jobs.submit(job)
+    return job_documents(job, documents, duplicates)
+
+
+def persist_uploads(job: IngestJob, files: List[UploadFile]) -> None:
+    # Archives are expanded member by member, every member becomes a document keyed by its path
+    for file in files:
+        if is_archive(file.filename):
+            for key, member in iter_archive(file.file, file.filename):
+                ingest_jobs.persist(job, key, member)
+        else:
+            ingest_jobs.persist(job, file.filename, file.file)
+
 @ingest_file_router.post("/file", response_model=IngestFileResponse)
 async def ingest_file(
     file: UploadFile = File(...),  # The uploaded file
@@ -19,6 +51,11 @@ async def ingest_file(
     """
     Endpoint to ingest a file into the knowledge base.
 
+    The file is spooled to local disk and ingested by a background job, the response carries
+    the document and job ids right away. With INGEST_JOBS=false the file is ingested before
+    the response. A file whose content is already in the knowledge base is not ingested again,
+    the response carries the id of the existing document and no job id.
+
     Args:
         file (UploadFile): The uploaded file.
         knowledge_base_id (Optional[str]): The knowledge base to ingest the file into. Defaults to the default knowledge base.
@@ -28,18 +65,25 @@ async def ingest_file(
         IngestFileResponse: The response containing the ingested documents.
 
     Raises:
-        HTTPException: If there is an error while ingesting the file.
+        HTTPException: If there is an error while ingesting the file, 503 if the ingest queue is full.
     """
     try:
         service = IngestService()  # Create an instance of the ingest service
         if file.filename is None:
             raise HTTPException(400, "No file name provided")  # If no filename is provided, raise an exception
-        ingested_documents = service.ingest(  # Ingest the file into the knowledge base
-            file.filename, file.file, knowledge_base_id, db
-        )
+        if ingest_jobs_enabled():
+            job = IngestJob(knowledge_base_id=str(knowledge_base_id))
+            await run_in_threadpool(ingest_jobs.persist, job, file.filename, file.file)  # Spool the upload off the event loop
+            ingested_documents = await submit_uploads(job)
+        else:
+            ingested_documents = await run_in_threadpool(  # Ingest the file into the knowledge base
+                service.ingest, file.filename, file.file, knowledge_base_id, db
+            )
         return IngestFileResponse(  # Return the response containing the ingested documents
             object="list", model="private-gpt", data=ingested_documents
         )
+    except IngestQueueFull as e:
+        raise HTTPException(503, str(e))
     except Exception as e:
         print(f"Error while ingesting file: {str(e)}")  # Print the error message
         raise HTTPException(500, "Internal server error while ingesting file")  # Raise an exception with an appropriate error message
@@ -76,11 +120,17 @@ async def proxy_ingest_file(
         # Create an instance of the ingest service
         service = IngestService()
         
-        # Ingest the file using the proxy
-        ingested_documents = service.proxy_ingest(file_name, file_key, knowledge_base_id, db)
+        # Ingest the file using the proxy, in the background unless INGEST_JOBS is false
+        if ingest_jobs_enabled():
+            job = ingest_jobs.submit(IngestJob(knowledge_base_id=str(knowledge_base_id), documents=[IngestDocument(file_name=file_name, file_key=file_key)]))
+            ingested_documents = job_documents(job)
+        else:
+            ingested_documents = await run_in_threadpool(service.proxy_ingest, file_name, file_key, knowledge_base_id, db)
         
         # Return the response containing the ingested documents
         return IngestFileResponse(object="list", model="private-gpt", data=ingested_documents)
+    except IngestQueueFull as e:
+        raise HTTPException(503, str(e))
     except ValueError as e:
         # If file name or knowledge base ID is invalid, raise an exception with an appropriate error message
         raise HTTPException(400, str(e))
@@ -95,3 +145,77 @@ async def proxy_ingest_file(
         print(f"Error while ingesting file: {str(e)}")
         raise HTTPException(500, "Internal server error while ingesting file")
 
+
+
+
+@ingest_file_router.post("/bulk", response_model=IngestFileResponse)
+async def bulk_ingest_files(
+    files: List[UploadFile] = File(...),  # The uploaded files and zip or tar archives
+    knowledge_base_id: Optional[str] = Form(UUID(os.environ['DEFAULT_KNOWLEDGE_BASE'])),  # The knowledge base to ingest the files into
+):
+    """
+    Endpoint to ingest many files into the knowledge base with one background job.
+
+    Zip and tar archives are expanded, each regular file inside becomes a document. The job
+    uploads the files in parallel, creates all the documents in one transaction and sends
+    the embedding service batched requests. Files already in the knowledge base, or repeated
+    in the request, are ingested once.
+
+    Args:
+        files (List[UploadFile]): The uploaded files and archives.
+        knowledge_base_id (Optional[str]): The knowledge base to ingest the files into. Defaults to the default knowledge base.
+
+    Returns:
+        IngestFileResponse: The documents of the job with its id, and the existing documents of duplicates.
+
+    Raises:
+        HTTPException: If a file has no name or the archives hold no file (400), if the ingest queue is full (503) or on other errors (500).
+    """
+    try:
+        if any(file.filename is None for file in files):
+            raise HTTPException(400, "No file name provided")
+        job = IngestJob(knowledge_base_id=str(knowledge_base_id))
+        await run_in_threadpool(persist_uploads, job, files)  # Spool the uploads off the event loop
+        if not job.documents:
+            raise HTTPException(400, "No file to ingest")
+        return IngestFileResponse(object="list", model="private-gpt", data=await submit_uploads(job))
+    except HTTPException:
+        raise
+    except IngestQueueFull as e:
+        raise HTTPException(503, str(e))
+    except Exception as e:
+        print(f"Error while ingesting files: {str(e)}")
+        raise HTTPException(500, "Internal server error while ingesting files")
+
+
+@ingest_file_router.post("/proxy/bulk", response_model=IngestFileResponse)
+async def bulk_proxy_ingest_files(request: BulkProxyIngestRequest):
+    """
+    Endpoint to ingest many files already in the bucket with one background job.
+
+    Args:
+        request (BulkProxyIngestRequest): The names and keys of the files and the knowledge base.
+
+    Returns:
+        IngestFileResponse: The documents of the job, all with the same job id.
+
+    Raises:
+        HTTPException: If no file is given (400), if the ingest queue is full (503) or on other errors (500).
+    """
+    try:
+        if not request.files:
+            raise HTTPException(400, "No file to ingest")
+        knowledge_base_id = request.knowledge_base_id or os.environ['DEFAULT_KNOWLEDGE_BASE']
+        job = IngestJob(
+            knowledge_base_id=str(knowledge_base_id),
+            documents=[IngestDocument(file_name=file.file_name, file_key=file.file_key) for file in request.files]
+        )
+        ingest_jobs.submit(job)
+        return IngestFileResponse(object="list", model="private-gpt", data=job_documents(job))
+    except HTTPException:
+        raise
+    except IngestQueueFull as e:
+        raise HTTPException(503, str(e))
+    except Exception as e:
+        print(f"Error while ingesting files: {str(e)}")
+        raise HTTPException(500, "Internal server error while ingesting files")
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, HTTPException
+from private_gpt.ingest.jobs import ingest_jobs
+
+
+ingest_jobs_router = APIRouter()
+
+
+@ingest_jobs_router.get("/jobs/stats")
+async def ingest_jobs_stats() -> dict:
+    """
+    Endpoint for inspecting the ingest job queue of this worker.
+
+    Returns:
+        dict: The number of workers, the queue depth and the job counters.
+    """
+    return ingest_jobs.stats()
+
+
+@ingest_jobs_router.get("/jobs/{job_id}")
+async def get_ingest_job(job_id: str) -> dict:
+    """
+    Get the status of an ingest job.
+
+    Args:
+        job_id (str): The id of the job, returned by /ingest/file and /ingest/proxy.
+
+    Returns:
+        dict: The job status, attempts, last error and the start, end and duration of each stage.
+
+    Raises:
+        HTTPException: If the job is unknown or expired.
+    """
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -14,17 +14,28 @@ class IngestedDoc(BaseModel):
             }
         ]
     )
+    # Set when the document is ingested in the background, see GET /ingest/jobs/{job_id}
+    job_id: Optional[str] = Field(default=None, examples=["0b7f6a4e-5d1c-4f3a-9a57-2a4c0d9e8b61"])
 
     @staticmethod
     # def from_document(document: Document, doc_id: str, knowledge_base_id: str) -> "IngestedDoc":
-    def from_document(doc_id: str, knowledge_base_id: str) -> "IngestedDoc":
+    def from_document(doc_id: str, knowledge_base_id: str, job_id: Optional[str] = None) -> "IngestedDoc":
         return IngestedDoc(
             doc_id=doc_id,
             knowledge_base_id=knowledge_base_id,
+            job_id=job_id,
             # doc_metadata=document['metadata'],
         )
 
 class IngestFileResponse(BaseModel):
     object: Literal["list"]
     model: Literal["private-gpt"]
-    data: List[IngestedDoc]
\ No newline at end of file
+    data: List[IngestedDoc]
+
+class ProxyFile(BaseModel):
+    file_name: str = Field(examples=["Sales Report Q3 2023.pdf"])
+    file_key: str = Field(examples=["reports/Sales Report Q3 2023.pdf"])
+
+class BulkProxyIngestRequest(BaseModel):
+    knowledge_base_id: Optional[str] = Field(default=None, examples=["c202d5e6-7b69-4869-81cc-dd574ee8ee11"])
+    files: List[ProxyFile]
@@ -0,0 +1,135 @@
+from functools import lru_cache, wraps
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import storage
+from google.oauth2 import service_account
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+from requests.adapters import HTTPAdapter
+import boto3
+import json
+import os
+import requests
+import threading
+
+# Constants
+STORAGE_MAX_POOL_CONNECTIONS = "STORAGE_MAX_POOL_CONNECTIONS"
+STORAGE_MULTIPART_THRESHOLD = "STORAGE_MULTIPART_THRESHOLD"
+STORAGE_MULTIPART_CHUNK_SIZE = "STORAGE_MULTIPART_CHUNK_SIZE"
+STORAGE_MAX_CONCURRENCY = "STORAGE_MAX_CONCURRENCY"
+
+MIB = 1024 * 1024
+# S3 rejects multipart parts below 5 MiB, except the last one
+MIN_CHUNK_SIZE = 5 * MIB
+
+
+def max_pool_connections() -> int:
+    """
+    Return the connection pool size of each storage client (STORAGE_MAX_POOL_CONNECTIONS, default 32).
+
+    The pool is shared by every thread using the client, it should cover the concurrent
+    uploads of a worker times STORAGE_MAX_CONCURRENCY.
+    """
+    return int(os.getenv(STORAGE_MAX_POOL_CONNECTIONS, "32"))
+
+
+def multipart_threshold() -> int:
+    """
+    Return the file size from which uploads are split in parts (STORAGE_MULTIPART_THRESHOLD, default 8 MiB).
+    """
+    return int(os.getenv(STORAGE_MULTIPART_THRESHOLD, str(8 * MIB)))
+
+
+def multipart_chunk_size() -> int:
+    """
+    Return the size of the parts of a multipart upload (STORAGE_MULTIPART_CHUNK_SIZE, default 8 MiB, at least 5 MiB).
+    """
+    return max(int(os.getenv(STORAGE_MULTIPART_CHUNK_SIZE, str(8 * MIB))), MIN_CHUNK_SIZE)
+
+
+def gcs_chunk_size() -> int:
+    # Resumable upload chunks must be a multiple of 256 KiB
+    return max(multipart_chunk_size() // (256 * 1024), 1) * 256 * 1024
+
+
+def max_concurrency() -> int:
+    """
+    Return the number of parts of one upload sent at once (STORAGE_MAX_CONCURRENCY, default 4).
+    """
+    return max(int(os.getenv(STORAGE_MAX_CONCURRENCY, "4")), 1)
+
+
+# lru_cache does not lock, concurrent first calls would each build a client
+_clients_lock = threading.RLock()
+
+
+def process_wide(factory):
+    """
+    Cache the result of a client factory for the process, building it at most once even
+    when the first calls come from several threads at once.
+    """
+    cached = lru_cache(maxsize=None)(factory)
+
+    @wraps(factory)
+    def get():
+        with _clients_lock:
+            return cached()
+    get.cache_clear = cached.cache_clear
+    return get
+
+
+def pooled_session(session: requests.Session) -> requests.Session:
+    # requests keeps 10 connections per host by default, the threads of a busy worker need more
+    adapter = HTTPAdapter(pool_connections=max_pool_connections(), pool_maxsize=max_pool_connections())
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@process_wide
+def get_s3_client():
+    """
+    Return the process-wide S3 client. boto3 clients are thread safe and share their connection pool,
+    but creating them is not, so the client comes from a session of its own, built under a lock.
+    """
+    return boto3.session.Session().client('s3', config=Config(max_pool_connections=max_pool_connections()))
+
+
+@process_wide
+def get_s3_transfer_config() -> TransferConfig:
+    return TransferConfig(
+        multipart_threshold=multipart_threshold(),
+        multipart_chunksize=multipart_chunk_size(),
+        max_concurrency=max_concurrency(),
+    )
+
+
+@process_wide
+def get_gcs_client() -> storage.Client:
+    """
+    Return the process-wide Google Cloud Storage client, built from the GCP_CREDS service account info.
+    """
+    credentials_dict = os.environ.get('GCP_CREDS')
+    if isinstance(credentials_dict, str):
+        credentials_dict = json.loads(credentials_dict)
+    credentials = service_account.Credentials.from_service_account_info(credentials_dict)
+    credentials = credentials.with_scopes(storage.Client.SCOPE)
+    return storage.Client(
+        project=credentials_dict['project_id'],
+        credentials=credentials,
+        _http=pooled_session(AuthorizedSession(credentials)),
+    )
+
+
+@process_wide
+def get_azure_client() -> BlobServiceClient:
+    """
+    Return the process-wide Azure Blob Storage client for AZURE_CONNECTION_STRING.
+    """
+    return BlobServiceClient.from_connection_string(
+        os.environ.get('AZURE_CONNECTION_STRING'),
+        transport=RequestsTransport(session=pooled_session(requests.Session()), session_owner=False),
+        max_single_put_size=multipart_threshold(),
+        max_block_size=multipart_chunk_size(),
+    )
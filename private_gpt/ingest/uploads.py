@@ -0,0 +1,270 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import BinaryIO, Optional
+from azure.storage.blob import BlobBlock
+from private_gpt.ingest.storage_clients import gcs_chunk_size, get_azure_client, get_gcs_client, get_s3_client, max_concurrency, multipart_chunk_size
+import base64
+import os
+
+# Constants
+LOCAL_STORAGE_PATH = "LOCAL_STORAGE_PATH"
+
+
+class MultipartTarget(ABC):
+    """
+    The destination of a streamed upload, written in numbered parts.
+
+    upload_part may be called from several threads at once unless sequential is set, in which
+    case the parts are uploaded one at a time in order. Files smaller than one part are written
+    with a single put call instead.
+
+    Attributes:
+        sequential (bool): Whether the parts must be uploaded in order.
+    """
+    sequential = False
+
+    @abstractmethod
+    def put(self, data: bytes) -> None:
+        pass
+
+    def begin(self) -> None:
+        pass
+
+    @abstractmethod
+    def upload_part(self, part_number: int, data: bytes) -> None:
+        pass
+
+    def complete(self) -> None:
+        pass
+
+    def abort(self) -> None:
+        pass
+
+
+class S3Target(MultipartTarget):
+    """
+    An S3 multipart upload.
+    """
+
+    def __init__(self, client, bucket_name: str, object_name: str):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.upload_id = None
+        self.etags = {}
+
+    def put(self, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket_name, Key=self.object_name, Body=data)
+
+    def begin(self) -> None:
+        response = self.client.create_multipart_upload(Bucket=self.bucket_name, Key=self.object_name)
+        self.upload_id = response["UploadId"]
+
+    def upload_part(self, part_number: int, data: bytes) -> None:
+        response = self.client.upload_part(
+            Bucket=self.bucket_name, Key=self.object_name, UploadId=self.upload_id, PartNumber=part_number, Body=data
+        )
+        self.etags[part_number] = response["ETag"]
+
+    def complete(self) -> None:
+        parts = [{"PartNumber": part_number, "ETag": etag} for part_number, etag in sorted(self.etags.items())]
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=self.object_name, UploadId=self.upload_id, MultipartUpload={"Parts": parts}
+        )
+
+    def abort(self) -> None:
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.object_name, UploadId=self.upload_id)
+
+
+class GCSTarget(MultipartTarget):
+    """
+    A Google Cloud Storage resumable upload.
+
+    The resumable protocol appends the chunks of a session in order, so parts are sent one at
+    a time, each as a chunk of the session.
+    """
+    sequential = True
+
+    def __init__(self, client, bucket_name: str, object_name: str):
+        self.blob = client.bucket(bucket_name).blob(object_name, chunk_size=gcs_chunk_size())
+        self.writer = None
+
+    def put(self, data: bytes) -> None:
+        self.blob.upload_from_string(data)
+
+    def begin(self) -> None:
+        self.writer = self.blob.open("wb")
+
+    def upload_part(self, part_number: int, data: bytes) -> None:
+        self.writer.write(data)
+
+    def complete(self) -> None:
+        self.writer.close()
+
+    def abort(self) -> None:
+        # Closing the writer would commit a truncated object, cancel the resumable session instead
+        if self.writer is not None:
+            self.writer.terminate()
+            self.writer = None
+
+
+class AzureTarget(MultipartTarget):
+    """
+    An Azure block blob, staged block by block and committed at the end.
+    """
+
+    def __init__(self, client, container_name: str, blob_name: str):
+        self.blob_client = client.get_blob_client(container_name, blob_name)
+        self.block_ids = {}
+
+    def put(self, data: bytes) -> None:
+        self.blob_client.upload_blob(data, overwrite=True)
+
+    def upload_part(self, part_number: int, data: bytes) -> None:
+        # Block ids of a blob must all have the same length
+        block_id = base64.b64encode(f"{part_number:010d}".encode()).decode()
+        self.blob_client.stage_block(block_id, data)
+        self.block_ids[part_number] = block_id
+
+    def complete(self) -> None:
+        self.blob_client.commit_block_list([BlobBlock(block_id=block_id) for _, block_id in sorted(self.block_ids.items())])
+
+
+class LocalTarget(MultipartTarget):
+    """
+    A file under LOCAL_STORAGE_PATH standing in for a bucket in development and tests.
+
+    Parts are written concurrently at their offsets in a temporary file, which is renamed
+    into place on completion like a multipart upload becomes visible once completed.
+
+    Raises:
+        ValueError: If the object name points outside the bucket directory.
+    """
+
+    def __init__(self, root: str, bucket_name: str, object_name: str, part_size: int):
+        # Object names come from clients, "../" or absolute names must not escape the bucket
+        bucket = os.path.realpath(os.path.join(root, bucket_name or ""))
+        self.path = os.path.realpath(os.path.join(bucket, object_name))
+        if not self.path.startswith(bucket + os.sep):
+            raise ValueError(f"Object name {object_name!r} points outside {bucket}")
+        self.part_size = part_size
+        self.fd = None
+
+    def put(self, data: bytes) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    def begin(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.fd = os.open(self.path + ".part", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+    def upload_part(self, part_number: int, data: bytes) -> None:
+        os.pwrite(self.fd, data, (part_number - 1) * self.part_size)
+
+    def complete(self) -> None:
+        os.close(self.fd)
+        os.replace(self.path + ".part", self.path)
+
+    def abort(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            os.remove(self.path + ".part")
+
+
+def read_part(stream: BinaryIO, part_size: int) -> bytes:
+    # A read may return less than asked before the end of the stream
+    data = stream.read(part_size)
+    if not data or len(data) == part_size:
+        return data
+    parts = [data]
+    size = len(data)
+    while size < part_size:
+        data = stream.read(part_size - size)
+        if not data:
+            break
+        parts.append(data)
+        size += len(data)
+    return b"".join(parts)
+
+
+def stream_upload(stream: BinaryIO, target: MultipartTarget, part_size: int, concurrency: int) -> int:
+    """
+    Copy a stream into a target in fixed-size parts, uploading up to concurrency parts at once.
+
+    The stream is read one part ahead of the uploads, so at most concurrency + 1 parts are held
+    in memory whatever the size of the file. A failed upload is aborted.
+
+    Args:
+        stream (BinaryIO): The file to upload, read from its current position.
+        target (MultipartTarget): The destination.
+        part_size (int): The size of every part but the last, in bytes.
+        concurrency (int): The maximum number of parts uploaded at once.
+
+    Returns:
+        int: The number of bytes uploaded.
+    """
+    data = read_part(stream, part_size)
+    if len(data) < part_size:
+        target.put(data)
+        return len(data)
+
+    concurrency = 1 if target.sequential else max(concurrency, 1)
+    target.begin()
+    size = 0
+    part_number = 0
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = set()
+            while data:
+                part_number += 1
+                size += len(data)
+                # A single worker runs the parts of a sequential target in order
+                pending.add(executor.submit(target.upload_part, part_number, data))
+                data = None
+                while len(pending) >= concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                data = read_part(stream, part_size)
+            for future in pending:
+                future.result()
+        target.complete()
+    except BaseException:
+        target.abort()
+        raise
+    return size
+
+
+def get_target(cloud_type: str, object_name: str, part_size: int) -> MultipartTarget:
+    """
+    Return the upload target of an object in the bucket of a cloud type ("aws", "gcp", "azure" or "local").
+
+    Raises:
+        ValueError: If the cloud type is not supported.
+    """
+    if cloud_type == "aws":
+        return S3Target(get_s3_client(), os.environ.get('AWS_BUCKET_NAME'), object_name)
+    if cloud_type == "gcp":
+        return GCSTarget(get_gcs_client(), os.environ.get('GCP_BUCKET_NAME'), object_name)
+    if cloud_type == "azure":
+        return AzureTarget(get_azure_client(), os.environ.get('AZURE_CONTAINER_NAME'), object_name)
+    if cloud_type == "local":
+        return LocalTarget(os.getenv(LOCAL_STORAGE_PATH, "local_storage"), os.environ.get('LOCAL_BUCKET_NAME'), object_name, part_size)
+    raise ValueError(f"Unsupported cloud type: {cloud_type}")
+
+
+def stream_to_cloud(file_name: str, file: BinaryIO, cloud_type: str, part_size: Optional[int] = None, concurrency: Optional[int] = None) -> int:
+    """
+    Stream a file into the bucket of a cloud type under file_name, without buffering it whole.
+
+    Part size and concurrency default to STORAGE_MULTIPART_CHUNK_SIZE and STORAGE_MAX_CONCURRENCY,
+    see private_gpt.ingest.storage_clients.
+
+    Returns:
+        int: The number of bytes uploaded.
+    """
+    part_size = part_size or multipart_chunk_size()
+    target = get_target(cloud_type, file_name, part_size)
+    return stream_upload(file, target, part_size, concurrency or max_concurrency())
@@ -0,0 +1,13 @@
+from typing import Any
+from fastapi.responses import Response
+import orjson
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """
+    Serialize plain dicts and lists with orjson into a JSON response.
+
+    Returning a Response skips FastAPI's response_model validation and encoding, which is only
+    wasted work for payloads the services already build in the wire format.
+    """
+    return Response(content=orjson.dumps(content), status_code=status_code, media_type="application/json")
@@ -0,0 +1,145 @@
+from functools import lru_cache
+from hashlib import sha256
+from typing import List, Optional
+import re
+
+# Without tiktoken, English text averages about four characters per token
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: Optional[str] = None):
+    """
+    Return the tiktoken encoding of a model, or None when tiktoken is not installed.
+
+    Unknown models use cl100k_base, the encoding of the gpt-3.5 and gpt-4 families.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Count the tokens of a text with tiktoken, or estimate them from its length without it.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _pieces(text: str, max_tokens: int, model: Optional[str]) -> List[str]:
+    # Split on paragraphs, then sentences, then words, so each piece fits in max_tokens
+    for separator in (r"\n\s*\n", r"(?<=[.!?])\s+", r"\s+"):
+        parts = [part for part in re.split(separator, text) if part.strip()]
+        if len(parts) > 1:
+            pieces = []
+            for part in parts:
+                pieces.extend([part] if count_tokens(part, model) <= max_tokens else _pieces(part, max_tokens, model))
+            return pieces
+
+    # A single word longer than the budget, cut it by characters
+    encoding = get_encoding(model)
+    if encoding is None:
+        step = max_tokens * CHARS_PER_TOKEN
+        return [text[i:i + step] for i in range(0, len(text), step)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def split_by_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> List[str]:
+    """
+    Split a text into chunks of at most max_tokens tokens.
+
+    Chunks end on paragraph boundaries where possible, then on sentence and word boundaries,
+    and consecutive small paragraphs are packed together.
+
+    Args:
+        text (str): The text to split.
+        max_tokens (int): The maximum number of tokens per chunk.
+        model (Optional[str]): The model whose tokenizer counts the tokens.
+
+    Returns:
+        List[str]: The chunks, in document order.
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return [text]
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in _pieces(text, max_tokens, model):
+        piece_tokens = count_tokens(piece, model)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def content_defined_groups(items: List[str], max_tokens: int, model: Optional[str] = None,
+                           min_tokens: Optional[int] = None, min_items: int = 1) -> List[List[str]]:
+    """
+    Group consecutive items under a token budget with boundaries chosen by the items' content.
+
+    A group is closed after an item once it holds min_tokens, with a probability that grows
+    from 0 at min_tokens to 1 at max_tokens and is decided by the hash of that item, or when
+    the next item would not fit. A boundary only depends on the items since the previous one,
+    so editing an item moves the boundaries around it and the following groups fall back on
+    the same boundaries as before, unlike greedy packing where every later group shifts.
+
+    Args:
+        items (List[str]): The items, in order.
+        max_tokens (int): The maximum number of tokens per group, a single larger item is a group of its own.
+        model (Optional[str]): The model whose tokenizer counts the tokens.
+        min_tokens (Optional[int]): The size from which a group may end, half of max_tokens by default.
+        min_items (int): The minimum number of items per group, but for the last one.
+
+    Returns:
+        List[List[str]]: The groups, in order.
+    """
+    min_tokens = max_tokens // 2 if min_tokens is None else min_tokens
+    groups = []
+    current = []
+    current_tokens = 0
+    sizes = [count_tokens(item, model) for item in items]
+    for i, (item, size) in enumerate(zip(items, sizes)):
+        if len(current) >= min_items and current_tokens + size > max_tokens:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += size
+        if len(current) < min_items or current_tokens < min_tokens or i == len(items) - 1:
+            continue
+        fill = (current_tokens - min_tokens) / max(max_tokens - min_tokens, 1)
+        if int.from_bytes(sha256(item.encode()).digest()[:8], "big") / 2 ** 64 < fill:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+    if current:
+        groups.append(current)
+    return groups
+
+
+def split_by_content(text: str, max_tokens: int, model: Optional[str] = None, min_tokens: Optional[int] = None) -> List[str]:
+    """
+    Split a text into chunks of at most max_tokens tokens, cutting after paragraphs chosen by
+    their content (see content_defined_groups), so an edit only changes the chunks around it.
+
+    Returns:
+        List[str]: The chunks, in document order.
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return [text]
+    return ["\n\n".join(group) for group in content_defined_groups(_pieces(text, max_tokens, model), max_tokens, model, min_tokens)]
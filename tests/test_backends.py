@@ -0,0 +1,115 @@
+from private_gpt.chunks import backends
+from private_gpt.chunks.backends import BackendSelector, CircuitBreaker
+import asyncio
+import pytest
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def failing(error="down"):
+    async def call():
+        raise RuntimeError(error)
+    return call
+
+
+def answering(value, delay=0.0):
+    async def call():
+        await asyncio.sleep(delay)
+        return value
+    return call
+
+
+def test_breaker_opens_and_lets_one_trial_through(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(backends.time, "monotonic", clock)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.available()
+
+    clock.now += 30
+    assert breaker.available()
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_available_does_not_take_the_trial(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(backends.time, "monotonic", clock)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+
+    assert breaker.available()
+    assert breaker.state == "open"
+    assert breaker.allow()
+
+
+def test_selector_falls_back_and_skips_an_open_breaker():
+    selector = BackendSelector(["qdrant", "pg_vector"], failure_threshold=2, reset_timeout=30)
+    calls = {"qdrant": failing(), "pg_vector": answering("pg")}
+
+    assert asyncio.run(selector.call(calls)) == ("pg", "pg_vector")
+    assert asyncio.run(selector.call(calls)) == ("pg", "pg_vector")
+    assert selector.breakers["qdrant"].state == "open"
+
+    calls["qdrant"] = answering("qdrant")
+    assert asyncio.run(selector.call(calls)) == ("pg", "pg_vector")
+    assert selector.served == {"qdrant": 0, "pg_vector": 3}
+
+
+def test_selector_tries_every_backend_when_all_breakers_are_open():
+    selector = BackendSelector(["qdrant", "pg_vector"], failure_threshold=1, reset_timeout=30)
+    with pytest.raises(RuntimeError, match="pg down"):
+        asyncio.run(selector.call({"qdrant": failing("qdrant down"), "pg_vector": failing("pg down")}))
+
+    assert asyncio.run(selector.call({"qdrant": answering("qdrant"), "pg_vector": failing()})) == ("qdrant", "qdrant")
+
+
+def test_hedged_call_takes_the_first_answer_and_records_the_loser():
+    selector = BackendSelector(["qdrant", "pg_vector"], hedging=True, hedge_delay=0.01)
+
+    async def run():
+        result = await selector.call({"qdrant": answering("qdrant", delay=1.0), "pg_vector": answering("pg", delay=0.01)})
+        # Let the cancelled primary record its censored latency
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == ("pg", "pg_vector")
+    qdrant = selector.latency["qdrant"]
+    assert qdrant.cancelled == 1
+    assert qdrant.failures == 0
+    assert 0.01 <= qdrant.samples[0] < 1.0
+    assert selector.breakers["qdrant"].state == "closed"
+
+
+def test_hedge_delay_follows_the_p95_latency():
+    selector = BackendSelector(["qdrant"], hedge_delay=0.5, hedge_min_delay=0.05, min_samples=20)
+    tracker = selector.latency["qdrant"]
+    for latency in [0.1] * 19:
+        tracker.record(latency, ok=True)
+    assert selector.delay_for("qdrant") == 0.5
+
+    tracker.record(0.1, ok=True)
+    assert selector.delay_for("qdrant") == pytest.approx(0.1)
+
+    for _ in range(20):
+        tracker.record_censored(0.3)
+    assert selector.delay_for("qdrant") == pytest.approx(0.3)
@@ -0,0 +1,59 @@
+from private_gpt.blocks.batch import run_batch
+import asyncio
+
+
+async def collect(items, handler, concurrency):
+    return [line async for line in run_batch(items, handler, concurrency)]
+
+
+def test_run_batch_reports_every_item_by_index():
+    async def handler(item):
+        # Later items finish first
+        await asyncio.sleep(0.01 * (5 - item))
+        return item * 10
+
+    lines = asyncio.run(collect(list(range(5)), handler, concurrency=5))
+
+    assert [line["index"] for line in lines] == [4, 3, 2, 1, 0]
+    assert sorted((line["index"], line["result"]) for line in lines) == [(i, i * 10) for i in range(5)]
+    assert all(line["error"] is None for line in lines)
+
+
+def test_run_batch_keeps_going_after_an_error():
+    async def handler(item):
+        if item == 1:
+            raise ValueError("bad item")
+        return item
+
+    lines = asyncio.run(collect([0, 1, 2], handler, concurrency=1))
+
+    assert lines == [
+        {"index": 0, "result": 0, "error": None},
+        {"index": 1, "result": None, "error": "bad item"},
+        {"index": 2, "result": 2, "error": None},
+    ]
+
+
+def test_run_batch_bounds_concurrency():
+    in_flight = 0
+    peak = 0
+
+    async def handler(item):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return item
+
+    lines = asyncio.run(collect(list(range(20)), handler, concurrency=3))
+
+    assert len(lines) == 20
+    assert peak == 3
+
+
+def test_run_batch_without_items():
+    async def handler(item):
+        return item
+
+    assert asyncio.run(collect([], handler, concurrency=4)) == []
@@ -0,0 +1,85 @@
+from private_gpt import cache
+from private_gpt.cache import LRUCache, SqliteCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_the_least_recently_used():
+    lru = LRUCache(maxsize=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+    assert lru.evictions == 1
+
+
+def test_lru_entries_expire_after_the_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    lru = LRUCache(maxsize=10, ttl=30)
+    lru.set("a", 1)
+
+    clock.now += 29
+    assert lru.get("a") == 1
+    clock.now += 2
+    assert lru.get("a", "missing") == "missing"
+    assert len(lru) == 0
+    assert lru.stats()["evictions"] == 1
+
+
+def test_lru_setting_an_entry_restarts_its_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    lru = LRUCache(ttl=30)
+    lru.set("a", 1)
+    clock.now += 20
+    lru.set("a", 2)
+    clock.now += 20
+
+    assert lru.get("a") == 2
+
+
+def test_lru_bulk_operations():
+    lru = LRUCache()
+    lru.set_many({"a": 1, "b": 2, "c": 3})
+    lru.delete_many(["b"])
+
+    assert lru.get_many(["a", "b", "c", "d"]) == {"a": 1, "c": 3}
+
+
+def test_lru_get_or_create_builds_once():
+    lru = LRUCache()
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return "value"
+
+    assert lru.get_or_create("key", factory) == "value"
+    assert lru.get_or_create("key", factory) == "value"
+    assert len(calls) == 1
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    writer = SqliteCache(path, table="entries")
+    reader = SqliteCache(path, table="entries")
+
+    writer.set("a", {"value": 1})
+    writer.set_many({str(i): i for i in range(1200)})
+    writer.delete_many(["5"])
+
+    assert reader.get("a") == {"value": 1}
+    many = reader.get_many(str(i) for i in range(1200))
+    assert len(many) == 1199
+    assert "5" not in many
@@ -0,0 +1,98 @@
+from private_gpt.blocks.llm_client import parse_model_limits
+from private_gpt.chat.context import CHAT_CONTEXT_WINDOW, CHAT_MODEL_CONTEXT_WINDOWS, DEFAULT_CONTEXT_WINDOW, context_window, pack_context
+from private_gpt.chunks.results import ChunkResult, RetrievalResult
+from private_gpt.tokens import count_tokens
+import pytest
+
+
+def hit(doc_id, chunk_num, text, score, previous=(), following=()):
+    return ChunkResult(
+        doc_id=doc_id,
+        doc_metadata={},
+        text=text,
+        score=score,
+        chunk_num=chunk_num,
+        previous_texts=[text for _, text in previous],
+        previous_chunk_nums=[chunk_num for chunk_num, _ in previous],
+        next_texts=[text for _, text in following],
+        next_chunk_nums=[chunk_num for chunk_num, _ in following],
+    )
+
+
+def test_parse_model_limits():
+    assert parse_model_limits("gpt-4=2, gpt-3.5-turbo=16,") == {"gpt-4": 2, "gpt-3.5-turbo": 16}
+    assert parse_model_limits(None) == {}
+
+
+def test_parse_model_limits_keeps_equal_signs_in_model_names():
+    assert parse_model_limits("org/model=v2=4") == {"org/model=v2": 4}
+
+
+@pytest.mark.parametrize("value", ["gpt-4", "gpt-4=x", "=3"])
+def test_parse_model_limits_rejects_malformed_values(value):
+    with pytest.raises(ValueError, match="SOME_VARIABLE"):
+        parse_model_limits(value, "SOME_VARIABLE")
+
+
+def test_context_window_by_model(monkeypatch):
+    monkeypatch.delenv(CHAT_CONTEXT_WINDOW, raising=False)
+    monkeypatch.delenv(CHAT_MODEL_CONTEXT_WINDOWS, raising=False)
+
+    assert context_window("gpt-4") == 8192
+    assert context_window("gpt-4-0613") == 8192
+    assert context_window("gpt-4-32k-0613") == 32768
+    assert context_window("gpt-4o-mini") == 128000
+    assert context_window("gpt-3.5-turbo-0613") == 4096
+    assert context_window("some-local-model") == DEFAULT_CONTEXT_WINDOW
+
+
+def test_context_window_overrides(monkeypatch):
+    monkeypatch.delenv(CHAT_CONTEXT_WINDOW, raising=False)
+    monkeypatch.setenv(CHAT_MODEL_CONTEXT_WINDOWS, "some-local-model=32000")
+    assert context_window("some-local-model") == 32000
+    assert context_window("gpt-4") == 8192
+
+    monkeypatch.setenv(CHAT_CONTEXT_WINDOW, "2048")
+    assert context_window("some-local-model") == 2048
+
+
+def test_pack_context_merges_neighbors_and_orders_by_score():
+    result = RetrievalResult(backend="qdrant", chunks=[
+        hit("a", 1, "a1", 0.9, previous=[(0, "a0")], following=[(2, "a2")]),
+        hit("a", 2, "a2", 0.5, previous=[(1, "a1")], following=[(3, "a3")]),
+        hit("b", 0, "b0", 0.7),
+    ])
+
+    assert pack_context(result) == "a0\na1\na2\na3\n\nb0"
+
+
+def test_pack_context_sends_a_text_once():
+    result = RetrievalResult(backend="qdrant", chunks=[
+        hit("a", 0, "same text", 0.9),
+        hit("b", 0, "same text", 0.8),
+        hit("c", 0, "other text", 0.7),
+    ])
+
+    assert pack_context(result) == "same text\n\nother text"
+
+
+def test_pack_context_skips_spans_whose_hits_were_already_sent():
+    # The hit of b was sent as a neighbor of a, and its own neighbor does not fit
+    long_text = "neighbor " * 400
+    result = RetrievalResult(backend="qdrant", chunks=[
+        hit("a", 0, "shared", 0.9),
+        hit("b", 1, "shared", 0.8, previous=[(0, long_text)]),
+        hit("c", 0, "last", 0.7),
+    ])
+
+    assert pack_context(result, budget=count_tokens("shared") + count_tokens("last") + 1) == "shared\n\nlast"
+
+
+def test_pack_context_reduces_spans_to_their_hits_within_the_budget():
+    neighbor = "context " * 200
+    result = RetrievalResult(backend="qdrant", chunks=[
+        hit("a", 1, "the answer", 0.9, previous=[(0, neighbor)], following=[(2, neighbor)]),
+        hit("b", 0, "x " * 2000, 0.5),
+    ])
+
+    assert pack_context(result, budget=count_tokens("the answer") + 5) == "the answer"
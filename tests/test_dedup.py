@@ -0,0 +1,55 @@
+from langchain_core.documents import Document
+from private_gpt.chunks.dedup import NearDuplicateFilter, simhash
+
+BOILERPLATE = (
+    "This document is confidential and intended solely for the use of the individual or entity to whom it is "
+    "addressed. If you have received it in error please notify the sender immediately and delete it from your system."
+)
+
+
+def distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def test_simhash_is_stable_and_case_insensitive():
+    assert simhash(BOILERPLATE) == simhash(BOILERPLATE.upper())
+    assert 0 <= simhash(BOILERPLATE) < 2 ** 64
+
+
+def test_simhash_near_and_far_texts():
+    edited = BOILERPLATE.replace("immediately", "at once")
+    other = "Quarterly revenue grew by twelve percent, driven by the new subscription plans and lower churn in Europe."
+
+    assert distance(simhash(BOILERPLATE), simhash(edited)) <= 12
+    assert distance(simhash(BOILERPLATE), simhash(other)) > 12
+
+
+def test_filter_keeps_the_best_scoring_duplicate_at_the_first_position():
+    near_duplicate_filter = NearDuplicateFilter(max_distance=6)
+    first = Document(page_content=BOILERPLATE, metadata={"doc_id": "a", "chunk_num": 0})
+    unique = Document(page_content="Completely different content about vector search engines.", metadata={"doc_id": "b", "chunk_num": 0})
+    copy = Document(page_content=BOILERPLATE, metadata={"doc_id": "c", "chunk_num": 3})
+
+    kept = near_duplicate_filter.filter([(first, 0.5), (unique, 0.4), (copy, 0.9)])
+
+    assert kept == [(copy, 0.9), (unique, 0.4)]
+    assert near_duplicate_filter.collapsed == 1
+
+
+def test_filter_caches_signatures_per_chunk():
+    near_duplicate_filter = NearDuplicateFilter(max_distance=6)
+    document = Document(page_content=BOILERPLATE, metadata={"doc_id": "a", "chunk_num": 0})
+    other = Document(page_content="Another text entirely, about tokenizers.", metadata={"doc_id": "b", "chunk_num": 0})
+
+    near_duplicate_filter.filter([(document, 1.0), (other, 0.5)])
+    near_duplicate_filter.filter([(document, 1.0), (other, 0.5)])
+
+    assert len(near_duplicate_filter.signatures) == 2
+    assert near_duplicate_filter.signatures.hits == 2
+
+
+def test_disabled_filter_returns_the_hits_unchanged():
+    document = Document(page_content=BOILERPLATE, metadata={})
+    scored_docs = [(document, 1.0), (document, 0.5)]
+
+    assert NearDuplicateFilter(max_distance=None).filter(scored_docs) is scored_docs
@@ -0,0 +1,23 @@
+from private_gpt.chunks.encoders import BatchedEncoder, EncoderMismatch, check_encoder
+import pytest
+
+
+def test_batched_encoder_subclasses_implement_encode():
+    with pytest.raises(TypeError):
+        BatchedEncoder()
+
+
+def test_matching_or_unrecorded_models_pass():
+    check_encoder("kb", {"embedding_model": "bge", "embedding_dimension": 384}, {"embedding_model": "bge", "sparse_model": None}, 384)
+    check_encoder("kb", {}, {"embedding_model": "bge", "sparse_model": "splade"}, 384)
+    check_encoder("kb", {"embedding_model": "bge"}, {"embedding_model": None, "sparse_model": None}, None)
+
+
+@pytest.mark.parametrize("stored, dimension", [
+    ({"embedding_model": "e5-large"}, 384),
+    ({"sparse_model": "other-splade"}, 384),
+    ({"embedding_dimension": 1024}, 384),
+])
+def test_mismatches_are_refused(stored, dimension):
+    with pytest.raises(EncoderMismatch, match="kb"):
+        check_encoder("kb", stored, {"embedding_model": "bge", "sparse_model": "splade"}, dimension)
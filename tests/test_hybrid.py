@@ -0,0 +1,41 @@
+from langchain_core.documents import Document
+from private_gpt.chunks.hybrid import weighted_rrf
+import pytest
+
+
+def chunk(doc_id, chunk_num, text=None):
+    return Document(page_content=text or f"{doc_id}-{chunk_num}", metadata={"doc_id": doc_id, "chunk_num": chunk_num})
+
+
+def test_weighted_rrf_sums_reciprocal_ranks():
+    sparse = [chunk("a", 0), chunk("b", 0)]
+    dense = [chunk("b", 0), chunk("c", 0)]
+
+    fused = weighted_rrf([sparse, dense], [0.5, 0.5], k=3, c=60)
+
+    scores = {document.metadata["doc_id"]: score for document, score in fused}
+    assert [document.metadata["doc_id"] for document, _ in fused] == ["b", "a", "c"]
+    assert scores["b"] == pytest.approx(0.5 / 62 + 0.5 / 61)
+    assert scores["a"] == pytest.approx(0.5 / 61)
+    assert scores["c"] == pytest.approx(0.5 / 62)
+
+
+def test_weighted_rrf_merges_copies_of_a_chunk():
+    # The sparse and dense collections hold separate copies with the same doc_id and chunk_num
+    fused = weighted_rrf([[chunk("a", 1, "sparse copy")], [chunk("a", 1, "dense copy")]], [1.0, 1.0], k=10)
+
+    assert len(fused) == 1
+    assert fused[0][0].page_content == "sparse copy"
+
+
+def test_weighted_rrf_weights_and_limit():
+    sparse = [chunk("a", 0)]
+    dense = [chunk("b", 0)]
+
+    fused = weighted_rrf([sparse, dense], [0.2, 0.8], k=1)
+
+    assert [document.metadata["doc_id"] for document, _ in fused] == ["b"]
+
+
+def test_weighted_rrf_without_results():
+    assert weighted_rrf([[], []], [0.5, 0.5], k=5) == []
@@ -0,0 +1,185 @@
+from private_gpt.cache import SqliteCache
+from private_gpt.ingest import jobs
+from private_gpt.ingest.jobs import IngestDocument, IngestJob, IngestJobQueue, IngestQueueFull
+import io
+import pytest
+
+
+class Response:
+    def __init__(self, ok=True):
+        self.ok = ok
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise RuntimeError("embedding service unavailable")
+
+
+class FakeService:
+    def __init__(self, failures=()):
+        # The calls, in order, that fail
+        self.failures = set(failures)
+        self.calls = 0
+        self.requested = []
+        self.registered = []
+
+    def register_documents(self, documents, knowledge_base_id, db):
+        self.registered.append([document["doc_id"] for document in documents])
+        return documents
+
+    def upload_to_cloud(self, file_key, file, cloud_type):
+        file.read()
+
+    def request_embedding(self, file_key, knowledge_base_id, doc_id):
+        self.calls += 1
+        if self.calls in self.failures:
+            return Response(ok=False)
+        self.requested.append(file_key)
+        return Response()
+
+    def request_embedding_batch(self, documents, knowledge_base_id):
+        self.calls += 1
+        if self.calls in self.failures:
+            return Response(ok=False)
+        self.requested.append([document["file_key"] for document in documents])
+        return Response()
+
+
+class FakeSession:
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def job_queue(monkeypatch):
+    monkeypatch.setattr(jobs, "SessionLocal", FakeSession)
+    monkeypatch.setattr(jobs, "EMBED_BATCH_URL", None)
+
+    def build(service=None, **kwargs):
+        # No worker threads, the tests run the jobs themselves
+        job_queue = IngestJobQueue(workers=0, retry_delay=0, **kwargs)
+        job_queue.service = service or FakeService()
+        return job_queue
+    return build
+
+
+def make_job(count=3):
+    return IngestJob(knowledge_base_id="kb", documents=[IngestDocument(file_name=f"f{i}", file_key=f"f{i}") for i in range(count)])
+
+
+def test_a_failed_job_is_retried_from_the_failed_file(job_queue):
+    service = FakeService(failures={2})
+    ingest = job_queue(service)
+    job = ingest.submit(make_job())
+    ingest.queue.get_nowait()
+
+    ingest.process(job)
+    assert job.status == "retrying"
+    assert "register" in job.stages and "embed_request" not in job.stages
+    # The embedding of the first file was requested, its stage keeps running
+    assert "finished_at" not in job.stages["embedding"]
+
+    retried = ingest.queue.get(timeout=2)
+    ingest.process(retried)
+
+    assert retried.status == "succeeded"
+    assert retried.attempts == 2
+    assert service.requested == ["f0", "f1", "f2"]
+    assert len(service.registered) == 1
+    assert ingest.get(job.id)["status"] == "succeeded"
+
+
+def test_a_job_fails_after_its_last_attempt(job_queue):
+    ingest = job_queue(FakeService(failures={1, 2}), max_attempts=2)
+    job = ingest.submit(make_job(1))
+    ingest.queue.get_nowait()
+
+    ingest.process(job)
+    ingest.process(ingest.queue.get(timeout=2))
+
+    assert job.status == "failed"
+    assert ingest.get(job.id)["error"] == "embedding service unavailable"
+    assert ingest.stats()["failed"] == 1
+
+
+def test_batches_are_resumed_after_the_last_accepted_one(job_queue, monkeypatch):
+    monkeypatch.setattr(jobs, "EMBED_BATCH_URL", "http://embedder/batch")
+    monkeypatch.setattr(jobs, "INGEST_EMBED_BATCH_SIZE", 2)
+    service = FakeService(failures={2})
+    ingest = job_queue(service)
+    job = ingest.submit(make_job(5))
+    ingest.queue.get_nowait()
+
+    ingest.process(job)
+    ingest.process(ingest.queue.get(timeout=2))
+
+    assert job.status == "succeeded"
+    assert service.requested == [["f0", "f1"], ["f2", "f3"], ["f4"]]
+
+
+def test_a_full_queue_rejects_the_job_and_forgets_it(job_queue):
+    ingest = job_queue(queue_size=1)
+    ingest.submit(make_job())
+    job = make_job()
+
+    with pytest.raises(IngestQueueFull):
+        ingest.submit(job)
+
+    assert ingest.get(job.id) is None
+    assert ingest.documents.get(job.documents[0].doc_id) is None
+    assert ingest.stats()["rejected"] == 1
+
+
+def test_a_retry_that_finds_the_queue_full_fails_the_job(job_queue):
+    ingest = job_queue(queue_size=1)
+    ingest.submit(make_job())
+    job = make_job()
+    job.error = "embedding service unavailable"
+
+    ingest._requeue(job)
+
+    assert job.status == "failed"
+    assert "queue is full" in ingest.get(job.id)["error"]
+
+
+def test_embedding_callbacks_close_the_embedding_stage(job_queue, tmp_path):
+    ingest = job_queue(documents=SqliteCache(str(tmp_path / "jobs.db"), table="ingest_job_documents"))
+    job = ingest.submit(make_job(2))
+    ingest.queue.get_nowait()
+    ingest.process(job)
+
+    ingest.mark_embedded(job.documents[0].doc_id, "embedded")
+    ingest.mark_embedded(job.documents[0].doc_id, "embedded")
+    report = ingest.get(job.id)
+    assert report["embedded"] == 1
+    assert report["stages"]["embedding"]["finished_at"] is None
+
+    ingest.mark_embedded(job.documents[1].doc_id, "failed")
+    report = ingest.get(job.id)
+    assert report["embedded"] == 2
+    assert report["embedding_statuses"] == {"embedded": 1, "failed": 1}
+    assert report["stages"]["embedding"]["finished_at"] is not None
+    # The stored report is not changed by get
+    assert "embedded" not in ingest.store.get(job.id)
+
+
+def test_a_job_without_documents_has_a_report(job_queue):
+    ingest = job_queue()
+    job = ingest.submit(IngestJob(knowledge_base_id="kb"))
+
+    assert ingest.get(job.id)["embedded"] == 0
+
+
+def test_duplicate_uploads_are_dropped(job_queue, monkeypatch, tmp_path):
+    monkeypatch.setenv(jobs.INGEST_SPOOL_DIR, str(tmp_path))
+    ingest = job_queue()
+    job = IngestJob(knowledge_base_id="kb")
+    existing = ingest.persist(job, "old.txt", io.BytesIO(b"already ingested"))
+    first = ingest.persist(job, "a.txt", io.BytesIO(b"new content"))
+    second = ingest.persist(job, "b.txt", io.BytesIO(b"new content"))
+    monkeypatch.setattr(jobs, "find_documents_by_hash", lambda db, knowledge_base_id, hashes: {existing.content_hash: "stored-doc"})
+
+    duplicates = ingest.deduplicate(job)
+
+    assert duplicates == {existing.doc_id: "stored-doc", second.doc_id: first.doc_id}
+    assert job.documents == [first]
+    assert not (tmp_path / job.id / second.doc_id).exists()
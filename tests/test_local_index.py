@@ -0,0 +1,68 @@
+from private_gpt.chunks.encoders import EncoderMismatch
+from private_gpt.chunks.local_index import LocalVectorIndex
+import pytest
+
+MODELS = {"embedding_model": "dense-model", "sparse_model": "sparse-model"}
+
+
+def fill(index, doc_id, vectors, start=0, models=MODELS):
+    return index.add(
+        [f"{doc_id} chunk {start + i}" for i in range(len(vectors))],
+        [{"doc_id": doc_id, "chunk_num": start + i} for i in range(len(vectors))],
+        vectors,
+        [([start + i], [1.0]) for i in range(len(vectors))],
+        models,
+    )
+
+
+def test_dense_and_sparse_search(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    fill(index, "a", [[1, 0, 0], [0, 1, 0]])
+    fill(index, "b", [[0, 0, 1]], start=2)
+
+    hits = index.dense_search([0.9, 0.1, 0], k=2)
+    assert [payload["page_content"] for payload, _ in hits] == ["a chunk 0", "a chunk 1"]
+    assert hits[0][1] > hits[1][1]
+
+    assert [payload["page_content"] for payload, _ in index.dense_search([1, 0, 0], k=5, doc_ids=["b"])] == ["b chunk 2"]
+    assert [payload["page_content"] for payload, _ in index.sparse_search([2, 99], [1.0, 1.0], k=5)] == ["b chunk 2"]
+
+
+def test_neighbors(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    fill(index, "a", [[1, 0]] * 5)
+
+    assert [payload["metadata"]["chunk_num"] for payload in index.neighbors([("a", 1, 3)])] == [1, 2, 3]
+
+
+def test_add_skips_indexed_chunks_and_empty_batches(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+
+    assert index.add([], [], [], None) == 0
+    assert fill(index, "a", [[1, 0], [0, 1]]) == 2
+    assert fill(index, "a", [[1, 0], [0, 1], [1, 1]]) == 1
+    assert index.count == 3
+
+
+def test_another_instance_sees_the_changes(tmp_path):
+    reader = LocalVectorIndex(str(tmp_path))
+    writer = LocalVectorIndex(str(tmp_path))
+    snapshot = reader.snapshot
+
+    fill(writer, "a", [[1, 0]])
+
+    assert snapshot.count == 0
+    assert len(reader.dense_search([1, 0], k=5)) == 1
+    assert reader.snapshot.models == MODELS
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_vectors_of_other_models_are_refused(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    fill(index, "a", [[1, 0]])
+
+    with pytest.raises(EncoderMismatch):
+        fill(index, "b", [[1, 0]], models={"embedding_model": "another-model"})
+    with pytest.raises(EncoderMismatch):
+        fill(index, "b", [[1, 0, 0]])
+    assert index.count == 1
@@ -0,0 +1,26 @@
+from private_gpt.chunks.result_cache import ResultCache
+
+REQUEST = {"text": "what is the refund policy", "knowledge_base_id": "kb", "context_filter": {"doc_ids": ["b", "a"]}}
+
+
+def test_identical_requests_share_a_key():
+    result_cache = ResultCache()
+    reordered = {**REQUEST, "context_filter": {"doc_ids": ["a", "b"]}}
+
+    result_cache.set(result_cache.key(REQUEST), "result")
+
+    assert result_cache.get(result_cache.key(reordered)) == "result"
+    assert result_cache.key({**REQUEST, "retriever_type": "dense"}) != result_cache.key(REQUEST)
+
+
+def test_a_generation_bump_invalidates_only_its_knowledge_base():
+    result_cache = ResultCache()
+    other = {**REQUEST, "knowledge_base_id": "other"}
+    result_cache.set(result_cache.key(REQUEST), "result")
+    result_cache.set(result_cache.key(other), "other result")
+
+    result_cache.bump("kb")
+
+    assert result_cache.get(result_cache.key(REQUEST)) is None
+    assert result_cache.get(result_cache.key(other)) == "other result"
+    assert result_cache.stats()["invalidations"] == 1
@@ -0,0 +1,55 @@
+from private_gpt.tokens import content_defined_groups, count_tokens, split_by_content, split_by_tokens
+
+
+def paragraphs(count: int, words: int = 30):
+    return [" ".join(f"word{i}x{j}" for j in range(words)) + "." for i in range(count)]
+
+
+def test_short_text_is_one_chunk():
+    assert split_by_tokens("A short text.", 100) == ["A short text."]
+
+
+def test_split_by_tokens_respects_the_budget_and_keeps_the_text():
+    text = "\n\n".join(paragraphs(40))
+
+    chunks = split_by_tokens(text, 200)
+
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 200 for chunk in chunks)
+    assert "\n\n".join(chunks).split() == text.split()
+
+
+def test_split_by_tokens_cuts_a_long_word():
+    chunks = split_by_tokens("x" * 5000, 50)
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == "x" * 5000
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+
+
+def test_content_defined_groups_respect_the_budget():
+    items = paragraphs(60)
+
+    groups = content_defined_groups(items, 400)
+
+    assert [item for group in groups for item in group] == items
+    assert all(sum(count_tokens(item) for item in group) <= 400 for group in groups)
+
+
+def test_content_defined_groups_min_items():
+    items = paragraphs(9, words=200)
+
+    groups = content_defined_groups(items, 10, min_items=2)
+
+    assert all(len(group) >= 2 for group in groups[:-1])
+
+
+def test_an_edit_only_changes_the_chunks_around_it():
+    original = paragraphs(80)
+    edited = original[:40] + ["An inserted paragraph about something else entirely."] + original[40:]
+
+    before = split_by_content("\n\n".join(original), 400)
+    after = split_by_content("\n\n".join(edited), 400)
+
+    # Greedy packing would shift every chunk after the insertion
+    assert len(set(after) - set(before)) <= 2
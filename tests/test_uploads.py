@@ -0,0 +1,111 @@
+from private_gpt.ingest.uploads import LocalTarget, MultipartTarget, read_part, stream_upload
+import io
+import os
+import pytest
+import threading
+
+
+class RecordingTarget(MultipartTarget):
+    def __init__(self, fail_on=None):
+        self.parts = {}
+        self.put_data = None
+        self.events = []
+        self.fail_on = fail_on
+        self._lock = threading.Lock()
+
+    def put(self, data):
+        self.put_data = data
+
+    def begin(self):
+        self.events.append("begin")
+
+    def upload_part(self, part_number, data):
+        if part_number == self.fail_on:
+            raise IOError(f"part {part_number} failed")
+        with self._lock:
+            self.parts[part_number] = data
+
+    def complete(self):
+        self.events.append("complete")
+
+    def abort(self):
+        self.events.append("abort")
+
+
+class TrickleStream(io.BytesIO):
+    # Returns at most 7 bytes per read, like a socket
+    def read(self, size=-1):
+        return super().read(min(size, 7) if size and size > 0 else 7)
+
+
+def test_small_files_are_put_in_one_call():
+    target = RecordingTarget()
+
+    assert stream_upload(io.BytesIO(b"small"), target, part_size=10, concurrency=4) == 5
+    assert target.put_data == b"small"
+    assert target.events == []
+
+
+def test_parts_have_the_part_size_but_the_last():
+    data = os.urandom(95)
+    target = RecordingTarget()
+
+    assert stream_upload(io.BytesIO(data), target, part_size=10, concurrency=3) == 95
+
+    assert sorted(target.parts) == list(range(1, 11))
+    assert all(len(target.parts[number]) == 10 for number in range(1, 10))
+    assert len(target.parts[10]) == 5
+    assert b"".join(target.parts[number] for number in range(1, 11)) == data
+    assert target.events == ["begin", "complete"]
+
+
+def test_short_reads_are_filled_up_to_the_part_size():
+    data = os.urandom(64)
+
+    assert read_part(TrickleStream(data), 30) == data[:30]
+
+    target = RecordingTarget()
+    stream_upload(TrickleStream(data), target, part_size=30, concurrency=2)
+    assert [len(target.parts[number]) for number in sorted(target.parts)] == [30, 30, 4]
+
+
+def test_a_failed_part_aborts_the_upload():
+    target = RecordingTarget(fail_on=3)
+
+    with pytest.raises(IOError, match="part 3 failed"):
+        stream_upload(io.BytesIO(os.urandom(100)), target, part_size=10, concurrency=2)
+    assert target.events == ["begin", "abort"]
+
+
+def test_targets_must_implement_put_and_upload_part():
+    class Incomplete(MultipartTarget):
+        def put(self, data):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_local_target_writes_the_file(tmp_path):
+    data = os.urandom(1000)
+    target = LocalTarget(str(tmp_path), "bucket", "dir/file.bin", part_size=64)
+
+    stream_upload(io.BytesIO(data), target, part_size=64, concurrency=4)
+
+    assert (tmp_path / "bucket" / "dir" / "file.bin").read_bytes() == data
+    assert not (tmp_path / "bucket" / "dir" / "file.bin.part").exists()
+
+
+def test_local_target_aborts_without_leaving_a_partial_file(tmp_path):
+    target = LocalTarget(str(tmp_path), "bucket", "file.bin", part_size=10)
+    target.begin()
+    target.upload_part(1, b"0123456789")
+    target.abort()
+
+    assert list((tmp_path / "bucket").iterdir()) == []
+
+
+@pytest.mark.parametrize("object_name", ["../escape.bin", "a/../../escape.bin", "/etc/passwd", "."])
+def test_local_target_rejects_names_outside_the_bucket(tmp_path, object_name):
+    with pytest.raises(ValueError):
+        LocalTarget(str(tmp_path), "bucket", object_name, part_size=10)